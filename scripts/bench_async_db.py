@@ -0,0 +1,108 @@
+"""Throughput of the sync vs async database paths under many concurrent clients.
+
+Mounts two routes doing the same work as /interact's lookups (guest user by
+username, movie by tmdb_id):
+
+* ``def`` on ``SessionLocal``, run in AnyIO's threadpool like the sync endpoints;
+* ``async def`` on ``AsyncSessionLocal``, like the ported hot endpoints.
+
+Each route is driven in-process (httpx ASGITransport) by N concurrent clients.
+``--latency-ms`` adds a simulated network round trip to every query, so a
+local SQLite file behaves like a remote Postgres. The sync path blocks its
+thread for it; the async path awaits it. Leave it at 0 when DATABASE_URL
+already points at Neon.
+
+    python -m scripts.bench_async_db --clients 500 --requests 5000 --latency-ms 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+sys.path.append(os.getcwd())
+from src.core import models
+from src.core.database import SessionLocal, async_engine, engine, get_async_db, get_db
+
+
+def build_app(latency: float) -> FastAPI:
+    app = FastAPI()
+    user_q = select(models.User).where(models.User.username == "bench-guest").limit(1)
+
+    def movie_q(tmdb_id):
+        return select(models.Movie).where(models.Movie.tmdb_id == tmdb_id).limit(1)
+
+    @app.get("/sync/{tmdb_id}")
+    def sync_lookup(tmdb_id: int, db: Session = Depends(get_db)):
+        time.sleep(latency)
+        db.scalars(user_q).first()
+        time.sleep(latency)
+        movie = db.scalars(movie_q(tmdb_id)).first()
+        return {"title": movie.title if movie else None}
+
+    @app.get("/async/{tmdb_id}")
+    async def async_lookup(tmdb_id: int, db: AsyncSession = Depends(get_async_db)):
+        await asyncio.sleep(latency)
+        (await db.scalars(user_q)).first()
+        await asyncio.sleep(latency)
+        movie = (await db.scalars(movie_q(tmdb_id))).first()
+        return {"title": movie.title if movie else None}
+
+    return app
+
+
+async def drive(app: FastAPI, prefix: str, ids: list, clients: int, total: int) -> dict:
+    latencies, errors = [], 0
+    jobs = iter(range(total))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def worker():
+            nonlocal errors
+            for i in jobs:
+                start = time.perf_counter()
+                try:
+                    (await client.get(f"/{prefix}/{ids[i % len(ids)]}")).raise_for_status()
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"rps": total / elapsed, "p50": latencies[len(latencies) // 2] * 1000,
+            "p99": latencies[int(len(latencies) * 0.99)] * 1000, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="simulated DB round trip per query (for local SQLite)")
+    args = parser.parse_args()
+    if async_engine is None:
+        sys.exit("Async path unavailable: install asyncpg (Postgres) or aiosqlite (SQLite).")
+
+    with SessionLocal() as db:
+        ids = [i for (i,) in db.query(models.Movie.tmdb_id).filter(models.Movie.tmdb_id.isnot(None)).limit(1000)]
+    if not ids:
+        sys.exit("No movies in the database to look up.")
+
+    app = build_app(args.latency_ms / 1000)
+    print(f"{engine.url.get_backend_name()} | {args.clients} clients | {args.requests} requests | "
+          f"+{args.latency_ms:g} ms/query | sync pool {engine.pool.status()}")
+    for prefix in ("sync", "async"):
+        r = asyncio.run(drive(app, prefix, ids, args.clients, args.requests))
+        print(f"{prefix:>5}: {r['rps']:8.1f} req/s   p50 {r['p50']:8.1f} ms   p99 {r['p99']:8.1f} ms"
+              f"   errors {r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Persistent CAM/TS availability index for /movies/availability.
+
+A recent movie is "good-quality available" once it has a Digital (type 4) or
+Physical (type 5) release whose date has passed; until then a circulating rip
+is almost certainly a cam/telesync. That status lives in the
+``movie_availability`` table: has_digital, the earliest digital date (even a
+future one), and when TMDB was last asked.
+
+* The endpoint does one indexed ``IN`` query. A row whose known digital date
+  has since passed flips to available without asking TMDB; only ids never seen
+  are fetched (concurrently, under the TMDB client's rate limit) and written
+  back with one upsert.
+* ``refresh_recent`` (a background thread in main.py) seeds rows for recent
+  catalog releases and rechecks titles still waiting on a digital release.
+  Older and already-available titles are never re-fetched.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from src.core import models
+from src.core.database import dialect_insert
+from src.core.tmdb import TMDBClient
+
+log = logging.getLogger("nautilus.availability")
+
+# How long a "no digital release yet" answer stands before it's rechecked.
+RECHECK_AFTER = timedelta(hours=int(os.getenv("AVAILABILITY_RECHECK_HOURS", "24")))
+# Catalog movies released within this window get seeded by the job.
+RECENT_DAYS = int(os.getenv("AVAILABILITY_RECENT_DAYS", "240"))
+
+
+def digital_release(data: dict) -> Optional[datetime]:
+    """Earliest digital/physical release date (naive UTC) in a release_dates payload."""
+    first = None
+    for country in data.get("results", []):
+        for rel in country.get("release_dates", []):
+            if rel.get("type") not in (4, 5):       # 4=Digital, 5=Physical
+                continue
+            try:
+                when = datetime.fromisoformat((rel.get("release_date") or "").replace("Z", "+00:00"))
+            except ValueError:
+                continue
+            if when.tzinfo is not None:
+                when = when.astimezone(timezone.utc).replace(tzinfo=None)
+            if first is None or when < first:
+                first = when
+    return first
+
+
+def available(row: models.MovieAvailability, now: datetime) -> bool:
+    return bool(row.has_digital or (row.digital_date is not None and row.digital_date <= now))
+
+
+def _row(tmdb_id: int, data: dict, now: datetime) -> models.MovieAvailability:
+    first = digital_release(data)
+    return models.MovieAvailability(tmdb_id=tmdb_id, has_digital=first is not None and first <= now,
+                                    digital_date=first, checked_at=now)
+
+
+def _save(db: Session, rows: Iterable[models.MovieAvailability]) -> None:
+    """Upsert ``rows`` in one statement."""
+    values = [{"tmdb_id": r.tmdb_id, "has_digital": r.has_digital,
+               "digital_date": r.digital_date, "checked_at": r.checked_at} for r in rows]
+    if not values:
+        return
+    T = models.MovieAvailability.__table__
+    stmt = dialect_insert(db.bind, T).values(values)
+    try:
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[T.c.tmdb_id],
+            set_={c: stmt.excluded[c] for c in ("has_digital", "digital_date", "checked_at")}))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        log.warning(f"[availability] save failed: {e}")
+
+
+def cam_ids(db: Session, client: TMDBClient, ids: list[int]) -> list[int]:
+    """Ids among ``ids`` with no digital/physical release yet. Ids whose status
+    can't be determined are NOT flagged."""
+    now = datetime.utcnow()
+    known = {r.tmdb_id: r for r in
+             db.query(models.MovieAvailability).filter(models.MovieAvailability.tmdb_id.in_(ids)).all()}
+    misses = [m for m in ids if m not in known]
+    if misses and client:
+        fetched = client.get_many_sync((f"/movie/{m}/release_dates", None) for m in misses)
+        fresh = [_row(m, data, now) for m, data in zip(misses, fetched) if isinstance(data, dict)]
+        _save(db, fresh)
+        known.update((r.tmdb_id, r) for r in fresh)
+    return [m for m in ids if m in known and not available(known[m], now)]
+
+
+def refresh_recent(db: Session, client: TMDBClient, batch_size: int = 100) -> int:
+    """Seed recent catalog releases and recheck titles still without a digital
+    release. Returns the number of rows written."""
+    now = datetime.utcnow()
+    cutoff = (now - timedelta(days=RECENT_DAYS)).date().isoformat()
+    A = models.MovieAvailability
+    # A known digital date that has passed needs no TMDB call.
+    try:
+        db.query(A).filter(A.has_digital.is_(False), A.digital_date <= now).update(
+            {A.has_digital: True}, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+    due = [r[0] for r in db.query(A.tmdb_id).filter(
+        A.has_digital.is_(False), A.checked_at < now - RECHECK_AFTER).all()]
+    unseen = [r[0] for r in db.query(models.Movie.tmdb_id)
+              .outerjoin(A, A.tmdb_id == models.Movie.tmdb_id)
+              .filter(A.tmdb_id.is_(None), models.Movie.release_date >= cutoff,
+                      models.Movie.tmdb_id.isnot(None)).all()]
+    todo = due + unseen
+    written = 0
+    for i in range(0, len(todo), batch_size):
+        batch = todo[i:i + batch_size]
+        results = client.get_many_sync((f"/movie/{m}/release_dates", None) for m in batch)
+        rows = [_row(m, data, now) for m, data in zip(batch, results) if data is not None]
+        _save(db, rows)
+        written += len(rows)
+    return written
@@ -0,0 +1,174 @@
+"""Segment failover for the HLS proxy.
+
+A segment that comes back 403/5xx (or times out) used to surface as a 502 and
+the player stalled. The proxy already sees the alternatives it needs: the other
+renditions listed in a master playlist it rewrote, and the other streams the
+provider engine found for the same title. When a known segment fails, the
+proxy marks its host degraded for a cool-down and walks those alternatives for
+a media playlist whose segment timeline matches the failing one (same count,
+same durations). The segment at the same index there is the same stretch of
+video, so it can be served in its place, provided the player can decode it
+with what it already has: the playlists must share their EXT-X-KEY, EXT-X-MAP
+and media sequence, and the renditions' CODECS where the masters list them.
+Encrypted or fMP4 playlists therefore only fail over to a copy using the same
+key and init segment.
+
+NOTE: process-local, single worker — same as the rest of the proxy state.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.api.manifest import rewrite_playlist
+from src.api.segment_cache import MediaPlaylist, PlaylistIndex
+
+log = logging.getLogger("nautilus.proxy")
+
+HOST_COOLDOWN = int(os.getenv("PROXY_HOST_COOLDOWN", "60"))
+# Upstream statuses that send a segment request to an alternative.
+FAILOVER_STATUSES = frozenset({403, 500, 502, 503, 504, 520, 521, 522, 523, 524})
+# Alternatives tried per failed segment, so a dead title can't fan out forever.
+MAX_ALTERNATIVES = 4
+
+
+class HostHealth:
+    """Hosts that recently failed a segment. Until the cool-down ends, their
+    segments go straight to failover and they're tried last as alternatives."""
+
+    def __init__(self, cooldown: int = HOST_COOLDOWN):
+        self.cooldown = cooldown
+        self._until: dict[str, float] = {}
+
+    def mark(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        if not self.degraded(url):
+            log.info(f"[failover] {host} degraded for {self.cooldown}s")
+        self._until[host] = time.monotonic() + self.cooldown
+
+    def degraded(self, url: str) -> bool:
+        host = urlsplit(url).netloc
+        until = self._until.get(host)
+        if until is None:
+            return False
+        if time.monotonic() >= until:
+            del self._until[host]
+            return False
+        return True
+
+
+def _aligned(a: MediaPlaylist, b: MediaPlaylist) -> bool:
+    return (a.decode == b.decode
+            and len(a.durations) == len(b.durations)
+            and all(abs(x - y) < 0.1 for x, y in zip(a.durations, b.durations)))
+
+
+def _codec_set(codecs: str) -> set[str]:
+    return {c.strip() for c in codecs.split(",") if c.strip()}
+
+
+class FailoverMap:
+    """Remembers master -> renditions and title -> provider streams, and turns
+    them into equivalent segment URLs for a failing one."""
+
+    def __init__(self, index: PlaylistIndex, health: HostHealth, max_entries: int = 256):
+        self.index = index
+        self.health = health
+        self.max_entries = max_entries
+        self._variants: "OrderedDict[str, list[tuple[str, int]]]" = OrderedDict()
+        self._master_of: "OrderedDict[str, str]" = OrderedDict()
+        self._groups: "OrderedDict[str, list[tuple[str, dict[str, str]]]]" = OrderedDict()
+        self._group_of: "OrderedDict[str, str]" = OrderedDict()
+        self._codecs: "OrderedDict[str, str]" = OrderedDict()
+
+    @staticmethod
+    def _put(d: OrderedDict, key, value, limit: int) -> None:
+        d[key] = value
+        d.move_to_end(key)
+        while len(d) > limit:
+            d.popitem(last=False)
+
+    def add_master(self, url: str, variants: list[tuple[str, int]],
+                   codecs: Optional[dict[str, str]] = None) -> None:
+        self._put(self._variants, url, list(variants), self.max_entries)
+        for v, _ in variants:
+            self._put(self._master_of, v, url, self.max_entries * 8)
+        for v, c in (codecs or {}).items():
+            self._put(self._codecs, v, c, self.max_entries * 8)
+
+    def _same_codecs(self, a: str, b: str) -> bool:
+        """False only when both renditions' CODECS are known and differ."""
+        ca, cb = self._codecs.get(a), self._codecs.get(b)
+        return ca is None or cb is None or _codec_set(ca) == _codec_set(cb)
+
+    def add_alternates(self, key: str, entries: list[tuple[str, dict[str, str]]]) -> None:
+        """Streams the provider engine found for one title (``key``)."""
+        merged = dict(self._groups.get(key, []))
+        merged.update((url, dict(headers)) for url, headers in entries)
+        self._put(self._groups, key, list(merged.items()), self.max_entries)
+        for url in merged:
+            self._put(self._group_of, url, key, self.max_entries * 8)
+
+    # ── lookup ──────────────────
+
+    def _candidates(self, pl: MediaPlaylist) -> list[tuple[str, dict[str, str], int]]:
+        """(playlist url, headers, wanted bandwidth) to try, nearest first:
+        sibling renditions, then the title's other provider streams."""
+        out = []
+        master = self._master_of.get(pl.url)
+        own_bw = 0
+        if master is not None:
+            variants = self._variants.get(master, [])
+            own_bw = next((bw for u, bw in variants if u == pl.url), 0)
+            for url, _ in sorted(variants, key=lambda v: abs(v[1] - own_bw)):
+                if url != pl.url:
+                    out.append((url, pl.headers, own_bw))
+        key = self._group_of.get(master or pl.url) or self._group_of.get(pl.url)
+        for url, headers in self._groups.get(key, []) if key else []:
+            if url not in (pl.url, master):
+                out.append((url, headers, own_bw))
+        # Degraded hosts go last rather than out: a 403 on one rendition's path
+        # doesn't mean the host's other renditions are dead too.
+        return sorted(out, key=lambda c: self.health.degraded(c[0]))
+
+    async def _media_playlist(self, client: httpx.AsyncClient, url: str,
+                              headers: dict[str, str], bandwidth: int,
+                              depth: int = 0) -> Optional[MediaPlaylist]:
+        known = self.index.get(url)
+        if known is not None:
+            return known
+        try:
+            r = await client.get(url, headers=headers, timeout=10.0)
+        except Exception as e:
+            log.debug(f"[failover] {url}: {e}")
+            self.health.mark(url)
+            return None
+        if r.status_code != 200:
+            return None
+        parsed = rewrite_playlist(r.text, url, lambda u: u)
+        if parsed.variants and depth == 0:
+            self.add_master(url, parsed.variants, parsed.codecs)
+            best = min(parsed.variants, key=lambda v: abs(v[1] - bandwidth))
+            return await self._media_playlist(client, best[0], headers, bandwidth, depth + 1)
+        if not parsed.segments:
+            return None
+        return self.index.register(url, parsed.segments, parsed.durations, headers, parsed.decode)
+
+    async def equivalents(self, client: httpx.AsyncClient, pl: MediaPlaylist,
+                          idx: int) -> AsyncIterator[tuple[str, dict[str, str]]]:
+        """Yield (segment url, headers) carrying the same stretch of video as
+        ``pl.segments[idx]``, healthy hosts first."""
+        for url, headers, bandwidth in self._candidates(pl)[:MAX_ALTERNATIVES]:
+            if not self._same_codecs(pl.url, url):
+                continue
+            alt = await self._media_playlist(client, url, headers, bandwidth)
+            if (alt is None or alt.url == pl.url or not _aligned(pl, alt)
+                    or not self._same_codecs(pl.url, alt.url)):
+                continue
+            yield alt.segments[idx], alt.headers
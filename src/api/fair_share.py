@@ -0,0 +1,199 @@
+"""Per-client fair sharing of the stream proxy's upstream connections.
+
+All viewers share one pooled httpx client (see ``_get_proxy_client``). Without
+accounting, one player with a deep buffer config can keep every connection busy
+and starve everyone else's segment fetches. Each upstream fetch in
+/proxy_stream therefore takes a slot from ``FairScheduler`` first:
+
+* a client (IP address) holds at most ``per_client`` slots at once;
+* when slots are short, waiting requests are granted by weighted fair queuing,
+  i.e. the client that has pulled the fewest bytes (per unit of weight) goes
+  next;
+* a client with too many requests queued, or one that waits too long, gets a
+  429 instead of slowing down other viewers;
+* an optional per-client byte rate is enforced by a token bucket.
+
+NOTE: like the watch-party rooms, all state is process-local — the app runs
+single-worker.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator
+
+UPSTREAM_SLOTS = int(os.getenv("PROXY_UPSTREAM_SLOTS", "200"))
+CLIENT_MAX_CONCURRENCY = int(os.getenv("PROXY_CLIENT_MAX_CONCURRENCY", "8"))
+CLIENT_MAX_QUEUE = int(os.getenv("PROXY_CLIENT_MAX_QUEUE", "32"))
+CLIENT_QUEUE_TIMEOUT = float(os.getenv("PROXY_CLIENT_QUEUE_TIMEOUT", "15"))
+# 0 = no per-client bandwidth cap.
+CLIENT_RATE_BYTES = int(float(os.getenv("PROXY_CLIENT_RATE_MBPS", "0")) * 1_000_000 / 8)
+
+
+class OverLimit(Exception):
+    """The client has too much queued, or waited too long, for a slot."""
+
+    def __init__(self, reason: str, retry_after: int = 2):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class _Client:
+    __slots__ = ("weight", "active", "waiters", "vtime", "tokens", "stamp", "bytes")
+
+    def __init__(self, weight: float, vtime: float, rate: int):
+        self.weight = weight
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        # Virtual finish time: bytes pulled / weight, never behind the clock.
+        self.vtime = vtime
+        self.tokens = float(rate)
+        self.stamp = time.monotonic()
+        self.bytes = 0
+
+
+class Slot:
+    """One granted upstream fetch. ``release()`` is idempotent so it can be
+    called both from the body iterator and the response's background task."""
+
+    __slots__ = ("_sched", "client_id", "_released")
+
+    def __init__(self, sched: "FairScheduler", client_id: str):
+        self._sched = sched
+        self.client_id = client_id
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._sched._release(self.client_id)
+
+
+class FairScheduler:
+    def __init__(self, capacity: int = UPSTREAM_SLOTS, *,
+                 per_client: int = CLIENT_MAX_CONCURRENCY,
+                 max_queue: int = CLIENT_MAX_QUEUE,
+                 queue_timeout: float = CLIENT_QUEUE_TIMEOUT,
+                 rate: int = CLIENT_RATE_BYTES):
+        self.capacity = capacity
+        self.per_client = per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self._active = 0
+        self._vclock = 0.0
+        self._clients: dict[str, _Client] = {}
+
+    # ── slots ──────────────────
+
+    def _state(self, client_id: str, weight: float) -> _Client:
+        st = self._clients.get(client_id)
+        if st is None:
+            st = self._clients[client_id] = _Client(weight, self._vclock, self.rate)
+        st.weight = weight
+        return st
+
+    def _grant(self, client_id: str, st: _Client) -> Slot:
+        self._active += 1
+        st.active += 1
+        self._vclock = max(self._vclock, st.vtime)
+        return Slot(self, client_id)
+
+    async def acquire(self, client_id: str, weight: float = 1.0) -> Slot:
+        st = self._state(client_id, weight)
+        if (self._active < self.capacity and st.active < self.per_client
+                and not any(c.waiters for c in self._clients.values())):
+            return self._grant(client_id, st)
+        if len(st.waiters) >= self.max_queue:
+            raise OverLimit(f"{len(st.waiters)} requests already queued")
+        fut = asyncio.get_running_loop().create_future()
+        st.waiters.append(fut)
+        self._dispatch()
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                fut.result().release()      # granted just as we gave up
+            else:
+                fut.cancel()
+                try:
+                    st.waiters.remove(fut)
+                except ValueError:
+                    pass
+                self._forget(client_id)
+            if isinstance(e, asyncio.TimeoutError):
+                raise OverLimit("timed out waiting for an upstream slot") from None
+            raise
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting clients, lowest virtual time first."""
+        while self._active < self.capacity:
+            best_id, best = None, None
+            for cid, st in self._clients.items():
+                if st.waiters and st.active < self.per_client and (best is None or st.vtime < best.vtime):
+                    best_id, best = cid, st
+            if best is None:
+                return
+            fut = best.waiters.popleft()
+            if fut.done():
+                continue
+            fut.set_result(self._grant(best_id, best))
+
+    def _release(self, client_id: str) -> None:
+        self._active -= 1
+        st = self._clients.get(client_id)
+        if st is not None:
+            st.active -= 1
+        self._dispatch()
+        self._forget(client_id)
+
+    def _forget(self, client_id: str) -> None:
+        st = self._clients.get(client_id)
+        if st is not None and not st.active and not st.waiters:
+            # An idle client re-enters at the current clock anyway; only keep
+            # it while its bandwidth bucket is still refilling.
+            refilled = st.tokens + (time.monotonic() - st.stamp) * self.rate
+            if not self.rate or refilled >= self.rate:
+                del self._clients[client_id]
+
+    # ── bytes ──────────────────
+
+    def account(self, client_id: str, nbytes: int) -> float:
+        """Charge ``nbytes`` to the client; returns how long to pause to stay
+        under the per-client rate (0 when uncapped)."""
+        st = self._clients.get(client_id)
+        if st is None:
+            return 0.0
+        st.bytes += nbytes
+        st.vtime += nbytes / st.weight
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        st.tokens = min(float(self.rate), st.tokens + (now - st.stamp) * self.rate) - nbytes
+        st.stamp = now
+        return -st.tokens / self.rate if st.tokens < 0 else 0.0
+
+    async def meter(self, slot: Slot, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Pass a body through, charging it to the slot's client and releasing
+        the slot when the body ends (or the client goes away)."""
+        try:
+            async for chunk in chunks:
+                delay = self.account(slot.client_id, len(chunk))
+                yield chunk
+                if delay:
+                    await asyncio.sleep(delay)
+        finally:
+            slot.release()
+
+    def stats(self) -> dict:
+        """Slot usage and client counts only; client ids stay private (a guest
+        id is the only credential for that guest's data)."""
+        return {
+            "active": self._active,
+            "capacity": self.capacity,
+            "clients": len(self._clients),
+            "queued": sum(len(st.waiters) for st in self._clients.values()),
+            "clients_at_cap": sum(st.active >= self.per_client for st in self._clients.values()),
+        }
@@ -1,13 +1,35 @@
-from fastapi import FastAPI, Depends, Request, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Request, UploadFile, File, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, StreamingResponse, Response
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import case, or_, select, update
 from sqlalchemy.sql import func
-from src.core.database import get_db
+from src.core.database import get_db, get_async_db, async_engine, SessionLocal, AsyncSessionLocal, dialect_insert
 from src.core import models
+from src.core.genres import TMDB_GENRE_MAP, TMDB_TV_GENRE_MAP, normalize_genres, genre_id_set, genre_ids_for
+from src.core import rating_stats as _ratings
+from src.core import search as _search
+from src.core import pagination as _pagination
 from src.services.scrapers.universal import UniversalScraper
 from src.providers.runner import ProviderEngine
 from src.providers.base import MediaContext
+# All TMDB calls go through one pooled, rate-limited, cached client (src/core/tmdb.py).
+from src.core.tmdb import tmdb, catalog_fields, show_dates, CATALOG_PARAMS
+from src.api.genre_index import GenreIndex
+from src.api.random_pool import RandomPool
+from src.api.suggest import Suggest
+from src.api.upstream import UpstreamTransport
+from src.api.segment_cache import SegmentCache, PlaylistIndex, ReadAhead, MAX_SEGMENT_BYTES
+from src.api.manifest import ProxyTokens, ManifestCache, rewrite_playlist
+from src.api.range_cache import RangeCache, parse_range, response_span, MIN_FILE_BYTES
+from src.api.fair_share import FairScheduler, OverLimit
+from src.api.failover import FailoverMap, HostHealth, FAILOVER_STATUSES
+from src.api.subtitle_cache import SubtitleCache, decode_subtitle, srt_to_vtt
+from src.api.subtitle_search import SubtitleSearch
+from src.api.discover import Discover
+from src.api import availability as _availability
+import anyio.to_thread
 import httpx
 import os
 import requests
@@ -23,54 +45,22 @@ try:
 except Exception:
     _keras = None
 import glob
+import hmac
 import ctypes
 import sys
 from datetime import datetime
 from datetime import timedelta
 import threading
 import json
+import inspect as _inspect
 from pathlib import Path
 from dotenv import load_dotenv
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from typing import List
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
 
 
-TMDB_GENRE_MAP = {
-    28: "Action", 12: "Adventure", 16: "Animation", 35: "Comedy",
-    80: "Crime", 99: "Documentary", 18: "Drama", 10751: "Family",
-    14: "Fantasy", 36: "History", 27: "Horror", 10402: "Music",
-    9648: "Mystery", 10749: "Romance", 878: "Sci-Fi", 10770: "TV Movie",
-    53: "Thriller", 10752: "War", 37: "Western"
-}
-
-def normalize_genres(genres):
-    """Return list of {id,name} dicts from stored genres (list of dicts, ids, or names)."""
-    out = []
-    if not genres:
-        return out
-    if isinstance(genres, dict):
-        genres = [{"id": k, "name": v} for k, v in genres.items()]
-    for g in genres:
-        if isinstance(g, dict):
-            gid = g.get("id")
-            name = g.get("name") or TMDB_GENRE_MAP.get(gid)
-            if gid is not None and name:
-                out.append({"id": int(gid), "name": name})
-            elif name:
-                out.append({"id": None, "name": name})
-        elif isinstance(g, int):
-            out.append({"id": g, "name": TMDB_GENRE_MAP.get(g, str(g))})
-        elif isinstance(g, str):
-            out.append({"id": None, "name": g})
-    return out
-
-def genre_id_set(genres):
-    norm = normalize_genres(genres)
-    return {g["id"] for g in norm if g.get("id") is not None}
-
 load_dotenv()
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 
@@ -89,13 +79,32 @@ _TTL_CACHE: dict = {}
 
 def _ttl_cache(ttl: int):
     def deco(fn):
-        @_functools.wraps(fn)
-        def wrapper(*args, **kwargs):
-            key = (fn.__name__,) + tuple(
-                (k, v) for k, v in sorted(kwargs.items()) if not isinstance(v, Session)
+        def key_of(kwargs):
+            return (fn.__name__,) + tuple(
+                (k, v) for k, v in sorted(kwargs.items()) if not isinstance(v, (Session, AsyncSession))
             )
+
+        def cached(key):
             hit = _TTL_CACHE.get(key)
-            if hit and (_t.time() - hit[0]) < ttl:
+            return hit if hit and (_t.time() - hit[0]) < ttl else None
+
+        if _inspect.iscoroutinefunction(fn):
+            @_functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                key = key_of(kwargs)
+                hit = cached(key)
+                if hit:
+                    return hit[1]
+                result = await fn(*args, **kwargs)
+                _TTL_CACHE[key] = (_t.time(), result)
+                return result
+            return async_wrapper
+
+        @_functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = key_of(kwargs)
+            hit = cached(key)
+            if hit:
                 return hit[1]
             result = fn(*args, **kwargs)
             _TTL_CACHE[key] = (_t.time(), result)
@@ -141,22 +150,17 @@ def get_admin_stats(db: Session = Depends(get_db)):
 
     # New Releases (by release_date descending) - movies
     try:
-        new_releases_movies = db.query(models.Movie).order_by(models.Movie.release_date.desc()).limit(5).all()
+        new_releases_movies = db.query(models.Movie).filter(models.Movie.release_date <= datetime.utcnow().date()).order_by(models.Movie.release_date.desc()).limit(5).all()
         new_releases_movies = [{"title": m.title, "tmdb_id": m.tmdb_id, "release_date": m.release_date} for m in new_releases_movies]
     except Exception:
         new_releases_movies = []
 
-    # Top Rated Movies (by average rating if available, otherwise fallback to popularity)
+    # Top Rated Movies (by weighted rating if available, otherwise fallback to popularity)
     try:
-        avg_ratings = db.query(
-            models.Movie.id,
-            models.Movie.title,
-            models.Movie.tmdb_id,
-            func.avg(models.Interaction.rating_value).label('avg_rating')
-        ).join(models.Interaction, models.Interaction.movie_id == models.Movie.id).group_by(models.Movie.id).order_by(func.avg(models.Interaction.rating_value).desc()).limit(5).all()
+        avg_ratings = _ratings.top(db, models.Movie, 'movie', limit=5)
 
         if avg_ratings:
-            top_rated_movies = [{"title": row.title, "tmdb_id": row.tmdb_id, "avg_rating": float(row.avg_rating)} for row in avg_ratings]
+            top_rated_movies = [{"title": m.title, "tmdb_id": m.tmdb_id, "avg_rating": float(st.avg_rating)} for m, st in avg_ratings]
         else:
             # Fallback to popularity
             top_pop = db.query(models.Movie).order_by(models.Movie.popularity_score.desc()).limit(5).all()
@@ -166,22 +170,16 @@ def get_admin_stats(db: Session = Depends(get_db)):
 
     # Repeat for TV Shows
     try:
-        # TVShow doesn't have a release_date field in the model; use popularity as a proxy for recent/interesting
-        new_releases_shows = db.query(models.TVShow).order_by(models.TVShow.popularity_score.desc()).limit(5).all()
-        new_releases_shows = [{"title": s.title, "tmdb_id": s.tmdb_id, "popularity": s.popularity_score} for s in new_releases_shows]
+        new_releases_shows = db.query(models.TVShow).filter(models.TVShow.first_air_date <= datetime.utcnow().date()).order_by(models.TVShow.first_air_date.desc()).limit(5).all()
+        new_releases_shows = [{"title": s.title, "tmdb_id": s.tmdb_id, "first_air_date": s.first_air_date, "popularity": s.popularity_score} for s in new_releases_shows]
     except Exception:
         new_releases_shows = []
 
     try:
-        avg_ratings_shows = db.query(
-            models.TVShow.id,
-            models.TVShow.title,
-            models.TVShow.tmdb_id,
-            func.avg(models.Interaction.rating_value).label('avg_rating')
-        ).join(models.Interaction, models.Interaction.tv_show_id == models.TVShow.id).group_by(models.TVShow.id).order_by(func.avg(models.Interaction.rating_value).desc()).limit(5).all()
+        avg_ratings_shows = _ratings.top(db, models.TVShow, 'tv', limit=5)
 
         if avg_ratings_shows:
-            top_rated_shows = [{"title": row.title, "tmdb_id": row.tmdb_id, "avg_rating": float(row.avg_rating)} for row in avg_ratings_shows]
+            top_rated_shows = [{"title": s.title, "tmdb_id": s.tmdb_id, "avg_rating": float(st.avg_rating)} for s, st in avg_ratings_shows]
         else:
             top_pop_shows = db.query(models.TVShow).order_by(models.TVShow.popularity_score.desc()).limit(5).all()
             top_rated_shows = [{"title": s.title, "tmdb_id": s.tmdb_id, "popularity": s.popularity_score} for s in top_pop_shows]
@@ -296,6 +294,18 @@ def _warm_home_cache_loop():
         _time.sleep(600)   # re-warm every 10 min so expiries refresh before users hit them
 
 
+@app.on_event("startup")
+async def size_threadpool():
+    # Sync endpoints and blocking helpers share AnyIO's threadpool (default 40).
+    anyio.to_thread.current_default_thread_limiter().total_tokens = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
 @app.on_event("startup")
 def startup_periodic_fetch():
     # Start a daemon thread that periodically checks and fetches
@@ -303,6 +313,10 @@ def startup_periodic_fetch():
         t = threading.Thread(target=background_periodic_worker, kwargs={'interval_hours': 24}, daemon=True)
         t.start()
         threading.Thread(target=_warm_home_cache_loop, daemon=True).start()
+        threading.Thread(target=_rating_reconcile_loop, daemon=True).start()
+        threading.Thread(target=_suggest_refresh_loop, daemon=True).start()
+        if TMDB_API_KEY:
+            threading.Thread(target=_availability_refresh_loop, daemon=True).start()
     except Exception as e:
         print(f"startup_periodic_fetch error: {e}")
 
@@ -377,12 +391,8 @@ def get_genre_prediction(tmdb_id: int, db: Session = Depends(get_db)):
     # Fallback to TMDB metadata when DB lacks genres
     if TMDB_API_KEY:
         try:
-            m_url = f"{TMDB_BASE_URL}/movie/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-            t_url = f"{TMDB_BASE_URL}/tv/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-            resp = requests.get(m_url, timeout=5)
-            if resp.status_code != 200:
-                resp = requests.get(t_url, timeout=5)
-            data = resp.json() if resp.status_code == 200 else {}
+            data = (tmdb.get_sync(f"/movie/{tmdb_id}", {"language": "en-US"})
+                    or tmdb.get_sync(f"/tv/{tmdb_id}", {"language": "en-US"}) or {})
             g_list = data.get("genres", []) or []
             genres = [{"id": g.get("id"), "name": g.get("name"), "score": 1.0} for g in g_list if g.get("name")]
             primary = genres[0] if genres else None
@@ -392,6 +402,29 @@ def get_genre_prediction(tmdb_id: int, db: Session = Depends(get_db)):
 
     return {"genres": [], "primary": None}
     
+# Local fallback for /related (see src/api/genre_index.py).
+_genre_index = GenreIndex(genre_id_set)
+
+# /movies/random (see src/api/random_pool.py).
+_random_pool = RandomPool()
+
+# Search-as-you-type (see src/api/suggest.py).
+_suggest = Suggest()
+# Set when titles are added; wakes _suggest_refresh_loop before its interval.
+_suggest_dirty = threading.Event()
+
+def _tmdb_card(item: dict, media_type: str) -> dict:
+    """Card for a TMDB result that isn't in the local DB (poster, title)."""
+    if media_type == "tv":
+        return {"tmdb_id": item.get("id"), "name": item.get("name", ""),
+                "poster_path": item.get("poster_path"), "overview": item.get("overview", ""),
+                "first_air_date": item.get("first_air_date", ""), "media_type": "tv",
+                "popularity_score": item.get("popularity", 0)}
+    return {"tmdb_id": item.get("id"), "title": item.get("title", ""),
+            "poster_path": item.get("poster_path"), "overview": item.get("overview", ""),
+            "release_date": item.get("release_date", ""), "media_type": "movie",
+            "popularity_score": item.get("popularity", 0)}
+
 @app.get("/related/{tmdb_id}")
 @_ttl_cache(1800)
 def get_related_movies(tmdb_id: int, db: Session = Depends(get_db)):
@@ -406,119 +439,49 @@ def get_related_movies(tmdb_id: int, db: Session = Depends(get_db)):
     show = db.query(models.TVShow).filter(models.TVShow.tmdb_id == tmdb_id).first()
     is_tv = bool(show and not movie)
     media_type = "tv" if is_tv else "movie"
+    model = models.TVShow if is_tv else models.Movie
 
     # --- TIER 1 + 2: Use TMDB APIs ------------------------------------------
     if TMDB_API_KEY:
-        tmdb_ids_seen = set()
-        ordered_results = []
-
         try:
-            base_type = "tv" if is_tv else "movie"
-
-            # TIER 1: Collection / franchise (movies only — TV doesn't have collections)
-            if not is_tv:
-                detail_url = f"{TMDB_BASE_URL}/movie/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-                detail = requests.get(detail_url, timeout=5).json()
-                collection = detail.get("belongs_to_collection")
-                if collection and collection.get("id"):
-                    coll_url = f"{TMDB_BASE_URL}/collection/{collection['id']}?api_key={TMDB_API_KEY}&language=en-US"
-                    coll_data = requests.get(coll_url, timeout=5).json()
-                    for part in coll_data.get("parts", []):
-                        pid = part.get("id")
-                        if pid and pid != tmdb_id and pid not in tmdb_ids_seen:
-                            tmdb_ids_seen.add(pid)
-                            # Try to find in local DB first
-                            local = db.query(models.Movie).filter(models.Movie.tmdb_id == pid).first()
-                            if local:
-                                ordered_results.append(dict(jsonable_encoder(local), media_type="movie"))
-                            else:
-                                # Use TMDB data directly so the card renders (poster, title)
-                                ordered_results.append({
-                                    "tmdb_id": pid, "title": part.get("title", ""),
-                                    "poster_path": part.get("poster_path"),
-                                    "overview": part.get("overview", ""),
-                                    "release_date": part.get("release_date", ""),
-                                    "media_type": "movie",
-                                    "popularity_score": part.get("popularity", 0),
-                                })
-
-            # TIER 2: TMDB recommendations + similar
-            for endpoint in ["recommendations", "similar"]:
-                if len(ordered_results) >= 12:
+            # Detail, recommendations and similar ride one call; the collection
+            # (movies only — TV doesn't have collections) needs the detail's id.
+            detail = tmdb.get_sync(f"/{media_type}/{tmdb_id}",
+                                   {"language": "en-US", "append_to_response": "recommendations,similar"}) or {}
+            collection = detail.get("belongs_to_collection") if not is_tv else None
+            coll_data = {}
+            if collection and collection.get("id"):
+                coll_data = tmdb.get_sync(f"/collection/{collection['id']}", {"language": "en-US"}) or {}
+
+            candidates, seen = [], {tmdb_id}
+            for item in (coll_data.get("parts", [])
+                         + (detail.get("recommendations") or {}).get("results", [])[:15]
+                         + (detail.get("similar") or {}).get("results", [])[:15]):
+                iid = item.get("id")
+                if iid and iid not in seen:
+                    seen.add(iid)
+                    candidates.append(item)
+                if len(candidates) >= 12:
                     break
-                rec_url = f"{TMDB_BASE_URL}/{base_type}/{tmdb_id}/{endpoint}?api_key={TMDB_API_KEY}&language=en-US&page=1"
-                rec_data = requests.get(rec_url, timeout=5).json()
-                for item in rec_data.get("results", [])[:15]:
-                    iid = item.get("id")
-                    if not iid or iid in tmdb_ids_seen or iid == tmdb_id:
-                        continue
-                    tmdb_ids_seen.add(iid)
-                    if is_tv:
-                        local = db.query(models.TVShow).filter(models.TVShow.tmdb_id == iid).first()
-                        if local:
-                            ordered_results.append(dict(jsonable_encoder(local), media_type="tv"))
-                        else:
-                            ordered_results.append({
-                                "tmdb_id": iid, "name": item.get("name", ""),
-                                "poster_path": item.get("poster_path"),
-                                "overview": item.get("overview", ""),
-                                "first_air_date": item.get("first_air_date", ""),
-                                "media_type": "tv",
-                                "popularity_score": item.get("popularity", 0),
-                            })
-                    else:
-                        local = db.query(models.Movie).filter(models.Movie.tmdb_id == iid).first()
-                        if local:
-                            ordered_results.append(dict(jsonable_encoder(local), media_type="movie"))
-                        else:
-                            ordered_results.append({
-                                "tmdb_id": iid, "title": item.get("title", ""),
-                                "poster_path": item.get("poster_path"),
-                                "overview": item.get("overview", ""),
-                                "release_date": item.get("release_date", ""),
-                                "media_type": "movie",
-                                "popularity_score": item.get("popularity", 0),
-                            })
-                    if len(ordered_results) >= 12:
-                        break
 
+            # Cross-reference with the DB in one IN query.
+            ids = [item["id"] for item in candidates]
+            local = {row.tmdb_id: row for row in db.query(model).filter(model.tmdb_id.in_(ids)).all()} if ids else {}
+            ordered_results = [
+                dict(jsonable_encoder(local[item["id"]]), media_type=media_type) if item["id"] in local
+                else _tmdb_card(item, media_type)
+                for item in candidates
+            ]
             if ordered_results:
-                return ordered_results[:12]
+                return ordered_results
         except Exception as e:
             print(f"TMDB related lookup failed: {e}")
 
     # --- TIER 3: Local genre Jaccard fallback --------------------------------
-    if is_tv and show:
-        src_genres = genre_id_set(show.genres)
-        max_pop = db.query(func.max(models.TVShow.popularity_score)).scalar() or 1
-        candidates = db.query(models.TVShow).filter(models.TVShow.id != show.id, models.TVShow.popularity_score.isnot(None)).limit(600).all()
-        scored = []
-        for cand in candidates:
-            j = 0
-            if src_genres:
-                inter = src_genres.intersection(genre_id_set(cand.genres))
-                union = src_genres.union(genre_id_set(cand.genres))
-                j = (len(inter) / len(union)) if union else 0
-            pop_norm = (cand.popularity_score or 0) / max_pop
-            hybrid = 0.7 * j + 0.3 * pop_norm
-            scored.append((cand, hybrid))
-        scored.sort(key=lambda x: x[1], reverse=True)
-        return [dict(jsonable_encoder(s[0]), media_type="tv") for s in scored[:10]]
-
-    if movie:
-        src_genres = genre_id_set(movie.genres)
-        max_pop = db.query(func.max(models.Movie.popularity_score)).scalar() or 1
-        candidates = db.query(models.Movie).filter(models.Movie.id != movie.id, models.Movie.popularity_score.isnot(None)).limit(900).all()
-        scored = []
-        for cand in candidates:
-            inter = src_genres.intersection(genre_id_set(cand.genres)) if src_genres else set()
-            union = src_genres.union(genre_id_set(cand.genres)) if src_genres else genre_id_set(cand.genres)
-            j = (len(inter) / len(union)) if union else 0
-            pop_norm = (cand.popularity_score or 0) / max_pop
-            hybrid = 0.7 * j + 0.3 * pop_norm
-            scored.append((cand, hybrid))
-        scored.sort(key=lambda x: x[1], reverse=True)
-        return [dict(jsonable_encoder(s[0]), media_type="movie") for s in scored[:10]]
+    source = show if is_tv else movie
+    if source:
+        return [dict(jsonable_encoder(r), media_type=media_type)
+                for r in _genre_index.similar(db, model, source, limit=10)]
 
     popular = db.query(models.Movie).order_by(models.Movie.popularity_score.desc()).limit(10).all()
     return [dict(jsonable_encoder(m), media_type="movie") for m in popular]
@@ -526,52 +489,58 @@ def get_related_movies(tmdb_id: int, db: Session = Depends(get_db)):
 # --- 2. CORE FEATURES ---
 
 @app.get("/search")
-def search_content(query: str, db: Session = Depends(get_db)):
-    local_movies = db.query(models.Movie).filter(models.Movie.title.ilike(f"%{query}%")).limit(5).all()
-    local_shows = db.query(models.TVShow).filter(models.TVShow.title.ilike(f"%{query}%")).limit(5).all()
-    
-    if len(local_movies) + len(local_shows) > 0:
-        results = []
-        for m in local_movies:
-            payload = jsonable_encoder(m)
-            payload["media_type"] = "movie"
-            results.append(payload)
-        for s in local_shows:
-            payload = jsonable_encoder(s)
-            payload["media_type"] = "tv"
-            results.append(payload)
-        return results
-    
+async def search_content(query: str, db: AsyncSession = Depends(get_async_db)):
+    # Indexed, relevance + popularity ranked (src/core/search.py), run on the
+    # async connection
+    local = await db.run_sync(_search.search, query, 5)
+    if local["movie"] or local["tv"]:
+        return [jsonable_encoder(row) | {"media_type": media_type}
+                for media_type in ("movie", "tv") for row in local[media_type]]
+
     if not TMDB_API_KEY: 
         return []
     
-    url = f"https://api.themoviedb.org/3/search/multi?api_key={TMDB_API_KEY}&query={query}&include_adult=false"
-    data = requests.get(url).json()
-    
-    results = []
+    data = await tmdb.get("/search/multi", {"query": query, "include_adult": "false"}) or {}
+
+    # Cache what TMDB found in the catalog: one bulk insert per table, skipping
+    # titles that are already there.
+    rows = {"movie": [], "tv": []}
     for item in data.get('results', []):
-        if item['media_type'] == 'movie':
-            if not db.query(models.Movie).filter_by(tmdb_id=item['id']).first():
-                movie = models.Movie(
-                    title=item.get('title'), tmdb_id=item.get('id'), overview=item.get('overview'),
-                    poster_path=item.get('poster_path'), popularity_score=item.get('popularity'),
-                    release_date=item.get('release_date')
-                )
-                db.add(movie)
-                results.append(jsonable_encoder(movie) | {"media_type": "movie"})
-        elif item['media_type'] == 'tv':
-            if not db.query(models.TVShow).filter_by(tmdb_id=item['id']).first():
-                show = models.TVShow(
-                    title=item.get('name'), tmdb_id=item.get('id'), overview=item.get('overview'),
-                    poster_path=item.get('poster_path'), popularity_score=item.get('popularity')
-                )
-                db.add(show)
-                results.append(jsonable_encoder(show) | {"media_type": "tv"})
+        if item.get('media_type') == 'movie':
+            rows["movie"].append(dict(
+                title=item.get('title'), tmdb_id=item.get('id'), overview=item.get('overview'),
+                poster_path=item.get('poster_path'), popularity_score=item.get('popularity'),
+                release_date=item.get('release_date'), **catalog_fields(item)
+            ))
+        elif item.get('media_type') == 'tv':
+            rows["tv"].append(dict(
+                title=item.get('name'), tmdb_id=item.get('id'), overview=item.get('overview'),
+                poster_path=item.get('poster_path'), popularity_score=item.get('popularity'),
+                **catalog_fields(item), **show_dates(item)
+            ))
     try:
-        db.commit()
+        for media_type, model in _search.TABLES.items():
+            if rows[media_type]:
+                await db.execute(dialect_insert(db.bind, model.__table__).values(rows[media_type])
+                                 .on_conflict_do_nothing(index_elements=['tmdb_id']))
+        await db.commit()
+        _suggest_dirty.set()
     except Exception: 
-        db.rollback()
-    return results
+        await db.rollback()
+    return [row | {"media_type": media_type} for media_type in ("movie", "tv") for row in rows[media_type]]
+
+@app.get("/search/suggest")
+def search_suggest(q: str, limit: int = 10, db: Session = Depends(get_db)):
+    """Type-ahead titles: prefix and one-typo matches, most popular first."""
+    limit = max(1, min(limit, 25))
+    if _suggest.ready:
+        return _suggest.suggest(q, limit)
+    # Index still building (first seconds after startup): indexed DB search.
+    local = _search.search(db, q, limit=limit)
+    hits = [{"title": r.title, "tmdb_id": r.tmdb_id, "media_type": media_type,
+             "popularity_score": r.popularity_score}
+            for media_type in ("movie", "tv") for r in local[media_type]]
+    return sorted(hits, key=lambda h: -(h["popularity_score"] or 0))[:limit]
 
 @app.get("/play/{media_type}/{tmdb_id}")
 async def play_content(media_type: str, tmdb_id: int, season: int = 1, episode: int = 1, provider: str = None):
@@ -587,58 +556,71 @@ async def play_content(media_type: str, tmdb_id: int, season: int = 1, episode:
 # Tries all providers in rank order.
 _provider_engine = ProviderEngine(timeout=12)
 
-@app.get("/stream/{media_type}/{tmdb_id}")
-async def stream_content(media_type: str, tmdb_id: int, season: int = 1, episode: int = 1, source: str = None, db: Session = Depends(get_db)):
-    """Resolve direct streams via the provider engine. Returns HLS/MP4 URLs."""
-    # Build media context with title from DB/TMDB
-    title = ""
-    imdb_id = None
-    year = 0
-    genres = []
-    original_language = ""
+async def _save_catalog_fields(model, row_id: int, fields: dict) -> None:
+    """Write TMDB-filled catalog columns back after the response has gone out."""
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(model).where(model.id == row_id).values(**fields))
+            await db.commit()
+    except Exception as e:
+        print(f"catalog write-back failed: {e}")
+
+async def _media_context(media_type: str, tmdb_id: int, season: int, episode: int,
+                         background: BackgroundTasks = None) -> MediaContext:
+    """MediaContext from the catalog row (one tmdb_id index lookup). TMDB is
+    only asked for titles not in the catalog or not backfilled yet, and the
+    answer is written back (as a background task, off the request path) so
+    the next play skips it.
+
+    The lookup uses its own short-lived session: the /stream handlers then
+    scrape providers for many seconds, and a request-scoped session would
+    hold a pooled connection for all of it."""
+    model = models.Movie if media_type == "movie" else models.TVShow
     try:
-        item = db.query(models.Movie if media_type == "movie" else models.TVShow).filter_by(tmdb_id=tmdb_id).first()
+        async with AsyncSessionLocal() as db:
+            item = await _first(db, select(model).filter_by(tmdb_id=tmdb_id))
     except Exception:
         item = None  # DB may be offline — not critical for streaming
-    if item:
+    title, genres, fields = "", [], {"imdb_id": None, "original_language": None, "year": None}
+    if item is not None:
         title = item.title or ""
-        imdb_id = getattr(item, "imdb_id", None)
+        genres = [g["name"] for g in normalize_genres(item.genres)]
+        fields = {"imdb_id": item.imdb_id, "original_language": item.original_language, "year": item.year}
+    if (item is None or not (item.imdb_id and item.original_language and genres)) and TMDB_API_KEY:
+        ep = "movie" if media_type == "movie" else "tv"
+        d = await tmdb.get(f"/{ep}/{tmdb_id}", CATALOG_PARAMS)
+        if d:
+            fetched = catalog_fields(d)
+            fields = {k: fields[k] or v for k, v in fetched.items()}
+            title = title or d.get("title") or d.get("name", "")
+            genres = genres or [g.get("name", "") for g in d.get("genres", [])]
+            if item is not None and background is not None:
+                background.add_task(_save_catalog_fields, model, item.id, fields)
+    year = fields["year"]
+    if not year and item is not None:
         rd = getattr(item, "release_date", "") or ""
-        year = int(rd[:4]) if rd and rd[:4].isdigit() else 0
-    # Always try TMDB for IMDB ID + genre/language info
-    if TMDB_API_KEY:
-        try:
-            ep = "movie" if media_type == "movie" else "tv"
-            r = requests.get(f"https://api.themoviedb.org/3/{ep}/{tmdb_id}?api_key={TMDB_API_KEY}&append_to_response=external_ids", timeout=4)
-            if r.ok:
-                d = r.json()
-                if not title:
-                    title = d.get("title") or d.get("name", "")
-                if not imdb_id:
-                    imdb_id = d.get("imdb_id") or (d.get("external_ids") or {}).get("imdb_id")
-                if not year:
-                    yr = d.get("release_date") or d.get("first_air_date", "")
-                    year = int(yr[:4]) if yr and yr[:4].isdigit() else 0
-                genres = [g.get("name", "") for g in d.get("genres", [])]
-                original_language = d.get("original_language", "")
-        except Exception:
-            pass
-
-    # Detect anime: Animation genre + Japanese language
-    is_anime = ("Animation" in genres and original_language == "ja")
-
-    media = MediaContext(
+        year = int(rd[:4]) if rd[:4].isdigit() else 0
+    return MediaContext(
         tmdb_id=tmdb_id,
-        imdb_id=imdb_id,
+        imdb_id=fields["imdb_id"],
         title=title,
-        year=year,
+        year=year or 0,
         media_type=media_type,
         season=season,
         episode=episode,
-        is_anime=is_anime,
+        # Detect anime: Animation genre + Japanese language
+        is_anime=("Animation" in genres and fields["original_language"] == "ja"),
         genres=genres,
     )
 
+@app.get("/stream/{media_type}/{tmdb_id}")
+async def stream_content(media_type: str, tmdb_id: int, background: BackgroundTasks, season: int = 1,
+                         episode: int = 1, source: str = None):
+    """Resolve direct streams via the provider engine. Returns HLS/MP4 URLs."""
+    media = await _media_context(media_type, tmdb_id, season, episode, background)
+    # Captions are searched while the providers resolve, so they're ready together.
+    _subtitle_search.prefetch(media_type, tmdb_id, season, episode, imdb_id=media.imdb_id)
+
     try:
         if source:
             result = await _provider_engine.run_source(source, media)
@@ -649,6 +631,7 @@ async def stream_content(media_type: str, tmdb_id: int, season: int = 1, episode
         result = None
 
     if result:
+        _register_alternates(media_type, tmdb_id, season, episode, [result.stream])
         return result.to_dict()
 
     # No direct HLS/MP4 stream found from any provider
@@ -663,78 +646,135 @@ async def list_providers():
     }
 
 @app.get("/stream/hunt/{media_type}/{tmdb_id}")
-async def hunt_all_streams(media_type: str, tmdb_id: int, season: int = 1, episode: int = 1, db: Session = Depends(get_db)):
+async def hunt_all_streams(media_type: str, tmdb_id: int, background: BackgroundTasks, season: int = 1,
+                           episode: int = 1):
     """Scan ALL providers concurrently, return every working stream found."""
-    title = ""
-    imdb_id = None
-    year = 0
-    genres = []
-    original_language = ""
-    try:
-        item = db.query(models.Movie if media_type == "movie" else models.TVShow).filter_by(tmdb_id=tmdb_id).first()
-    except Exception:
-        item = None  # DB may be offline — not critical for streaming
-    if item:
-        title = item.title or ""
-        imdb_id = getattr(item, "imdb_id", None)
-        rd = getattr(item, "release_date", "") or ""
-        year = int(rd[:4]) if rd and rd[:4].isdigit() else 0
-    if TMDB_API_KEY:
-        try:
-            ep = "movie" if media_type == "movie" else "tv"
-            r = requests.get(f"https://api.themoviedb.org/3/{ep}/{tmdb_id}?api_key={TMDB_API_KEY}&append_to_response=external_ids", timeout=4)
-            if r.ok:
-                d = r.json()
-                if not title:
-                    title = d.get("title") or d.get("name", "")
-                if not imdb_id:
-                    imdb_id = d.get("imdb_id") or (d.get("external_ids") or {}).get("imdb_id")
-                if not year:
-                    yr = d.get("release_date") or d.get("first_air_date", "")
-                    year = int(yr[:4]) if yr and yr[:4].isdigit() else 0
-                genres = [g.get("name", "") for g in d.get("genres", [])]
-                original_language = d.get("original_language", "")
-        except Exception:
-            pass
-
-    is_anime = ("Animation" in genres and original_language == "ja")
-
-    media = MediaContext(
-        tmdb_id=tmdb_id, imdb_id=imdb_id, title=title, year=year,
-        media_type=media_type, season=season, episode=episode,
-        is_anime=is_anime, genres=genres,
-    )
+    media = await _media_context(media_type, tmdb_id, season, episode, background)
+    _subtitle_search.prefetch(media_type, tmdb_id, season, episode, imdb_id=media.imdb_id)
 
     results = await _provider_engine.run_all_streams(media)
+    _register_alternates(media_type, tmdb_id, season, episode, [r.stream for r in results])
     return {
         "streams": [r.to_dict() for r in results],
         "count": len(results),
     }
 
+
 # One pooled HTTP client for the proxy — keepalive across the dozens of small
 # .ts segment fetches per playlist (no fresh TLS handshake each time). Lives for
 # the process; StreamingResponse keeps the upstream connection open until drained.
 _PROXY_CLIENT: httpx.AsyncClient | None = None
+_PROXY_TRANSPORT: UpstreamTransport | None = None
 
 def _get_proxy_client() -> httpx.AsyncClient:
-    global _PROXY_CLIENT
+    global _PROXY_CLIENT, _PROXY_TRANSPORT
     if _PROXY_CLIENT is None or _PROXY_CLIENT.is_closed:
+        # HTTP/2 to CDNs that negotiate it, HTTP/1.1 otherwise; per-host
+        # stats at /admin/proxy_stats (see src/api/upstream.py).
+        _PROXY_TRANSPORT = UpstreamTransport(httpx.Limits(max_keepalive_connections=50,
+                                                          max_connections=200,
+                                                          keepalive_expiry=30.0))
         _PROXY_CLIENT = httpx.AsyncClient(
             follow_redirects=True,
             timeout=httpx.Timeout(20.0, connect=8.0, read=None),
-            limits=httpx.Limits(max_keepalive_connections=50, max_connections=200,
-                                keepalive_expiry=30.0),
+            transport=_PROXY_TRANSPORT,
         )
     return _PROXY_CLIENT
 
+# Segment read-ahead: rewritten media playlists are indexed so a request for
+# segment N warms N+1..N+k in the background (see src/api/segment_cache.py).
+_segment_index = PlaylistIndex()
+_read_ahead = ReadAhead(SegmentCache(), _segment_index)
+
+# Manifests are rewritten to short signed tokens (/proxy_stream?t=...) and
+# finished VOD/master playlists are cached rewritten (see src/api/manifest.py).
+_proxy_tokens = ProxyTokens()
+_manifest_cache = ManifestCache()
+
+# MP4 file streams: sparse on-disk cache of the byte ranges already fetched, so
+# seeks are answered locally and only gaps go upstream (src/api/range_cache.py).
+_range_cache = RangeCache()
+
+# Upstream fetches are shared fairly between viewers: per-client slot caps,
+# fair queuing when slots are short, 429 past the queue limit (src/api/fair_share.py).
+_fair_share = FairScheduler()
+
+# Failed segments are retried from an equivalent rendition / provider mirror and
+# the failing host is skipped for a cool-down (src/api/failover.py).
+_host_health = HostHealth()
+_failover = FailoverMap(_segment_index, _host_health)
+# Known segments get a read timeout, so a hung CDN node fails over instead of stalling.
+_SEGMENT_TIMEOUT = httpx.Timeout(20.0, connect=8.0, read=float(os.getenv("PROXY_SEGMENT_TIMEOUT", "10")))
+_PROXY_UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+def _register_alternates(media_type: str, tmdb_id: int, season: int, episode: int, streams) -> None:
+    """Remember every HLS stream found for a title as failover candidates."""
+    key = f"{media_type}:{tmdb_id}:{season}:{episode}" if media_type == "tv" else f"movie:{tmdb_id}"
+    entries = [(s.playlist, {"User-Agent": _PROXY_UA, **(s.headers or {})})
+               for s in streams if s.stream_type == "hls" and s.playlist]
+    if entries:
+        _failover.add_alternates(key, entries)
+
+async def _segment_failover(client: httpx.AsyncClient, pl, url: str, client_range: str | None):
+    """First healthy equivalent of a failing segment, as an open streamed response."""
+    loc = _segment_index.locate(url)
+    if loc is None:
+        return None
+    async for alt_url, alt_headers in _failover.equivalents(client, pl, loc[1]):
+        h = {**alt_headers, "Accept-Encoding": "identity"}
+        if client_range:
+            h["Range"] = client_range
+        try:
+            r = await client.send(client.build_request("GET", alt_url, headers=h,
+                                                       timeout=_SEGMENT_TIMEOUT), stream=True)
+        except Exception:
+            _host_health.mark(alt_url)
+            continue
+        if r.status_code < 400:
+            logging.info(f"[proxy_stream] segment failover {url} -> {alt_url}")
+            return r
+        await r.aclose()
+        if r.status_code in FAILOVER_STATUSES:
+            _host_health.mark(alt_url)
+    return None
+
+def _proxy_client_id(request: Request) -> str:
+    """The caller's IP. Not a client-supplied id: minting fresh ones would
+    sidestep the per-client cap."""
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def _over_limit_response(e: OverLimit) -> Response:
+    return Response(content=f"Too many proxy requests: {e}", status_code=429,
+                    headers={"Access-Control-Allow-Origin": "*",
+                             "Retry-After": str(e.retry_after)})
+
+def _manifest_response(body: str) -> Response:
+    return Response(content=body, media_type="application/vnd.apple.mpegurl",
+                    headers={
+                        "Access-Control-Allow-Origin": "*",
+                        "Access-Control-Allow-Headers": "*",
+                        "Cache-Control": "no-cache",
+                    })
+
 
 @app.get("/proxy_stream")
-async def proxy_stream(url: str, request: Request, referer: str = None, origin: str = None):
-    import re as _re
-    from urllib.parse import urljoin, urlencode
+async def proxy_stream(request: Request, url: str = None, referer: str = None, origin: str = None,
+                       t: str = None):
     from starlette.background import BackgroundTask
 
-    headers = { "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36" }
+    # Rewritten manifests reference sub-resources by token; the full
+    # ?url=&referer=&origin= form stays supported for the player's entry URLs.
+    if t:
+        target = _proxy_tokens.resolve(t)
+        if target is None:
+            return Response(content="Unknown or expired proxy token", status_code=410,
+                            headers={"Access-Control-Allow-Origin": "*"})
+        url, referer, origin = target
+    if not url:
+        return Response(content="Missing url", status_code=400,
+                        headers={"Access-Control-Allow-Origin": "*"})
+
+    headers = {"User-Agent": _PROXY_UA}
     if referer:
         headers["Referer"] = referer
     if origin:
@@ -748,29 +788,108 @@ async def proxy_stream(url: str, request: Request, referer: str = None, origin:
     # would corrupt manifests and break Content-Length on segments.
     headers["Accept-Encoding"] = "identity"
 
-    def _make_proxy_url(raw_url: str) -> str:
-        """Build a /proxy_stream URL preserving referer/origin."""
-        abs_url = urljoin(url, raw_url)
-        pp = {"url": abs_url}
-        if referer: pp["referer"] = referer
-        if origin:  pp["origin"] = origin
-        return f"/proxy_stream?{urlencode(pp)}"
-
-    def _rewrite_uri_attr(line_text: str) -> str:
-        """Rewrite all URI=\"...\" attributes in an HLS tag line."""
-        def _replace(m):
-            return f'URI="{_make_proxy_url(m.group(1))}"'
-        return _re.sub(r'URI="([^"]+)"', _replace, line_text)
-
     is_manifest_ext = url.split("?")[0].rstrip("/").endswith((".m3u8", ".m3u"))
+    manifest_key = (url, referer, origin)
+    fetch_headers = {k: v for k, v in headers.items() if k != "Range"}
+
+    if not client_range:
+        cached = _manifest_cache.get(manifest_key)
+        if cached is not None:
+            _proxy_tokens.retain(cached.issued)
+            if cached.variants:
+                _failover.add_master(url, cached.variants, cached.codecs)
+            if cached.segments:
+                _segment_index.register(url, cached.segments, cached.durations, fetch_headers, cached.decode)
+            return _manifest_response(cached.body)
 
     client = _get_proxy_client()
+
+    # Known HLS segment: serve from the read-ahead cache, or join a prefetch
+    # already in flight, and warm the segments after it. Ranges are answered
+    # with a memoryview slice of the cached body — no copy.
+    known_segment = None
+    if not is_manifest_ext:
+        known_segment = _read_ahead.on_request(client, url)
+        if known_segment is not None:
+            hit = await _read_ahead.lookup(url)
+            span = parse_range(client_range, len(hit[0])) if hit is not None else None
+            if span is not None:
+                body, ctype = hit
+                start, end = span
+                seg_headers = {
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Headers": "*",
+                    "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges",
+                    "Accept-Ranges": "bytes",
+                }
+                if client_range:
+                    seg_headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+                return Response(content=memoryview(body)[start:end + 1],
+                                status_code=206 if client_range else 200,
+                                media_type=ctype or None, headers=seg_headers)
+
+    # MP4 file we've already seen: serve the Range from the sparse disk cache.
+    if known_segment is None and not is_manifest_ext:
+        entry = await _range_cache.get(url)
+        span = parse_range(client_range, entry.size) if entry is not None else None
+        if span is not None:
+            start, end = span
+            resp_headers = {
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Headers": "*",
+                "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges",
+                "Accept-Ranges": "bytes",
+                "Content-Length": str(end - start + 1),
+            }
+            if client_range:
+                resp_headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
+            status = 206 if client_range else 200
+            # Fully on disk: sendfile / pread straight from the sparse file.
+            held = _range_cache.serve_held(entry, start, end, status_code=status,
+                                           headers=resp_headers)
+            if held is not None:
+                return held
+            try:
+                slot = await _fair_share.acquire(_proxy_client_id(request))
+            except OverLimit as e:
+                return _over_limit_response(e)
+            return StreamingResponse(
+                _fair_share.meter(slot, _range_cache.stream(entry, start, end, client, fetch_headers)),
+                status_code=status,
+                media_type=entry.content_type or None,
+                headers=resp_headers,
+                background=BackgroundTask(slot.release),
+            )
+
     try:
-        req = client.build_request("GET", url, headers=headers)
-        resp = await client.send(req, stream=True)
-    except Exception as e:
-        logging.error(f"[proxy_stream] Failed to fetch {url}: {e}")
-        return Response(content=f"Proxy fetch error: {e}", status_code=502,
+        slot = await _fair_share.acquire(_proxy_client_id(request))
+    except OverLimit as e:
+        return _over_limit_response(e)
+    fetch_started = _t.monotonic()
+    resp = fetch_error = None
+    failed_over = False
+    # Segment on a host that's cooling down: go straight to an equivalent.
+    if known_segment is not None and _host_health.degraded(url):
+        resp = await _segment_failover(client, known_segment, url, client_range)
+        failed_over = resp is not None
+    if resp is None:
+        try:
+            req = client.build_request("GET", url, headers=headers,
+                                       timeout=_SEGMENT_TIMEOUT if known_segment is not None else None)
+            resp = await client.send(req, stream=True)
+        except Exception as e:
+            fetch_error = e
+        if known_segment is not None and (fetch_error is not None or resp.status_code in FAILOVER_STATUSES):
+            _host_health.mark(url)
+            alt = await _segment_failover(client, known_segment, url, client_range)
+            if alt is not None:
+                if resp is not None:
+                    await resp.aclose()
+                resp, fetch_error, failed_over = alt, None, True
+    if fetch_error is not None:
+        slot.release()
+        logging.error(f"[proxy_stream] Failed to fetch {url}: {fetch_error}")
+        return Response(content=f"Proxy fetch error: {fetch_error}", status_code=502,
                         headers={"Access-Control-Allow-Origin": "*"})
 
     content_type = resp.headers.get("content-type", "").lower()
@@ -779,26 +898,28 @@ async def proxy_stream(url: str, request: Request, referer: str = None, origin:
     if is_manifest:
         # Small text body — read it fully (httpx decompresses), rewrite every sub-URL.
         try:
-            text = (await resp.aread()).decode("utf-8", errors="replace")
+            raw = await resp.aread()
+            _fair_share.account(slot.client_id, len(raw))
+            text = raw.decode("utf-8", errors="replace")
         finally:
             await resp.aclose()
-        rewritten = []
-        for line in text.split("\n"):
-            stripped = line.strip()
-            if not stripped:
-                rewritten.append(line)
-            elif not stripped.startswith("#"):
-                rewritten.append(_make_proxy_url(stripped))
-            elif 'URI="' in stripped:
-                rewritten.append(_rewrite_uri_attr(stripped))
-            else:
-                rewritten.append(line)
-        return Response(content="\n".join(rewritten), media_type="application/vnd.apple.mpegurl",
-                        headers={
-                            "Access-Control-Allow-Origin": "*",
-                            "Access-Control-Allow-Headers": "*",
-                            "Cache-Control": "no-cache",
-                        })
+            slot.release()
+        issued = []
+
+        def _proxify(target_url: str) -> str:
+            token = _proxy_tokens.issue(target_url, referer, origin)
+            issued.append((token, (target_url, referer, origin)))
+            return f"/proxy_stream?t={token}"
+
+        playlist = rewrite_playlist(text, url, _proxify)
+        playlist.issued = issued
+        if playlist.variants:
+            _failover.add_master(url, playlist.variants, playlist.codecs)
+        if playlist.segments:
+            _segment_index.register(url, playlist.segments, playlist.durations, fetch_headers, playlist.decode)
+        if playlist.cacheable and resp.status_code == 200:
+            _manifest_cache.put(manifest_key, playlist)
+        return _manifest_response(playlist.body)
 
     # Binary segment / MP4 — zero-buffer streaming passthrough (no RAM blow-up),
     # preserving status (206 for Range) and the byte-range headers for seeking.
@@ -813,14 +934,40 @@ async def proxy_stream(url: str, request: Request, referer: str = None, origin:
     if "content-range" in resp.headers:
         resp_headers["Content-Range"] = resp.headers["content-range"]
 
+    body_iter = resp.aiter_raw()
+    if (known_segment is not None and not failed_over and resp.status_code == 200
+            and not resp.headers.get("content-encoding")):
+        body_iter = _tee_into_read_ahead(body_iter, url, resp.headers.get("content-type", ""),
+                                         fetch_started)
+    elif known_segment is None and not resp.headers.get("content-encoding"):
+        span = response_span(resp)
+        if span is not None and span[1] >= MIN_FILE_BYTES:
+            entry = await _range_cache.create(url, span[1], resp.headers.get("content-type", ""))
+            body_iter = _range_cache.tee(entry, span[0], body_iter)
+
+    async def _close():
+        slot.release()
+        await resp.aclose()
+
     return StreamingResponse(
-        resp.aiter_raw(),
+        _fair_share.meter(slot, body_iter),
         status_code=resp.status_code,
         media_type=resp.headers.get("content-type"),
         headers=resp_headers,
-        background=BackgroundTask(resp.aclose),
+        background=BackgroundTask(_close),
     )
 
+async def _tee_into_read_ahead(chunks, url: str, content_type: str, started: float):
+    """Stream a segment to the client while keeping a copy for the read-ahead
+    cache — a cache miss still costs only one upstream fetch."""
+    buf = bytearray()
+    async for chunk in chunks:
+        if len(buf) <= MAX_SEGMENT_BYTES:
+            buf += chunk
+        yield chunk
+    if len(buf) <= MAX_SEGMENT_BYTES:
+        _read_ahead.store(url, bytes(buf), content_type, _t.monotonic() - started)
+
 @app.options("/proxy_stream")
 async def proxy_stream_options():
     """Handle CORS preflight for proxy requests."""
@@ -834,100 +981,79 @@ async def proxy_stream_options():
         },
     )
 
+@app.get("/admin/proxy_stats")
+def get_proxy_stats(request: Request):
+    """Per-upstream-host connection/throughput stats and slot usage. Always
+    requires ADMIN_TRIGGER_TOKEN in X-ADMIN-TOKEN (403 if unset or wrong)."""
+    token = os.getenv('ADMIN_TRIGGER_TOKEN')
+    header = request.headers.get('X-ADMIN-TOKEN') or ''
+    if not token or not hmac.compare_digest(header, token):
+        raise HTTPException(status_code=403, detail="forbidden")
+    return {
+        "upstream": _PROXY_TRANSPORT.stats() if _PROXY_TRANSPORT is not None else {},
+        "clients": _fair_share.stats(),
+        "segment_cache_bytes": _read_ahead.cache.size,
+        "range_cache_bytes": _range_cache.usage(),
+    }
+
+# Subtitles are fetched once, decoded + converted to WebVTT, and kept on disk
+# content-addressed; the digest is the ETag (see src/api/subtitle_cache.py).
+_subtitle_cache = SubtitleCache()
+_SUBTITLE_TYPES = {"vtt": "text/vtt; charset=utf-8", "txt": "text/plain; charset=utf-8"}
+
+def _subtitle_response(request: Request, digest: str, ext: str, body: bytes) -> Response:
+    headers = {
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Headers": "*",
+        "Access-Control-Expose-Headers": "ETag",
+        "Cache-Control": "public, max-age=86400",
+        "ETag": f'"{digest}"',
+    }
+    if f'"{digest}"' in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=_SUBTITLE_TYPES[ext], headers=headers)
+
 @app.get("/proxy_subtitle")
-async def proxy_subtitle(url: str):
-    """Proxy subtitle files to avoid CORS issues. Returns raw subtitle text."""
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+async def proxy_subtitle(request: Request, url: str):
+    """Proxy subtitle files to avoid CORS issues. SRT is converted to WebVTT;
+    other formats are returned as decoded text. Cache file I/O runs on a
+    worker thread."""
+    known = await anyio.to_thread.run_sync(_subtitle_cache.read, url)
+    if known is not None:
+        return _subtitle_response(request, *known)
+
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=15.0) as client:
-            r = await client.get(url, headers=headers)
-            content = r.content
-            # OpenSubtitles (and some hosts) serve gzipped .srt — decompress.
-            if content[:2] == b"\x1f\x8b":
-                import gzip as _gz
-                try:
-                    content = _gz.decompress(content)
-                except Exception:
-                    pass
-            # Try to decode as text
-            try:
-                text = content.decode("utf-8")
-            except UnicodeDecodeError:
-                try:
-                    text = content.decode("latin-1")
-                except Exception:
-                    text = content.decode("utf-8", errors="replace")
-            return Response(
-                content=text,
-                media_type="text/plain; charset=utf-8",
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Headers": "*",
-                    "Cache-Control": "public, max-age=86400",
-                },
-            )
+        r = await _get_proxy_client().get(url, headers={"User-Agent": _PROXY_UA}, timeout=15.0)
+        r.raise_for_status()
     except Exception as e:
         logging.error(f"[proxy_subtitle] Failed to fetch {url}: {e}")
         return Response(content=f"Subtitle fetch error: {e}", status_code=502,
                         headers={"Access-Control-Allow-Origin": "*"})
 
+    # OpenSubtitles (and some hosts) serve gzipped .srt — decode_subtitle gunzips.
+    text = decode_subtitle(r.content)
+    vtt = srt_to_vtt(text)
+    ext = "vtt" if vtt is not None else "txt"
+    body = (vtt if vtt is not None else text).encode("utf-8")
+    digest = await anyio.to_thread.run_sync(_subtitle_cache.store, url, body, ext)
+    return _subtitle_response(request, digest, ext, body)
+
+# Subtitle search: persistent tmdb->imdb memo, TTL'd results, and a shared
+# in-flight search that /stream starts early (see src/api/subtitle_search.py).
+_subtitle_search = SubtitleSearch(_get_proxy_client, tmdb)
+
+
+@app.on_event("shutdown")
+async def flush_imdb_memo():
+    await _subtitle_search.memo.flush()
+
 @app.get("/subtitles/{media_type}/{tmdb_id}")
 async def get_subtitles(media_type: str, tmdb_id: int, season: int = 1, episode: int = 1):
     """Keyless, unlimited subtitle search via the legacy OpenSubtitles REST API
     (rest.opensubtitles.org — no API key, no daily quota). Covers movies + TV.
     Returns a normalized list using the player's caption shape; each `url` points
     at /proxy_subtitle (which gunzips the OpenSubtitles .gz transparently)."""
-    from urllib.parse import quote as _q
-
-    # Resolve IMDb id from TMDB (the legacy API is imdb-keyed)
-    imdb_id = None
-    if TMDB_API_KEY:
-        try:
-            ep = "movie" if media_type == "movie" else "tv"
-            r = requests.get(
-                f"https://api.themoviedb.org/3/{ep}/{tmdb_id}"
-                f"?api_key={TMDB_API_KEY}&append_to_response=external_ids", timeout=5)
-            if r.ok:
-                d = r.json()
-                imdb_id = d.get("imdb_id") or (d.get("external_ids") or {}).get("imdb_id")
-        except Exception:
-            pass
-    if not imdb_id:
-        return []
-
-    num = imdb_id[2:] if imdb_id.startswith("tt") else imdb_id
-    if media_type == "movie":
-        path = f"/search/imdbid-{num}"
-    else:
-        path = f"/search/episode-{episode}/imdbid-{num}/season-{season}"
-
-    try:
-        async with httpx.AsyncClient(timeout=15.0, follow_redirects=True) as client:
-            resp = await client.get(f"https://rest.opensubtitles.org{path}",
-                                    headers={"User-Agent": "Nautilus v1"})
-        data = resp.json() if resp.status_code == 200 else []
-    except Exception as e:
-        logging.error(f"[subtitles] {e}")
-        return []
-
-    out = []
-    for s in (data if isinstance(data, list) else []):
-        dl = s.get("SubDownloadLink")
-        if not dl:
-            continue
-        fmt = (s.get("SubFormat") or "srt").lower()
-        out.append({
-            "url": f"/proxy_subtitle?url={_q(dl, safe='')}",
-            "lang": (s.get("ISO639") or (s.get("SubLanguageID") or "")[:2] or "en"),
-            "format": "vtt" if fmt == "vtt" else "srt",
-            "display": s.get("LanguageName") or s.get("SubLanguageID") or "Unknown",
-            "hearing_impaired": s.get("SubHearingImpaired") == "1",
-            "downloads": int(s.get("SubDownloadsCnt") or 0),
-            "source": "opensubtitles",
-        })
-    # Most-downloaded first (best quality/sync), cap the payload.
-    out.sort(key=lambda x: -x["downloads"])
-    return out[:60]
+    return await _subtitle_search.search(media_type, tmdb_id, season, episode)
 
 
 class ProgressInput(BaseModel):
@@ -940,13 +1066,18 @@ class ProgressInput(BaseModel):
     duration_seconds: float = 0
 
 
+async def _first(db: AsyncSession, stmt):
+    """``Query.first()`` for the async endpoints."""
+    return (await db.scalars(stmt.limit(1))).first()
+
+
 @app.post("/progress")
-def save_progress(p: ProgressInput, db: Session = Depends(get_db)):
+async def save_progress(p: ProgressInput, db: AsyncSession = Depends(get_async_db)):
     """Upsert watch progress (server-backed, keyed by guest id)."""
     pct = (p.position_seconds / p.duration_seconds * 100.0) if p.duration_seconds else 0.0
-    row = db.query(models.WatchProgress).filter_by(
+    row = await _first(db, select(models.WatchProgress).filter_by(
         guest_id=p.guest_id, media_type=p.media_type, tmdb_id=p.tmdb_id,
-        season=p.season, episode=p.episode).first()
+        season=p.season, episode=p.episode))
     if row:
         row.position_seconds = p.position_seconds
         row.duration_seconds = p.duration_seconds
@@ -957,23 +1088,23 @@ def save_progress(p: ProgressInput, db: Session = Depends(get_db)):
             season=p.season, episode=p.episode, position_seconds=p.position_seconds,
             duration_seconds=p.duration_seconds, percentage=pct))
     try:
-        db.commit()
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
     return {"ok": True, "percentage": round(pct, 1)}
 
 
 @app.get("/progress/{guest_id}")
-def get_all_progress(guest_id: str, db: Session = Depends(get_db)):
-    rows = (db.query(models.WatchProgress)
-            .filter_by(guest_id=guest_id)
-            .order_by(models.WatchProgress.updated_at.desc()).all())
+async def get_all_progress(guest_id: str, db: AsyncSession = Depends(get_async_db)):
+    rows = await db.scalars(select(models.WatchProgress)
+                            .filter_by(guest_id=guest_id)
+                            .order_by(models.WatchProgress.updated_at.desc()))
     return [jsonable_encoder(r) for r in rows]
 
 
 @app.get("/progress/{guest_id}/{tmdb_id}")
-def get_item_progress(guest_id: str, tmdb_id: int, db: Session = Depends(get_db)):
-    rows = db.query(models.WatchProgress).filter_by(guest_id=guest_id, tmdb_id=tmdb_id).all()
+async def get_item_progress(guest_id: str, tmdb_id: int, db: AsyncSession = Depends(get_async_db)):
+    rows = await db.scalars(select(models.WatchProgress).filter_by(guest_id=guest_id, tmdb_id=tmdb_id))
     return [jsonable_encoder(r) for r in rows]
 
 
@@ -985,178 +1116,126 @@ async def upload_avatar(file: UploadFile = File(...)):
         shutil.copyfileobj(file.file, buffer)
     return {"info": f"Avatar updated: {file.filename}"}
 
+# Concurrent, cached TMDB discover paging (see src/api/discover.py).
+_discover = Discover(tmdb)
+
 def _tmdb_discover(media, genre, year, sort, skip, limit):
     """Accurate genre/year browsing via TMDB discover — the DB's release dates are
     sparse, so filtering there misses most titles. Returns frontend-shaped dicts,
     or None if TMDB is unavailable."""
     if not TMDB_API_KEY:
         return None
-    if media == 'movie':
-        sort_map = {'title': 'title.asc', 'year': 'primary_release_date.desc',
-                    'rating': 'vote_average.desc', 'popularity': 'popularity.desc'}
-        year_param = 'primary_release_year'
-    else:
-        sort_map = {'title': 'name.asc', 'year': 'first_air_date.desc',
-                    'rating': 'vote_average.desc', 'popularity': 'popularity.desc'}
-        year_param = 'first_air_date_year'
-    tmdb_sort = sort_map.get(sort, 'popularity.desc')
-    out = []
-    max_pages = min(((skip + limit) // 20) + 2, 12)
     try:
-        for pg in range(1, max_pages + 1):
-            params = {'api_key': TMDB_API_KEY, 'sort_by': tmdb_sort, 'page': pg,
-                      'language': 'en-US', 'vote_count.gte': 10}
-            if genre:
-                params['with_genres'] = genre
-            if year:
-                params[year_param] = year
-            r = requests.get(f"{TMDB_BASE_URL}/discover/{media}", params=params, timeout=8)
-            if r.status_code != 200:
-                break
-            results = r.json().get('results', [])
-            if not results:
-                break
-            for it in results:
-                if not it.get('poster_path'):
-                    continue
-                if media == 'movie':
-                    out.append({'tmdb_id': it.get('id'), 'title': it.get('title', ''),
-                                'poster_path': it.get('poster_path'), 'overview': it.get('overview', ''),
-                                'release_date': it.get('release_date', ''),
-                                'popularity_score': it.get('popularity', 0), 'media_type': 'movie'})
-                else:
-                    out.append({'tmdb_id': it.get('id'), 'name': it.get('name', ''), 'title': it.get('name', ''),
-                                'poster_path': it.get('poster_path'), 'overview': it.get('overview', ''),
-                                'first_air_date': it.get('first_air_date', ''),
-                                'popularity_score': it.get('popularity', 0), 'media_type': 'tv'})
-            if len(out) >= skip + limit:
-                break
+        return _discover.items(media, _discover.params(media, genre, year, sort, **{'vote_count.gte': 10}),
+                               skip, limit)
     except Exception as e:
         print(f"TMDB discover error: {e}")
-    return out[skip:skip + limit]
+        return []
+
+
+def _with_genre(model, media_type, *genre_ids):
+    """Filter ``model`` rows to any of ``genre_ids`` through the indexed title_genres table."""
+    TG = models.TitleGenre
+    return model.id.in_(select(TG.title_id).where(TG.media_type == media_type, TG.genre_id.in_(genre_ids)))
+
+
+def _genre_indexed(db, media_type, genre_id):
+    TG = models.TitleGenre
+    return db.query(TG.title_id).filter(TG.media_type == media_type, TG.genre_id == genre_id).first() is not None
+
+
+def _catalog_page(response, q, model, sort, limit, skip, cursor):
+    """Keyset page of ``q`` (src/core/pagination.py); the next page's cursor
+    goes out in the X-Next-Cursor header so the body stays a plain list."""
+    try:
+        rows = _pagination.page(q, model, sort, limit, skip, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    token = _pagination.next_cursor(model, sort, rows, limit)
+    if token and response is not None:
+        response.headers["X-Next-Cursor"] = token
+    return rows
 
 
 @app.get("/movies")
 def get_movies(skip: int = 0, limit: int = 50, genre: int = None, sort: str = "popularity",
-               year: int = None, db: Session = Depends(get_db)):
-    """List movies with optional genre, year, and sort filters."""
-    if year:
+               year: int = None, cursor: str = None, db: Session = Depends(get_db),
+               response: Response = None):
+    """List movies with optional genre, year, and sort filters.
+
+    Pass the previous response's X-Next-Cursor header as ``cursor`` to page
+    at constant cost; ``skip`` keeps working for offset clients."""
+    if year and cursor is None:
         disc = _tmdb_discover('movie', genre, year, sort, skip, limit)
         if disc is not None:
             return disc
     q = db.query(models.Movie)
+    if genre:
+        q = q.filter(_with_genre(models.Movie, 'movie', genre))
+    if year:
+        # Titles without a release date stay in, as before.
+        q = q.filter(or_(models.Movie.release_date.is_(None),
+                         models.Movie.release_date.between(f"{year}-01-01", f"{year}-12-31")))
+    movies = _catalog_page(response, q, models.Movie, sort, limit, skip, cursor)
 
-    # Sort
-    if sort == "title":
-        q = q.order_by(models.Movie.title.asc())
-    elif sort == "year":
-        q = q.order_by(models.Movie.release_date.desc())
-    elif sort == "rating":
-        q = q.order_by(models.Movie.popularity_score.desc())  # best proxy
-    else:  # popularity (default)
-        q = q.order_by(models.Movie.popularity_score.desc())
-
-    candidates = q.limit(3000).all()
-
-    # Filter by genre + year in Python (DB genres may be None/unsupported JSON)
-    filtered = []
-    for m in candidates:
-        if genre:
-            ids = genre_id_set(m.genres)
-            if genre not in ids:
-                continue
-        if year and m.release_date:
-            try:
-                if not m.release_date.startswith(str(year)):
-                    continue
-            except Exception:
-                continue
-        filtered.append(m)
-
-    # If genre filter returned nothing, try TMDB discover
-    if genre and not filtered and TMDB_API_KEY:
+    # If the DB has nothing in this genre at all, try TMDB discover
+    if genre and not movies and TMDB_API_KEY and not _genre_indexed(db, 'movie', genre):
         try:
-            page_num = (skip // limit) + 1
-            tmdb_sort = "popularity.desc"
-            if sort == "title": tmdb_sort = "title.asc"
-            elif sort == "year": tmdb_sort = "primary_release_date.desc"
-            elif sort == "rating": tmdb_sort = "vote_average.desc"
-            url = f"{TMDB_BASE_URL}/discover/movie?api_key={TMDB_API_KEY}&with_genres={genre}&sort_by={tmdb_sort}&page={page_num}&language=en-US"
-            if year:
-                url += f"&primary_release_year={year}"
-            resp = requests.get(url, timeout=8)
-            if resp.status_code == 200:
-                for item in resp.json().get("results", []):
-                    filtered.append({
-                        "tmdb_id": item.get("id"), "title": item.get("title", ""),
-                        "poster_path": item.get("poster_path"),
-                        "overview": item.get("overview", ""),
-                        "release_date": item.get("release_date", ""),
-                        "popularity_score": item.get("popularity", 0),
-                        "media_type": "movie"
-                    })
+            return _discover.items('movie', _discover.params('movie', genre, year, sort),
+                                   skip, limit, require_poster=False) or []
         except Exception as e:
             print(f"TMDB discover fallback error: {e}")
 
-    return filtered[skip:skip + limit]
+    return movies
 
 
 @app.get("/movies/new_releases")
 @_ttl_cache(1800)
 def api_movies_new_releases(days: int = 60, limit: int = 50, db: Session = Depends(get_db)):
     """Return movies released within the last `days`. No hard cap on returned count except `limit`."""
-    from datetime import datetime as _dt
-    cutoff = (_dt.utcnow() - timedelta(days=days)).date()
-    # Fetch recent movies by release_date descending (strings expected 'YYYY-MM-DD')
-    candidates = db.query(models.Movie).filter(models.Movie.release_date.isnot(None)).order_by(models.Movie.release_date.desc()).limit(2000).all()
-    out = []
-    for m in candidates:
-        try:
-            rd = m.release_date
-            if not rd:
-                continue
-            d = _dt.fromisoformat(rd).date()
-            if d <= _dt.utcnow().date() and d >= cutoff:
-                out.append(m)
-        except Exception:
-            continue
-        if len(out) >= limit:
-            break
-    return out
+    today = datetime.utcnow().date()
+    # Index range scan on release_date
+    return (db.query(models.Movie)
+            .filter(models.Movie.release_date.between(today - timedelta(days=days), today))
+            .order_by(models.Movie.release_date.desc()).limit(limit).all())
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _movies_by_tmdb_id(db, tmdb_ids):
+    """tmdb_id -> Movie for the given ids (ints or numeric strings) in one IN query."""
+    ids = {i for i in map(_as_int, tmdb_ids) if i is not None}
+    if not ids:
+        return {}
+    return {m.tmdb_id: m for m in db.query(models.Movie).filter(models.Movie.tmdb_id.in_(ids))}
 
 
 @app.get("/movies/top_rated_alltime")
 @_ttl_cache(3600)
 def api_movies_top_rated(limit: int = 50, skip: int = 0, min_votes: int = 5, db: Session = Depends(get_db)):
-    """Return all-time top rated movies. Prefer DB Interaction averages; fallback to MovieLens raw ratings files if needed."""
-    # 1) Try DB interactions
-    q = db.query(
-        models.Movie.id,
-        models.Movie.title,
-        models.Movie.tmdb_id,
-        func.avg(models.Interaction.rating_value).label('avg_rating'),
-        func.count(models.Interaction.id).label('vote_count')
-    ).join(models.Interaction, models.Interaction.movie_id == models.Movie.id).group_by(models.Movie.id).having(func.count(models.Interaction.id) >= min_votes).order_by(func.avg(models.Interaction.rating_value).desc()).offset(skip).limit(limit).all()
+    """Return all-time top rated movies. Prefer DB rating aggregates; fallback to MovieLens raw ratings files if needed."""
+    # 1) Try DB ratings (title_rating_stats, ranked by Bayesian weighted score)
+    q = _ratings.top(db, models.Movie, 'movie', min_votes=min_votes, skip=skip, limit=limit)
 
     # If DB has a healthy number of rated movies, prefer that (site-specific ratings)
     MIN_ACCEPTABLE_DB_RESULTS = 10
     if q and len(q) >= MIN_ACCEPTABLE_DB_RESULTS:
-        # Return Movie objects joined with stats
-        out = []
-        for row in q:
-            m = db.query(models.Movie).filter(models.Movie.id == row.id).first()
-            data = {
-                'title': row.title,
-                'tmdb_id': row.tmdb_id,
-                'avg_rating': float(row.avg_rating),
-                'vote_count': int(row.vote_count),
-                'poster_path': m.poster_path if m else None,
-                'release_date': m.release_date if m else None,
-                'popularity_score': m.popularity_score if m else None,
-                'overview': m.overview if m else None
-            }
-            out.append(data)
-        return out
+        return [{
+            'title': m.title,
+            'tmdb_id': m.tmdb_id,
+            'avg_rating': float(st.avg_rating),
+            'vote_count': int(st.rating_count),
+            'weighted_score': st.weighted_score,
+            'poster_path': m.poster_path,
+            'release_date': m.release_date,
+            'popularity_score': m.popularity_score,
+            'overview': m.overview
+        } for m, st in q]
 
     # If DB ratings are sparse (few movies), fall back to MovieLens historical ratings
     # so we can surface all-time classics rather than site-specific popular items.
@@ -1168,20 +1247,14 @@ def api_movies_top_rated(limit: int = 50, skip: int = 0, min_votes: int = 5, db:
             try:
                 payload = json.loads(cache_path.read_text(encoding='utf-8'))
                 items = payload.get('items', [])[skip:skip+limit]
+                by_tmdb = _movies_by_tmdb_id(db, [it.get('tmdb_id') for it in items])
                 cached_out = []
                 for it in items:
                     tmdb = it.get('tmdb_id')
                     avg = it.get('avg_rating')
                     cnt = it.get('vote_count')
                     title = it.get('title')
-                    m = None
-                    if tmdb:
-                        # tmdb ids in cache may be strings; try to coerce
-                        try:
-                            tid = int(tmdb)
-                        except Exception:
-                            tid = tmdb
-                        m = db.query(models.Movie).filter(models.Movie.tmdb_id == tid).first()
+                    m = by_tmdb.get(_as_int(tmdb))
 
                     rec = {
                         'title': title if title else (m.title if m else None),
@@ -1203,7 +1276,6 @@ def api_movies_top_rated(limit: int = 50, skip: int = 0, min_votes: int = 5, db:
 
     # 2) Fallback to MovieLens ratings files (streaming CSV) if present
     import csv
-    import glob
     links_paths = glob.glob('data/raw/**/links.csv', recursive=True)
     ratings_paths = glob.glob('data/raw/**/ratings.csv', recursive=True)
     if not links_paths or not ratings_paths:
@@ -1263,8 +1335,10 @@ def api_movies_top_rated(limit: int = 50, skip: int = 0, min_votes: int = 5, db:
 
 
     out = []
-    for tmdb, avg, cnt in avg_list[skip:skip+limit]:
-        m = db.query(models.Movie).filter(models.Movie.tmdb_id == tmdb).first()
+    page = avg_list[skip:skip+limit]
+    by_tmdb = _movies_by_tmdb_id(db, [tmdb for tmdb, _, _ in page])
+    for tmdb, avg, cnt in page:
+        m = by_tmdb.get(tmdb)
         if m:
             out.append({'title': m.title, 'tmdb_id': tmdb, 'avg_rating': float(avg), 'vote_count': int(cnt), 'poster_path': m.poster_path, 'release_date': m.release_date, 'popularity_score': m.popularity_score, 'overview': m.overview})
 
@@ -1279,55 +1353,30 @@ def api_movies_top_rated(limit: int = 50, skip: int = 0, min_votes: int = 5, db:
 
 @app.get("/shows")
 def get_shows(skip: int = 0, limit: int = 50, genre: int = None, sort: str = "popularity",
-              year: int = None, db: Session = Depends(get_db)):
-    """List TV shows with optional genre, year, and sort filters."""
-    if year:
+              year: int = None, cursor: str = None, db: Session = Depends(get_db),
+              response: Response = None):
+    """List TV shows with optional genre, year, and sort filters (paged like /movies)."""
+    if year and cursor is None:
         disc = _tmdb_discover('tv', genre, year, sort, skip, limit)
         if disc is not None:
             return disc
     q = db.query(models.TVShow)
-
-    if sort == "title":
-        q = q.order_by(models.TVShow.title.asc())
-    elif sort == "year":
-        # TVShow may not have first_air_date column; fall back to popularity
-        q = q.order_by(models.TVShow.popularity_score.desc())
-    elif sort == "rating":
-        q = q.order_by(models.TVShow.popularity_score.desc())
-    else:
-        q = q.order_by(models.TVShow.popularity_score.desc())
-
-    candidates = q.limit(3000).all()
-
-    filtered = []
-    for s in candidates:
-        if genre:
-            ids = genre_id_set(s.genres)
-            if genre not in ids:
-                continue
-        filtered.append(s)
+    if genre:
+        q = q.filter(_with_genre(models.TVShow, 'tv', genre))
+    if year:
+        q = q.filter(or_(models.TVShow.first_air_date.is_(None),
+                         models.TVShow.first_air_date.between(f"{year}-01-01", f"{year}-12-31")))
+    shows = _catalog_page(response, q, models.TVShow, sort, limit, skip, cursor)
 
     # TMDB discover fallback for genre
-    if genre and not filtered and TMDB_API_KEY:
+    if genre and not shows and TMDB_API_KEY and not _genre_indexed(db, 'tv', genre):
         try:
-            page_num = (skip // limit) + 1
-            url = f"{TMDB_BASE_URL}/discover/tv?api_key={TMDB_API_KEY}&with_genres={genre}&sort_by=popularity.desc&page={page_num}&language=en-US"
-            resp = requests.get(url, timeout=8)
-            if resp.status_code == 200:
-                for item in resp.json().get("results", []):
-                    filtered.append({
-                        "tmdb_id": item.get("id"), "name": item.get("name", ""),
-                        "title": item.get("name", ""),
-                        "poster_path": item.get("poster_path"),
-                        "overview": item.get("overview", ""),
-                        "first_air_date": item.get("first_air_date", ""),
-                        "popularity_score": item.get("popularity", 0),
-                        "media_type": "tv"
-                    })
+            return _discover.items('tv', _discover.params('tv', genre, year, sort), skip, limit,
+                                   require_poster=False) or []
         except Exception as e:
             print(f"TMDB discover tv fallback error: {e}")
 
-    return filtered[skip:skip + limit]
+    return shows
 
 @app.get("/shows/{show_id}/seasons")
 def get_seasons(show_id: int, db: Session = Depends(get_db)):
@@ -1357,136 +1406,78 @@ def get_seasons(show_id: int, db: Session = Depends(get_db)):
             season.episodes.sort(key=lambda e: e.episode_number)
         return sorted_seasons
 
-    # If present in DB but no seasons ingested, fetch from TMDB and persist
-    if show and TMDB_API_KEY:
-        try:
-            url = f"{TMDB_BASE_URL}/tv/{show.tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-            resp = requests.get(url, timeout=5)
-            if resp.status_code == 200:
-                data = resp.json()
-            else:
-                data = {}
-        except Exception:
-            data = {}
-
-        for season_meta in data.get("seasons", []):
-            s_num = season_meta.get('season_number')
-            if s_num is None:
-                continue
-            season = models.Season(
-                show_id=show.id,
-                season_number=s_num,
-                name=season_meta.get('name'),
-                air_date=season_meta.get('air_date')
-            )
-            db.add(season)
-            try:
-                db.commit()
-                db.refresh(season)
-            except Exception:
-                db.rollback()
-                continue
-
-            # Fetch episodes for this season
-            try:
-                s_url = f"{TMDB_BASE_URL}/tv/{show.tmdb_id}/season/{s_num}?api_key={TMDB_API_KEY}&language=en-US"
-                s_resp = requests.get(s_url, timeout=5)
-                if s_resp.status_code == 200:
-                    s_data = s_resp.json()
-                else:
-                    s_data = {}
-            except Exception:
-                s_data = {}
-
-            for ep in s_data.get('episodes', []):
-                try:
-                    episode = models.Episode(
-                        season_id=season.id,
-                        episode_number=ep.get('episode_number'),
-                        title=ep.get('name'),
-                        overview=ep.get('overview'),
-                        air_date=ep.get('air_date'),
-                        still_path=ep.get('still_path'),
-                        runtime_minutes=ep.get('runtime')
-                    )
-                    db.add(episode)
-                except Exception:
-                    continue
-            try:
-                db.commit()
-            except Exception:
-                db.rollback()
-
-        try:
-            db.refresh(show)
-        except Exception:
-            pass
-
-        if show.seasons:
-            return sorted(show.seasons, key=lambda s: s.season_number)
-
-    # If show not in DB, fetch directly from TMDB and return structured seasons (no DB writes)
-    if TMDB_API_KEY:
-        try:
-            tmdb_url = f"{TMDB_BASE_URL}/tv/{show_id}?api_key={TMDB_API_KEY}&language=en-US"
-            tmdb_resp = requests.get(tmdb_url, timeout=5)
-            if tmdb_resp.status_code != 200:
-                return []
-            tmdb_data = tmdb_resp.json()
-            seasons_out = []
-            for season_meta in tmdb_data.get('seasons', []):
-                s_num = season_meta.get('season_number')
-                if s_num is None:
-                    continue
-                season_entry = {
-                    'season_number': s_num,
-                    'name': season_meta.get('name'),
-                    'air_date': season_meta.get('air_date'),
-                    'episodes': []
-                }
-                try:
-                    s_url = f"{TMDB_BASE_URL}/tv/{show_id}/season/{s_num}?api_key={TMDB_API_KEY}&language=en-US"
-                    s_resp = requests.get(s_url, timeout=5)
-                    if s_resp.status_code == 200:
-                        s_data = s_resp.json()
-                    else:
-                        s_data = {}
-                except Exception:
-                    s_data = {}
-
-                for ep in s_data.get('episodes', []):
-                    season_entry['episodes'].append({
-                        'episode_number': ep.get('episode_number'),
-                        'title': ep.get('name'),
-                        'overview': ep.get('overview'),
-                        'air_date': ep.get('air_date'),
-                        'runtime_minutes': ep.get('runtime'),
-                        'still_path': ep.get('still_path')
-                    })
-
-                seasons_out.append(season_entry)
-
-            return seasons_out
-        except Exception:
-            return []
+    if not TMDB_API_KEY:
+        return []
+    # Details + seasons in 1-2 TMDB calls (append_to_response), served from the
+    # TMDB cache when the show was opened recently.
+    fetched = tmdb.tv_seasons_sync(show.tmdb_id if show else show_id)
+    if fetched is None:
+        return []
+    details, season_data = fetched
+    seasons_out = []
+    for season_meta in details.get('seasons', []):
+        s_num = season_meta.get('season_number')
+        if s_num is None:
+            continue
+        seasons_out.append({
+            'season_number': s_num,
+            'name': season_meta.get('name'),
+            'air_date': season_meta.get('air_date'),
+            'episodes': [{
+                'episode_number': ep.get('episode_number'),
+                'title': ep.get('name'),
+                'overview': ep.get('overview'),
+                'air_date': ep.get('air_date'),
+                'runtime_minutes': ep.get('runtime'),
+                'still_path': ep.get('still_path')
+            } for ep in season_data.get(s_num, {}).get('episodes', [])]
+        })
 
-    # No DB record path fell through; return empty
-    return []
+    # Show not in DB: return the TMDB structure (no DB writes)
+    if not show:
+        return seasons_out
+
+    # Show in DB without seasons: persist everything in one transaction
+    for col, value in show_dates(details).items():
+        if value:
+            setattr(show, col, value)
+    db.add_all(
+        models.Season(
+            show_id=show.id, season_number=entry['season_number'], name=entry['name'],
+            air_date=entry['air_date'],
+            episodes=[models.Episode(**ep) for ep in entry['episodes'] if ep['episode_number'] is not None]
+        )
+        for entry in seasons_out
+    )
+    try:
+        db.commit()
+    except Exception:
+        # Most likely a concurrent request persisted them first.
+        db.rollback()
+    db.refresh(show)
+    if show.seasons:
+        sorted_seasons = sorted(show.seasons, key=lambda s: s.season_number)
+        for season in sorted_seasons:
+            season.episodes.sort(key=lambda e: e.episode_number)
+        return sorted_seasons
+    return seasons_out
 
 
 @app.get("/shows/new_releases")
 @_ttl_cache(1800)
 def api_shows_new_releases(days: int = 60, limit: int = 50, db: Session = Depends(get_db)):
     """Return shows with episodes aired within the last `days`."""
-    from datetime import datetime as _dt
     try:
-        cutoff = (_dt.utcnow() - timedelta(days=days)).date().isoformat()
-        rows = db.query(models.Season.show_id).join(models.Episode, models.Episode.season_id == models.Season.id).filter(models.Episode.air_date >= cutoff).distinct().all()
-        show_ids = [r[0] for r in rows]
-        if not show_ids:
-            return []
-        shows = db.query(models.TVShow).filter(models.TVShow.id.in_(show_ids)).all()
-        return shows[:limit]
+        today = datetime.utcnow().date()
+        window = (today - timedelta(days=days), today)
+        # last_air_date covers every show; ingested episodes catch ones TMDB
+        # hasn't refreshed yet. Both are index range scans.
+        aired = (select(models.Season.show_id)
+                 .join(models.Episode, models.Episode.season_id == models.Season.id)
+                 .where(models.Episode.air_date.between(*window)))
+        return (db.query(models.TVShow)
+                .filter(or_(models.TVShow.last_air_date.between(*window), models.TVShow.id.in_(aired)))
+                .order_by(models.TVShow.last_air_date.desc().nulls_last()).limit(limit).all())
     except Exception as e:
         print(f"api_shows_new_releases error: {e}")
         return []
@@ -1496,69 +1487,40 @@ def api_shows_new_releases(days: int = 60, limit: int = 50, db: Session = Depend
 @_ttl_cache(3600)
 def api_shows_top_rated(limit: int = 50, skip: int = 0, min_votes: int = 5, db: Session = Depends(get_db)):
     """Top rated shows by user interactions (fallback to popularity)."""
-    q = db.query(
-        models.TVShow.id,
-        models.TVShow.title,
-        models.TVShow.tmdb_id,
-        func.avg(models.Interaction.rating_value).label('avg_rating'),
-        func.count(models.Interaction.id).label('vote_count')
-    ).join(models.Interaction, models.Interaction.tv_show_id == models.TVShow.id).group_by(models.TVShow.id).having(func.count(models.Interaction.id) >= min_votes).order_by(func.avg(models.Interaction.rating_value).desc()).offset(skip).limit(limit).all()
-
-    if q and len(q) > 0:
-        out = []
-        for row in q:
-            s = db.query(models.TVShow).filter(models.TVShow.id == row.id).first()
-            out.append({'title': row.title, 'tmdb_id': row.tmdb_id, 'avg_rating': float(row.avg_rating), 'vote_count': int(row.vote_count), 'poster_path': s.poster_path if s else None, 'popularity_score': s.popularity_score if s else None})
-        return out
+    q = _ratings.top(db, models.TVShow, 'tv', min_votes=min_votes, skip=skip, limit=limit)
+
+    if q:
+        return [{'title': s.title, 'tmdb_id': s.tmdb_id, 'avg_rating': float(st.avg_rating), 'vote_count': int(st.rating_count), 'weighted_score': st.weighted_score, 'poster_path': s.poster_path, 'popularity_score': s.popularity_score} for s, st in q]
 
     # Fallback: popularity
     shows = db.query(models.TVShow).order_by(models.TVShow.popularity_score.desc()).offset(skip).limit(limit).all()
     return [{'title': s.title, 'tmdb_id': s.tmdb_id, 'popularity': s.popularity_score, 'poster_path': s.poster_path} for s in shows]
 
 
+async def _trending(db: AsyncSession, model, col, cutoff, limit: int) -> list:
+    """Most-interacted ``model`` rows since ``cutoff``, topped up by popularity."""
+    counts = await db.execute(
+        select(col, func.count(models.Interaction.id).label("cnt"))
+        .where(col.isnot(None), models.Interaction.timestamp >= cutoff)
+        .group_by(col).order_by(func.count(models.Interaction.id).desc()).limit(limit))
+    ids = [r[0] for r in counts if r[0] is not None]
+    by_id = {m.id: m for m in await db.scalars(select(model).where(model.id.in_(ids)))} if ids else {}
+    # Preserve order
+    ordered = [by_id[i] for i in ids if i in by_id]
+    if len(ordered) < limit:
+        ordered.extend(await db.scalars(
+            select(model).order_by(model.popularity_score.desc()).limit(limit - len(ordered))))
+    return ordered[:limit]
+
+
 @app.get("/trending")
 @_ttl_cache(900)
-def api_trending(days: int = 7, limit: int = 20, db: Session = Depends(get_db)):
+async def api_trending(days: int = 7, limit: int = 20, db: AsyncSession = Depends(get_async_db)):
     """Trending movies/shows based on recent interactions; fallback to popularity."""
-    from datetime import datetime as _dt, timedelta as _td
-    cutoff = _dt.utcnow() - _td(days=days)
-
-    # Movies
-    movie_rows = db.query(
-        models.Interaction.movie_id,
-        func.count(models.Interaction.id).label("cnt")
-    ).filter(
-        models.Interaction.movie_id.isnot(None),
-        models.Interaction.timestamp >= cutoff
-    ).group_by(models.Interaction.movie_id).order_by(func.count(models.Interaction.id).desc()).limit(limit).all()
-    movie_ids = [r[0] for r in movie_rows if r[0] is not None]
-    trending_movies = db.query(models.Movie).filter(models.Movie.id.in_(movie_ids)).all() if movie_ids else []
-    # Preserve order
-    by_id = {m.id: m for m in trending_movies}
-    trending_movies_ordered = [by_id[mid] for mid in movie_ids if mid in by_id]
-    if len(trending_movies_ordered) < limit:
-        extra = db.query(models.Movie).order_by(models.Movie.popularity_score.desc()).limit(limit - len(trending_movies_ordered)).all()
-        trending_movies_ordered.extend(extra)
-
-    # Shows
-    show_rows = db.query(
-        models.Interaction.tv_show_id,
-        func.count(models.Interaction.id).label("cnt")
-    ).filter(
-        models.Interaction.tv_show_id.isnot(None),
-        models.Interaction.timestamp >= cutoff
-    ).group_by(models.Interaction.tv_show_id).order_by(func.count(models.Interaction.id).desc()).limit(limit).all()
-    show_ids = [r[0] for r in show_rows if r[0] is not None]
-    trending_shows = db.query(models.TVShow).filter(models.TVShow.id.in_(show_ids)).all() if show_ids else []
-    by_id_s = {s.id: s for s in trending_shows}
-    trending_shows_ordered = [by_id_s[sid] for sid in show_ids if sid in by_id_s]
-    if len(trending_shows_ordered) < limit:
-        extra_s = db.query(models.TVShow).order_by(models.TVShow.popularity_score.desc()).limit(limit - len(trending_shows_ordered)).all()
-        trending_shows_ordered.extend(extra_s)
-
+    cutoff = datetime.utcnow() - timedelta(days=days)
     return {
-        "movies": trending_movies_ordered[:limit],
-        "shows": trending_shows_ordered[:limit]
+        "movies": await _trending(db, models.Movie, models.Interaction.movie_id, cutoff, limit),
+        "shows": await _trending(db, models.TVShow, models.Interaction.tv_show_id, cutoff, limit),
     }
 
 _NCF_MODEL = None
@@ -1672,17 +1634,8 @@ def get_ai_clusters(db: Session = Depends(get_db)):
     # Trending (reuse /trending logic but movies only)
     trending_movies = db.query(models.Movie).order_by(models.Movie.popularity_score.desc()).limit(30).all()
 
-    # Critics' Picks: top rated by interactions fallback popularity
-    top_rated = db.query(
-        models.Movie.id,
-        func.avg(models.Interaction.rating_value).label('avg_rating'),
-        func.count(models.Interaction.id).label('vote_count')
-    ).join(models.Interaction, models.Interaction.movie_id == models.Movie.id)
-    top_rated = top_rated.group_by(models.Movie.id).having(func.count(models.Interaction.id) >= 3).order_by(func.avg(models.Interaction.rating_value).desc()).limit(50).all()
-    rated_ids = [r.id for r in top_rated]
-    rated_movies = db.query(models.Movie).filter(models.Movie.id.in_(rated_ids)).all() if rated_ids else []
-    rated_by_id = {m.id: m for m in rated_movies}
-    critics = [rated_by_id[mid] for mid in rated_ids if mid in rated_by_id]
+    # Critics' Picks: top weighted rating, fallback popularity
+    critics = [m for m, _ in _ratings.top(db, models.Movie, 'movie', min_votes=3, limit=50)]
     if len(critics) < 30:
         extra = db.query(models.Movie).order_by(models.Movie.popularity_score.desc()).limit(30 - len(critics)).all()
         critics.extend(extra)
@@ -1761,38 +1714,23 @@ def predict_revenue_manual(input_data: RevenueInput, inflation_multiplier: float
         return {"prediction": "Error", "details": str(e)}
 
 @app.get("/movies/random")
-def get_random_movies(limit: int = 20, db: Session = Depends(get_db)):
-    return db.query(models.Movie).order_by(func.random()).limit(limit).all()
+def get_random_movies(limit: int = 20, has_poster: bool = False, min_popularity: float = None,
+                      db: Session = Depends(get_db)):
+    """Random movies, optionally only ones with a poster and/or at least
+    ``min_popularity``. Sampled from an in-memory id pool (src/api/random_pool.py)."""
+    return _random_pool.sample(db, models.Movie, max(0, min(limit, 100)), has_poster, min_popularity)
 
 @app.get("/movies/genre/{genre_id}")
 @_ttl_cache(3600)
 def get_movies_by_genre(genre_id: int, limit: int = 20, db: Session = Depends(get_db)):
-    # Fetch popular movies and filter by genre in Python
-    candidates = db.query(models.Movie).order_by(models.Movie.popularity_score.desc()).limit(500).all()
-    filtered = []
-    for movie in candidates:
-        norm = normalize_genres(movie.genres)
-        if any(g.get("id") == genre_id for g in norm):
-            filtered.append(movie)
-        if len(filtered) >= limit:
-            break
+    filtered = (db.query(models.Movie).filter(_with_genre(models.Movie, 'movie', genre_id))
+                .order_by(models.Movie.popularity_score.desc()).limit(limit).all())
 
     # Fallback: use TMDB discover API if DB returned nothing
     if not filtered and TMDB_API_KEY:
         try:
-            url = f"{TMDB_BASE_URL}/discover/movie?api_key={TMDB_API_KEY}&with_genres={genre_id}&sort_by=popularity.desc&page=1&language=en-US"
-            resp = requests.get(url, timeout=8)
-            if resp.status_code == 200:
-                for item in resp.json().get("results", [])[:limit]:
-                    filtered.append({
-                        "tmdb_id": item.get("id"),
-                        "title": item.get("title", ""),
-                        "poster_path": item.get("poster_path"),
-                        "overview": item.get("overview", ""),
-                        "release_date": item.get("release_date", ""),
-                        "popularity_score": item.get("popularity", 0),
-                        "media_type": "movie"
-                    })
+            filtered = _discover.items('movie', _discover.params('movie', genre_id), 0, limit,
+                                       require_poster=False) or []
         except Exception as e:
             print(f"TMDB discover movie fallback error: {e}")
 
@@ -1804,16 +1742,14 @@ def get_desi_movies(limit: int = 20):
     if not TMDB_API_KEY:
         return []
         
-    url = f"https://api.themoviedb.org/3/discover/movie?api_key={TMDB_API_KEY}&with_original_language=hi|ta|te|ml&sort_by=popularity.desc&page=1"
     try:
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            results = response.json().get('results', [])
-            # Map TMDB result keys to our frontend expectations if needed
-            # Frontend expects: id, title, poster_path, overview, etc.
-            # TMDB returns 'id', 'title', 'poster_path', 'overview', 'genre_ids', 'vote_average'
-            # This matches well enough.
-            return results[:limit]
+        # Frontend expects: id, title, poster_path, overview, etc.
+        # TMDB returns 'id', 'title', 'poster_path', 'overview', 'genre_ids', 'vote_average'
+        # This matches well enough, so the raw results are returned.
+        results = _discover.items('movie', _discover.params('movie', with_original_language='hi|ta|te|ml'),
+                                  0, limit, require_poster=False, raw=True)
+        if results is not None:
+            return results
     except Exception as e:
         print(f"Error fetching Desi movies: {e}")
     return []
@@ -1825,12 +1761,10 @@ class InteractionInput(BaseModel):
     action: str      # 'like', 'watch'
 
 
-def fetch_movie_details(tmdb_id):
-    url = f"{TMDB_BASE_URL}/movie/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-    response = requests.get(url, timeout=10)
-    if response.status_code != 200:
+async def fetch_movie_details(tmdb_id):
+    data = await tmdb.get(f"/movie/{tmdb_id}", {"language": "en-US"})
+    if data is None:
         return None
-    data = response.json()
     return {
         'id': None,  # Let SQLAlchemy autogenerate if needed
         'title': data.get('title'),
@@ -1844,45 +1778,10 @@ def fetch_movie_details(tmdb_id):
     }
 
 # --- Accurate CAM/TS detection via TMDB digital-release dates ---
-# A recent movie is "good-quality available" once it has a Digital (type 4) or
-# Physical (type 5) release whose date has passed; until then a circulating rip
-# is almost certainly a cam/telesync. Checked per-movie, cached for a day.
-_AVAIL_CACHE: dict = {}      # tmdb_id -> (epoch, has_digital: bool)
-_AVAIL_TTL = 86400
-
-async def _movie_has_digital_release(mid: int):
-    now = _t.time()
-    hit = _AVAIL_CACHE.get(mid)
-    if hit and (now - hit[0]) < _AVAIL_TTL:
-        return hit[1]
-    try:
-        client = _get_proxy_client()
-        r = await client.get(
-            f"{TMDB_BASE_URL}/movie/{mid}/release_dates",
-            params={"api_key": TMDB_API_KEY}, timeout=8.0,
-        )
-        if r.status_code != 200:
-            return None
-        has_digital = False
-        for country in r.json().get("results", []):
-            for rel in country.get("release_dates", []):
-                if rel.get("type") in (4, 5):  # 4=Digital, 5=Physical
-                    ds = (rel.get("release_date") or "").replace("Z", "+00:00")
-                    try:
-                        if datetime.fromisoformat(ds).timestamp() <= now:
-                            has_digital = True
-                            break
-                    except Exception:
-                        pass
-            if has_digital:
-                break
-        _AVAIL_CACHE[mid] = (now, has_digital)
-        return has_digital
-    except Exception:
-        return None
+# Backed by the persisted movie_availability table (see src/api/availability.py).
 
 @app.get("/movies/availability")
-async def movies_availability(ids: str):
+def movies_availability(ids: str, db: Session = Depends(get_db)):
     """Given comma-separated TMDB movie ids, return which are likely CAM/TS
     (released theatrically but with no digital/physical release yet). Ids whose
     status can't be determined are NOT flagged."""
@@ -1894,18 +1793,70 @@ async def movies_availability(ids: str):
     id_list = id_list[:80]
     if not id_list:
         return {"cam": []}
-    import asyncio as _asyncio
-    results = await _asyncio.gather(*[_movie_has_digital_release(m) for m in id_list])
-    cam = [m for m, has in zip(id_list, results) if has is False]
-    return {"cam": cam}
+    try:
+        return {"cam": _availability.cam_ids(db, tmdb, id_list)}
+    except Exception as e:
+        print(f"availability lookup failed: {e}")
+        return {"cam": []}
 
+def _availability_refresh_loop(interval_hours: int = 6):
+    import time as _time
+    _time.sleep(30)
+    while True:
+        db = SessionLocal()
+        try:
+            n = _availability.refresh_recent(db, tmdb)
+            print(f"Availability refresh: {n} titles checked")
+        except Exception as e:
+            print(f"availability refresh error: {e}")
+        finally:
+            db.close()
+        _time.sleep(interval_hours * 3600)
 
-def fetch_tv_details(tmdb_id):
-    url = f"{TMDB_BASE_URL}/tv/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-    response = requests.get(url, timeout=10)
-    if response.status_code != 200:
+
+def _rating_reconcile_loop(interval_hours: int = 24):
+    import time as _time
+    _time.sleep(60)
+    while True:
+        db = SessionLocal()
+        try:
+            n = _ratings.reconcile(db)
+            if n:
+                print(f"Rating stats reconcile: repaired {n} rows")
+        except Exception as e:
+            print(f"rating stats reconcile error: {e}")
+        finally:
+            db.close()
+        _time.sleep(interval_hours * 3600)
+
+
+def _suggest_refresh_loop(interval_seconds: int = int(os.getenv("SUGGEST_REFRESH_SECONDS", "60"))):
+    db = SessionLocal()
+    try:
+        print(f"Suggest index: {_suggest.build(db)} titles")
+    except Exception as e:
+        print(f"suggest index build error: {e}")
+    finally:
+        db.close()
+    while True:
+        _suggest_dirty.wait(interval_seconds)
+        _suggest_dirty.clear()
+        db = SessionLocal()
+        try:
+            if _suggest.ready:
+                _suggest.refresh(db)
+            else:
+                _suggest.build(db)
+        except Exception as e:
+            print(f"suggest index refresh error: {e}")
+        finally:
+            db.close()
+
+
+async def fetch_tv_details(tmdb_id):
+    data = await tmdb.get(f"/tv/{tmdb_id}", {"language": "en-US"})
+    if data is None:
         return None
-    data = response.json()
     return {
         'id': None,
         'title': data.get('name'),
@@ -1913,7 +1864,8 @@ def fetch_tv_details(tmdb_id):
         'overview': data.get('overview'),
         'genres': [g['name'] for g in data.get('genres', [])],
         'poster_path': data.get('poster_path'),
-        'popularity_score': data.get('popularity')
+        'popularity_score': data.get('popularity'),
+        **show_dates(data)
     }
 
 
@@ -1927,9 +1879,9 @@ def get_tv_recommendations(tmdb_id: int, limit: int = 14):
     out, seen = [], set()
     try:
         for path in ('recommendations', 'similar'):
-            r = requests.get(f"{TMDB_BASE_URL}/tv/{tmdb_id}/{path}?api_key={TMDB_API_KEY}&language=en-US&page=1", timeout=6)
-            if r.status_code == 200:
-                for s in r.json().get('results', []):
+            data = tmdb.get_sync(f"/tv/{tmdb_id}/{path}", {"language": "en-US", "page": 1})
+            if data:
+                for s in data.get('results', []):
                     sid = s.get('id')
                     if sid in seen or not s.get('poster_path'):
                         continue
@@ -1947,7 +1899,7 @@ def get_tv_recommendations(tmdb_id: int, limit: int = 14):
 
 
 @app.get("/media/{tmdb_id}")
-def get_media_details(tmdb_id: int, media_type: str = None, db: Session = Depends(get_db)):
+async def get_media_details(tmdb_id: int, media_type: str = None, db: AsyncSession = Depends(get_async_db)):
     """Return lightweight media details (overview, poster, release/first_air_date).
     Tries the DB first, falls back to TMDB when an API key is configured.
     """
@@ -1958,16 +1910,15 @@ def get_media_details(tmdb_id: int, media_type: str = None, db: Session = Depend
         # show-page badges need; fall back to the DB row when offline/no key.
         if TMDB_API_KEY:
             try:
-                t = requests.get(f"{TMDB_BASE_URL}/tv/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US", timeout=5)
-                if t.status_code == 200:
-                    td = t.json()
+                td = await tmdb.get(f"/tv/{tmdb_id}", {"language": "en-US"})
+                if td:
                     return {'tmdb_id': td.get('id'), 'media_type': 'tv', 'title': td.get('name'),
                             'overview': td.get('overview'), 'poster_path': td.get('poster_path'),
                             'first_air_date': td.get('first_air_date'), 'last_air_date': td.get('last_air_date'),
                             'vote_average': td.get('vote_average')}
             except Exception:
                 pass
-        show = db.query(models.TVShow).filter(models.TVShow.tmdb_id == tmdb_id).first()
+        show = await _first(db, select(models.TVShow).where(models.TVShow.tmdb_id == tmdb_id))
         if show:
             return {'tmdb_id': show.tmdb_id, 'media_type': 'tv', 'title': show.title,
                     'overview': show.overview, 'poster_path': show.poster_path,
@@ -1975,7 +1926,7 @@ def get_media_details(tmdb_id: int, media_type: str = None, db: Session = Depend
                     'last_air_date': getattr(show, 'last_air_date', None)}
         return {}
 
-    item, type_ = get_media_item(db, tmdb_id)
+    item, type_ = await db.run_sync(get_media_item, tmdb_id)
     if item:
         if type_ == 'movie':
             return {
@@ -2002,10 +1953,8 @@ def get_media_details(tmdb_id: int, media_type: str = None, db: Session = Depend
         return {}
 
     try:
-        m_url = f"{TMDB_BASE_URL}/movie/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-        m_resp = requests.get(m_url, timeout=5)
-        if m_resp.status_code == 200:
-            md = m_resp.json()
+        md = await tmdb.get(f"/movie/{tmdb_id}", {"language": "en-US"})
+        if md:
             return {
                 'tmdb_id': md.get('id'),
                 'media_type': 'movie',
@@ -2018,10 +1967,8 @@ def get_media_details(tmdb_id: int, media_type: str = None, db: Session = Depend
         pass
 
     try:
-        t_url = f"{TMDB_BASE_URL}/tv/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-        t_resp = requests.get(t_url, timeout=5)
-        if t_resp.status_code == 200:
-            td = t_resp.json()
+        td = await tmdb.get(f"/tv/{tmdb_id}", {"language": "en-US"})
+        if td:
             return {
                 'tmdb_id': td.get('id'),
                 'media_type': 'tv',
@@ -2045,11 +1992,10 @@ def get_trailer(tmdb_id: int, media_type: str = "movie"):
 
     base = "tv" if media_type == "tv" else "movie"
     try:
-        url = f"{TMDB_BASE_URL}/{base}/{tmdb_id}/videos?api_key={TMDB_API_KEY}&language=en-US"
-        resp = requests.get(url, timeout=5)
-        if resp.status_code != 200:
+        data = tmdb.get_sync(f"/{base}/{tmdb_id}/videos", {"language": "en-US"})
+        if data is None:
             return {"key": None}
-        results = resp.json().get("results", [])
+        results = data.get("results", [])
         # Prefer official trailers, then teasers, then any video on YouTube
         yt = [v for v in results if v.get("site") == "YouTube"]
         official = [v for v in yt if v.get("type") == "Trailer" and v.get("official")]
@@ -2064,10 +2010,9 @@ def get_trailer(tmdb_id: int, media_type: str = "movie"):
     # If movie not found, try TV (sometimes tmdb_id could be either)
     if base == "movie":
         try:
-            url2 = f"{TMDB_BASE_URL}/tv/{tmdb_id}/videos?api_key={TMDB_API_KEY}&language=en-US"
-            resp2 = requests.get(url2, timeout=5)
-            if resp2.status_code == 200:
-                results2 = resp2.json().get("results", [])
+            data2 = tmdb.get_sync(f"/tv/{tmdb_id}/videos", {"language": "en-US"})
+            if data2:
+                results2 = data2.get("results", [])
                 yt2 = [v for v in results2 if v.get("site") == "YouTube"]
                 pick2 = [v for v in yt2 if v.get("type") == "Trailer"] or yt2
                 if pick2:
@@ -2078,44 +2023,23 @@ def get_trailer(tmdb_id: int, media_type: str = "movie"):
     return {"key": None}
 
 
-# TV genre map (TMDB TV genres that differ from movie genres)
-TMDB_TV_GENRE_MAP = {
-    10759: "Action & Adventure", 16: "Animation", 35: "Comedy", 80: "Crime",
-    99: "Documentary", 18: "Drama", 10751: "Family", 10762: "Kids",
-    9648: "Mystery", 10763: "News", 10764: "Reality", 878: "Sci-Fi & Fantasy",
-    10765: "Sci-Fi & Fantasy", 10766: "Soap", 10767: "Talk", 10768: "War & Politics",
-    37: "Western"
-}
-
 @app.get("/genres/overview")
 def get_genre_overview(db: Session = Depends(get_db)):
     """Return genre list for the Genre Explore page.
     First tries to count from DB. If DB has no genre data, returns
     the static TMDB genre map so the explore page always works."""
-    all_movies = db.query(models.Movie).order_by(models.Movie.popularity_score.desc()).limit(2000).all()
-    all_shows = db.query(models.TVShow).order_by(models.TVShow.popularity_score.desc()).limit(500).all()
-    counts = {}  # genre_id -> {id, name, movies, shows}
-    for m in all_movies:
-        for g in normalize_genres(m.genres):
-            gid = g.get("id")
-            if gid is None:
-                continue
-            if gid not in counts:
-                counts[gid] = {"id": gid, "name": g["name"], "movies": 0, "shows": 0}
-            counts[gid]["movies"] += 1
-    for s in all_shows:
-        for g in normalize_genres(s.genres):
-            gid = g.get("id")
-            if gid is None:
-                continue
-            if gid not in counts:
-                counts[gid] = {"id": gid, "name": g["name"], "movies": 0, "shows": 0}
-            counts[gid]["shows"] += 1
+    TG = models.TitleGenre
+    rows = (db.query(models.Genre.id, models.Genre.name,
+                     func.sum(case((TG.media_type == 'movie', 1), else_=0)),
+                     func.sum(case((TG.media_type == 'tv', 1), else_=0)))
+            .join(TG, TG.genre_id == models.Genre.id)
+            .group_by(models.Genre.id, models.Genre.name).all())
 
     # If DB has genre data, return it sorted
-    if counts:
-        result = sorted(counts.values(), key=lambda x: x["movies"] + x["shows"], reverse=True)
-        return result
+    if rows:
+        result = [{"id": gid, "name": name, "movies": int(movies or 0), "shows": int(shows or 0)}
+                  for gid, name, movies, shows in rows]
+        return sorted(result, key=lambda x: x["movies"] + x["shows"], reverse=True)
 
     # Fallback: return static genre map (DB genres are empty)
     static_genres = []
@@ -2132,32 +2056,14 @@ def get_genre_overview(db: Session = Depends(get_db)):
 @app.get("/shows/genre/{genre_id}")
 def get_shows_by_genre(genre_id: int, limit: int = 20, db: Session = Depends(get_db)):
     """Return TV shows matching a genre ID."""
-    candidates = db.query(models.TVShow).order_by(models.TVShow.popularity_score.desc()).limit(500).all()
-    filtered = []
-    for show in candidates:
-        norm = normalize_genres(show.genres)
-        if any(g.get("id") == genre_id for g in norm):
-            filtered.append(show)
-        if len(filtered) >= limit:
-            break
+    filtered = (db.query(models.TVShow).filter(_with_genre(models.TVShow, 'tv', genre_id))
+                .order_by(models.TVShow.popularity_score.desc()).limit(limit).all())
 
     # Fallback: use TMDB discover API if DB returned nothing
     if not filtered and TMDB_API_KEY:
         try:
-            url = f"{TMDB_BASE_URL}/discover/tv?api_key={TMDB_API_KEY}&with_genres={genre_id}&sort_by=popularity.desc&page=1&language=en-US"
-            resp = requests.get(url, timeout=8)
-            if resp.status_code == 200:
-                for item in resp.json().get("results", [])[:limit]:
-                    filtered.append({
-                        "tmdb_id": item.get("id"),
-                        "name": item.get("name", ""),
-                        "title": item.get("name", ""),
-                        "poster_path": item.get("poster_path"),
-                        "overview": item.get("overview", ""),
-                        "first_air_date": item.get("first_air_date", ""),
-                        "popularity_score": item.get("popularity", 0),
-                        "media_type": "tv"
-                    })
+            filtered = _discover.items('tv', _discover.params('tv', genre_id), 0, limit,
+                                       require_poster=False) or []
         except Exception as e:
             print(f"TMDB discover tv fallback error: {e}")
 
@@ -2165,30 +2071,29 @@ def get_shows_by_genre(genre_id: int, limit: int = 20, db: Session = Depends(get
 
 
 @app.post("/interact")
-def record_interaction(input_data: InteractionInput, db: Session = Depends(get_db)):
+async def record_interaction(input_data: InteractionInput, db: AsyncSession = Depends(get_async_db)):
     """
     Records a user interaction (Like/Watch) for a guest user.
     Creates a shadow user account if one doesn't exist.
     """
     # 1. Find or Create User
-    user = db.query(models.User).filter(models.User.username == input_data.guest_id).first()
+    user = await _first(db, select(models.User).where(models.User.username == input_data.guest_id))
     if not user:
         user = models.User(username=input_data.guest_id, email=f"{input_data.guest_id}@guest.nautilus.local")
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
     
     # 2. Record Interaction
 
     # Ensure movie or TV show exists in DB, insert if missing, always use DB id for interaction
     if input_data.media_type == 'movie':
         # Try to find by tmdb_id first (since item_id may be tmdb_id from frontend)
-        movie = db.query(models.Movie).filter(models.Movie.tmdb_id == input_data.item_id).first()
+        movie = await _first(db, select(models.Movie).where(models.Movie.tmdb_id == input_data.item_id))
         if not movie:
             # Fetch from TMDB and insert
-            movie_data = fetch_movie_details(input_data.item_id)
+            movie_data = await fetch_movie_details(input_data.item_id)
             if not movie_data:
-                from fastapi import HTTPException
                 raise HTTPException(status_code=400, detail="Movie not found in external source.")
             movie = models.Movie(
                 title=movie_data['title'],
@@ -2203,16 +2108,15 @@ def record_interaction(input_data: InteractionInput, db: Session = Depends(get_d
                 file_path=None
             )
             db.add(movie)
-            db.commit()
-            db.refresh(movie)
+            await db.commit()
+            await db.refresh(movie)
         # Always use the DB id for the interaction
         item_db_id = movie.id
     elif input_data.media_type == 'tv':
-        tv_show = db.query(models.TVShow).filter(models.TVShow.tmdb_id == input_data.item_id).first()
+        tv_show = await _first(db, select(models.TVShow).where(models.TVShow.tmdb_id == input_data.item_id))
         if not tv_show:
-            tv_data = fetch_tv_details(input_data.item_id)
+            tv_data = await fetch_tv_details(input_data.item_id)
             if not tv_data:
-                from fastapi import HTTPException
                 raise HTTPException(status_code=400, detail="TV Show not found in external source.")
             tv_show = models.TVShow(
                 title=tv_data['title'],
@@ -2220,11 +2124,13 @@ def record_interaction(input_data: InteractionInput, db: Session = Depends(get_d
                 overview=tv_data.get('overview'),
                 genres=tv_data.get('genres'),
                 poster_path=tv_data.get('poster_path'),
-                popularity_score=tv_data.get('popularity_score')
+                popularity_score=tv_data.get('popularity_score'),
+                first_air_date=tv_data.get('first_air_date'),
+                last_air_date=tv_data.get('last_air_date')
             )
             db.add(tv_show)
-            db.commit()
-            db.refresh(tv_show)
+            await db.commit()
+            await db.refresh(tv_show)
         item_db_id = tv_show.id
     else:
         item_db_id = input_data.item_id
@@ -2232,25 +2138,25 @@ def record_interaction(input_data: InteractionInput, db: Session = Depends(get_d
     # Handle 'dislike' (Un-Like) or 'remove_watchlist'
     if input_data.action in ('dislike', 'remove_watchlist'):
         target_type = 'like' if input_data.action == 'dislike' else 'watchlist'
-        existing_int = db.query(models.Interaction).filter(
+        existing_int = await _first(db, select(models.Interaction).where(
             models.Interaction.user_id == user.id,
             models.Interaction.movie_id == (item_db_id if input_data.media_type == 'movie' else None),
             models.Interaction.tv_show_id == (item_db_id if input_data.media_type == 'tv' else None),
             models.Interaction.interaction_type == target_type
-        ).first()
+        ))
         if existing_int:
-            db.delete(existing_int)
-            db.commit()
+            await db.delete(existing_int)
+            await db.commit()
             return {"status": "removed", "user_id": user.id}
         return {"status": "nothing_to_remove", "user_id": user.id}
 
     # Check if already exists
-    existing = db.query(models.Interaction).filter(
+    existing = await _first(db, select(models.Interaction).where(
         models.Interaction.user_id == user.id,
         models.Interaction.movie_id == (item_db_id if input_data.media_type == 'movie' else None),
         models.Interaction.tv_show_id == (item_db_id if input_data.media_type == 'tv' else None),
         models.Interaction.interaction_type == input_data.action
-    ).first()
+    ))
     if not existing:
         interaction = models.Interaction(
             user_id=user.id,
@@ -2260,7 +2166,7 @@ def record_interaction(input_data: InteractionInput, db: Session = Depends(get_d
             rating_value=1.0 # Implicit positive feedback
         )
         db.add(interaction)
-        db.commit()
+        await db.commit()
         return {"status": "recorded", "user_id": user.id}
     return {"status": "exists", "user_id": user.id}
 
@@ -2284,52 +2190,28 @@ def _serialize_rec(item, media_type):
 
 
 # --- TMDB-recommendation aggregation: the main "For You" signal ---
-_REC_ITEM_CACHE: dict = {}   # (media_type, tmdb_id) -> (epoch, results)
-
-def _fetch_tmdb_recs(media_type: str, tid: int):
-    now = _t.time()
-    hit = _REC_ITEM_CACHE.get((media_type, tid))
-    if hit and (now - hit[0]) < 21600:   # 6h — a title's recs barely change
-        return hit[1]
-    res = []
-    try:
-        r = requests.get(
-            f"{TMDB_BASE_URL}/{media_type}/{tid}/recommendations",
-            params={"api_key": TMDB_API_KEY, "language": "en-US", "page": 1}, timeout=6)
-        if r.status_code == 200:
-            res = r.json().get("results", [])
-    except Exception:
-        res = []
-    _REC_ITEM_CACHE[(media_type, tid)] = (now, res)
-    return res
-
 def _aggregate_tmdb_recs(movie_tmdb, tv_tmdb, seen, limit=18):
     """Pull TMDB recommendations for each liked/watched title and rank by how
     often a candidate is recommended (cross-title overlap = strong signal),
     decayed by rank and nudged by rating. Returns frontend-shaped dicts."""
-    import concurrent.futures
     tasks = [("movie", t) for t in movie_tmdb[:10]] + [("tv", t) for t in tv_tmdb[:10]]
     if not tasks:
         return []
     tally = {}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=min(12, len(tasks))) as ex:
-        futs = {ex.submit(_fetch_tmdb_recs, mt, t): mt for (mt, t) in tasks}
-        for fut in concurrent.futures.as_completed(futs):
-            mt = futs[fut]
-            try:
-                recs = fut.result()
-            except Exception:
-                recs = []
-            for rank, it in enumerate(recs[:12]):
-                tid = it.get("id")
-                if not tid or not it.get("poster_path") or (mt, tid) in seen:
-                    continue
-                inc = (1.0 - rank * 0.04) + (it.get("vote_average") or 0) * 0.02
-                e = tally.get((mt, tid))
-                if e:
-                    e["score"] += inc
-                else:
-                    tally[(mt, tid)] = {"score": inc, "data": it, "mt": mt}
+    pages = tmdb.get_many_sync((f"/{mt}/{t}/recommendations", {"language": "en-US", "page": 1})
+                               for (mt, t) in tasks)
+    for (mt, _), page in zip(tasks, pages):
+        recs = (page or {}).get("results", [])
+        for rank, it in enumerate(recs[:12]):
+            tid = it.get("id")
+            if not tid or not it.get("poster_path") or (mt, tid) in seen:
+                continue
+            inc = (1.0 - rank * 0.04) + (it.get("vote_average") or 0) * 0.02
+            e = tally.get((mt, tid))
+            if e:
+                e["score"] += inc
+            else:
+                tally[(mt, tid)] = {"score": inc, "data": it, "mt": mt}
     ranked = sorted(tally.values(), key=lambda x: x["score"], reverse=True)[:limit]
     out = []
     for e in ranked:
@@ -2446,7 +2328,10 @@ def get_guest_recommendations(guest_id: str, request: Request, db: Session = Dep
         return []
 
     # Find movie candidates that share at least one genre, excluding already liked
+    target_ids = genre_ids_for(target_genres)
     candidates_q = db.query(models.Movie).filter(models.Movie.id.notin_(liked_movie_ids), models.Movie.popularity_score.isnot(None)).order_by(models.Movie.popularity_score.desc())
+    if target_ids:
+        candidates_q = candidates_q.filter(_with_genre(models.Movie, 'movie', *target_ids))
     if min_pop_pref is not None:
         try:
             candidates_q = candidates_q.filter(models.Movie.popularity_score >= float(min_pop_pref))
@@ -2456,6 +2341,8 @@ def get_guest_recommendations(guest_id: str, request: Request, db: Session = Dep
 
     # Also pull TV show candidates
     show_candidates_q = db.query(models.TVShow).filter(models.TVShow.popularity_score.isnot(None)).order_by(models.TVShow.popularity_score.desc())
+    if target_ids:
+        show_candidates_q = show_candidates_q.filter(_with_genre(models.TVShow, 'tv', *target_ids))
     if liked_tv_ids:
         show_candidates_q = show_candidates_q.filter(models.TVShow.id.notin_(liked_tv_ids))
     show_candidates = show_candidates_q.limit(300).all()
@@ -2555,7 +2442,9 @@ def reset_guest_interactions(guest_id: str, db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.username == guest_id).first()
     if not user:
         return {"status": "no_user"}
-    db.query(models.Interaction).filter(models.Interaction.user_id == user.id).delete()
+    # Row by row (a guest has a handful) so title_rating_stats sees the deletes.
+    for interaction in db.query(models.Interaction).filter(models.Interaction.user_id == user.id):
+        db.delete(interaction)
     db.commit()
     return {"status": "reset", "user_id": user.id}
 
@@ -2586,22 +2475,22 @@ def get_interaction_status(guest_id: str, tmdb_id: int, media_type: str, action:
     return {"active": bool(exists)}
 
 @app.get("/collections/watchlist/{guest_id}")
-def get_watchlist(guest_id: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == guest_id).first()
+async def get_watchlist(guest_id: str, db: AsyncSession = Depends(get_async_db)):
+    user = await _first(db, select(models.User).where(models.User.username == guest_id))
     if not user:
         return []
         
-    movies = db.query(models.Movie).join(models.Interaction).filter(
+    movies = await db.scalars(select(models.Movie).join(models.Interaction).where(
         models.Interaction.user_id == user.id,
         models.Interaction.interaction_type == 'watchlist',
         models.Interaction.movie_id.isnot(None)
-    ).all()
+    ))
     
-    shows = db.query(models.TVShow).join(models.Interaction).filter(
+    shows = await db.scalars(select(models.TVShow).join(models.Interaction).where(
         models.Interaction.user_id == user.id,
         models.Interaction.interaction_type == 'watchlist',
         models.Interaction.tv_show_id.isnot(None)
-    ).all()
+    ))
     
     results = []
     for m in movies:
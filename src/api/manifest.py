@@ -0,0 +1,243 @@
+"""HLS manifest rewriting for /proxy_stream.
+
+Every URI in a proxied playlist is replaced by a short opaque token
+(``/proxy_stream?t=<token>``) instead of the full url-encoded upstream URL plus
+referer/origin — on a 2-hour VOD that keeps the manifest close to its original
+size. Tokens are an HMAC of the upstream target, so they're stable (re-rewriting
+a playlist yields the same URLs) and can't be forged; the server-side table maps
+them back to (url, referer, origin).
+
+Rewritten VOD and master playlists don't change, so they're kept in a small TTL
+cache keyed by upstream URL + headers — a re-open or a second viewer costs no
+upstream fetch and no rewrite.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from urllib.parse import urljoin
+
+# Tokens only live in this process's memory, so a per-process secret is enough;
+# set PROXY_TOKEN_SECRET to keep them stable across restarts of the same table.
+_SECRET = (os.getenv("PROXY_TOKEN_SECRET") or "").encode() or secrets.token_bytes(32)
+TOKEN_TABLE_SIZE = int(os.getenv("PROXY_TOKEN_TABLE_SIZE", "200000"))
+MANIFEST_CACHE_TTL = int(os.getenv("PROXY_MANIFEST_TTL", "600"))
+_TOKEN_LEN = 16     # 12 HMAC bytes, base64url
+
+
+# ──────────────────────────────
+#  Tokens
+# ──────────────────────────────
+class ProxyTokens:
+    """Bounded LRU table of token -> (url, referer, origin)."""
+
+    def __init__(self, max_entries: int = TOKEN_TABLE_SIZE, secret: bytes = _SECRET):
+        self.max_entries = max_entries
+        self._secret = secret
+        self._table: "OrderedDict[str, tuple[str, Optional[str], Optional[str]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def _sign(self, url: str, referer: Optional[str], origin: Optional[str]) -> str:
+        msg = "\0".join((url, referer or "", origin or "")).encode()
+        digest = hmac.new(self._secret, msg, hashlib.sha256).digest()[:12]
+        return base64.urlsafe_b64encode(digest).decode()
+
+    def issue(self, url: str, referer: Optional[str] = None, origin: Optional[str] = None) -> str:
+        token = self._sign(url, referer, origin)
+        if token in self._table:
+            self._table.move_to_end(token)
+        else:
+            self._table[token] = (url, referer, origin)
+            if len(self._table) > self.max_entries:
+                self._table.popitem(last=False)
+        return token
+
+    def retain(self, issued: list[tuple[str, tuple]]) -> None:
+        """Keep the tokens of a cached manifest alive (re-adding any the LRU
+        dropped) without re-signing them."""
+        table = self._table
+        for token, target in issued:
+            if token in table:
+                table.move_to_end(token)
+            else:
+                table[token] = target
+        while len(table) > self.max_entries:
+            table.popitem(last=False)
+
+    def resolve(self, token: str) -> Optional[tuple[str, Optional[str], Optional[str]]]:
+        if not token or len(token) != _TOKEN_LEN:
+            return None
+        target = self._table.get(token)
+        if target is None or not hmac.compare_digest(token, self._sign(*target)):
+            return None
+        self._table.move_to_end(token)
+        return target
+
+
+# ──────────────────────────────
+#  Rewriter
+# ──────────────────────────────
+@dataclass
+class RewrittenPlaylist:
+    body: str
+    # Ordered segments of a media playlist (empty for master / byte-range playlists).
+    segments: list[str] = field(default_factory=list)
+    durations: list[float] = field(default_factory=list)
+    # (url, BANDWIDTH) of each rendition of a master playlist.
+    variants: list[tuple[str, int]] = field(default_factory=list)
+    # Rendition url -> CODECS, where the master lists them.
+    codecs: dict[str, str] = field(default_factory=dict)
+    # What a player needs besides the segments to decode them, in playlist
+    # order: EXT-X-KEY (method, key url, IV, format), EXT-X-MAP (init url,
+    # byte range) and a non-zero EXT-X-MEDIA-SEQUENCE. Segments from two
+    # playlists are only interchangeable when this matches (see failover.py).
+    decode: tuple = ()
+    # Master playlist, or a media playlist that is complete (VOD).
+    cacheable: bool = False
+    # (token, target) pairs issued while rewriting — see ProxyTokens.retain().
+    issued: list[tuple[str, tuple]] = field(default_factory=list)
+
+
+def rewrite_playlist(text: str, base_url: str, proxify: Callable[[str], str]) -> RewrittenPlaylist:
+    """Single pass over the playlist: every URI line and ``URI="..."`` attribute
+    is resolved against ``base_url`` and passed through ``proxify``. Collects the
+    segment order on the way so the read-ahead index doesn't re-parse."""
+    out: list[str] = []
+    append = out.append
+    segments: list[str] = []
+    durations: list[float] = []
+    variants: list[tuple[str, int]] = []
+    codecs: dict[str, str] = {}
+    decode: list[tuple] = []
+    key: Optional[tuple] = None
+    pending: Optional[float] = None
+    pending_attrs: Optional[dict[str, str]] = None
+    is_master = byterange = ended = False
+
+    for line in text.splitlines():
+        s = line.strip()
+        if not s:
+            append(line)
+            continue
+        if s[0] != "#":
+            target = urljoin(base_url, s)
+            append(proxify(target))
+            if pending is not None:
+                segments.append(target)
+                durations.append(pending)
+                pending = None
+            elif pending_attrs is not None:
+                variants.append((target, _int(pending_attrs.get("BANDWIDTH"))))
+                if pending_attrs.get("CODECS"):
+                    codecs[target] = pending_attrs["CODECS"]
+                pending_attrs = None
+            continue
+
+        if s.startswith("#EXTINF:"):
+            try:
+                pending = float(s[8:].split(",", 1)[0])
+            except ValueError:
+                pending = 0.0
+        elif s.startswith("#EXT-X-STREAM-INF"):
+            is_master = True
+            pending_attrs = attributes(s)
+        elif s.startswith("#EXT-X-KEY:"):
+            attrs = attributes(s)
+            method = attrs.get("METHOD", "NONE").upper()
+            new = None if method == "NONE" else (
+                method, urljoin(base_url, attrs.get("URI", "")), attrs.get("IV", "").lower(),
+                attrs.get("KEYFORMAT", "identity"))
+            if new != key:
+                decode.append(("KEY", new))
+                key = new
+        elif s.startswith("#EXT-X-MAP:"):
+            attrs = attributes(s)
+            decode.append(("MAP", urljoin(base_url, attrs.get("URI", "")), attrs.get("BYTERANGE", "")))
+        elif s.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            seq = _int(s[22:])
+            if seq:
+                decode.append(("SEQ", seq))
+        elif s.startswith("#EXT-X-BYTERANGE"):
+            byterange = True
+        elif s == "#EXT-X-ENDLIST" or s == "#EXT-X-PLAYLIST-TYPE:VOD":
+            ended = True
+
+        i = s.find('URI="')
+        if i < 0:
+            append(line)
+            continue
+        parts, pos = [], 0
+        while i >= 0:
+            j = s.find('"', i + 5)
+            if j < 0:
+                break
+            parts.append(s[pos:i + 5])
+            parts.append(proxify(urljoin(base_url, s[i + 5:j])))
+            pos = j
+            i = s.find('URI="', j + 1)
+        parts.append(s[pos:])
+        append("".join(parts))
+
+    body = "\n".join(out)
+    if text.endswith("\n"):
+        body += "\n"
+    if is_master or byterange:
+        segments, durations = [], []
+    return RewrittenPlaylist(body=body, segments=segments, durations=durations,
+                             variants=variants, codecs=codecs, decode=tuple(decode),
+                             cacheable=is_master or ended)
+
+
+# NAME=value pairs of a tag; quoted values may contain commas (CODECS="avc1,mp4a").
+_ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def attributes(tag: str) -> dict[str, str]:
+    """Attribute list of an HLS tag, quotes stripped."""
+    return {name: value[1:-1] if value.startswith('"') else value.strip()
+            for name, value in _ATTRIBUTE.findall(tag.split(":", 1)[-1])}
+
+
+def _int(value: Optional[str]) -> int:
+    try:
+        return int((value or "").strip())
+    except ValueError:
+        return 0
+
+
+# ──────────────────────────────
+#  Rewritten-manifest cache
+# ──────────────────────────────
+class ManifestCache:
+    """TTL + LRU cache of rewritten playlists keyed by (url, referer, origin)."""
+
+    def __init__(self, ttl: int = MANIFEST_CACHE_TTL, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items: "OrderedDict[tuple, tuple[float, RewrittenPlaylist]]" = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[RewrittenPlaylist]:
+        hit = self._items.get(key)
+        if hit is None:
+            return None
+        if time.monotonic() - hit[0] >= self.ttl:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return hit[1]
+
+    def put(self, key: tuple, playlist: RewrittenPlaylist) -> None:
+        self._items[key] = (time.monotonic(), playlist)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
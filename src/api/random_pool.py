@@ -0,0 +1,80 @@
+"""Random catalog sampling for /movies/random.
+
+``ORDER BY random() LIMIT n`` reads and sorts the whole table on every home
+page load. ``RandomPool`` keeps a snapshot per table instead: ids sorted by
+popularity (descending) with their scores, plus the subset that has a poster.
+The snapshot is rebuilt from three columns at most every ``ttl`` seconds.
+With a minimum popularity, the eligible ids are a prefix of that array, one
+bisect away. A request draws ``limit`` positions from the prefix and loads
+them with one primary-key ``IN`` query, so its cost depends on ``limit``
+rather than on the size of the catalog.
+
+NOTE: process-local, single worker — same as the rest of the API's caches.
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+RANDOM_POOL_TTL = 900
+
+
+class _Pool:
+    __slots__ = ("ids", "neg_pops")
+
+    def __init__(self, rows: list[tuple[int, float]]):
+        rows.sort(key=lambda r: -(r[1] or 0.0))
+        self.ids = array("i", (r[0] for r in rows))
+        # Negated so the array ascends and bisect finds "popularity >= x".
+        self.neg_pops = array("d", (-(r[1] or 0.0) for r in rows))
+
+    def eligible(self, min_popularity: Optional[float]) -> int:
+        if min_popularity is None:
+            return len(self.ids)
+        return bisect_right(self.neg_pops, -min_popularity)
+
+
+class _Snapshot:
+    __slots__ = ("all", "with_poster", "built")
+
+    def __init__(self, rows):
+        self.all = _Pool([(row_id, pop) for row_id, pop, _ in rows])
+        self.with_poster = _Pool([(row_id, pop) for row_id, pop, poster in rows if poster])
+        self.built = time.monotonic()
+
+
+class RandomPool:
+    def __init__(self, ttl: int = RANDOM_POOL_TTL, rng: Optional[random.Random] = None):
+        self.ttl = ttl
+        self.rng = rng or random.Random()
+        self._snapshots: dict[str, _Snapshot] = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self, db: Session, model) -> _Snapshot:
+        snap = self._snapshots.get(model.__tablename__)
+        if snap is None or time.monotonic() - snap.built > self.ttl:
+            with self._lock:
+                snap = self._snapshots.get(model.__tablename__)
+                if snap is None or time.monotonic() - snap.built > self.ttl:
+                    rows = db.query(model.id, model.popularity_score, model.poster_path).all()
+                    snap = self._snapshots[model.__tablename__] = _Snapshot(rows)
+        return snap
+
+    def sample(self, db: Session, model, limit: int, has_poster: bool = False,
+               min_popularity: Optional[float] = None) -> list:
+        """Up to ``limit`` distinct random rows matching the filters, in random order."""
+        snap = self.snapshot(db, model)
+        pool = snap.with_poster if has_poster else snap.all
+        n = pool.eligible(min_popularity)
+        if n <= 0 or limit <= 0:
+            return []
+        ids = [pool.ids[i] for i in self.rng.sample(range(n), min(limit, n))]
+        rows = {r.id: r for r in db.query(model).filter(model.id.in_(ids))}
+        # Rows deleted since the snapshot are simply skipped.
+        return [rows[i] for i in ids if i in rows]
@@ -0,0 +1,420 @@
+"""Sparse on-disk byte-range cache for proxied MP4 file streams.
+
+File streams (vidlink, vidplus server 3, febbox_mp4, ...) are proxied with the
+browser's Range header forwarded, so every seek used to go back to the CDN even
+for bytes we had just served. Here each upstream MP4 URL gets a sparse file
+plus the list of byte extents it actually holds: an overlapping Range request
+is answered from disk and only the missing gaps are fetched (and kept).
+Whole files are evicted least-recently-used once the disk budget is exceeded.
+
+An ``<key>.json`` sidecar records url/size/extents and the name of the data
+file, so the cache survives restarts. Each data file gets a fresh name: when
+upstream reports a new size for a URL, the new sparse file is created next to
+the old one and swapped in, and the old one is deleted once its last reader
+is done.
+
+A Range that's fully on disk is served by ``FileRangeResponse`` without going
+through Python byte iteration: the file is handed to the server's ASGI
+zero-copy extension (``os.sendfile``) when it offers one, and otherwise read
+with ``os.pread`` off the event loop. ``stream()`` and ``tee()`` likewise do
+their disk I/O with ``os.pread`` / ``os.pwrite`` on a worker thread.
+
+All file-system calls (the startup scan, sidecar writes, creating and
+unlinking data files, opening them) run on a worker thread too. The extent
+bookkeeping itself stays on the event loop, so it needs no locking.
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+import json
+import logging
+import os
+import secrets
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+
+import anyio
+import httpx
+from starlette.responses import Response
+
+log = logging.getLogger("nautilus.proxy")
+
+RANGE_CACHE_DIR = Path(os.getenv("PROXY_RANGE_CACHE_DIR", "data/cache/ranges"))
+RANGE_CACHE_BYTES = int(os.getenv("PROXY_RANGE_CACHE_MB", "4096")) * 1024 * 1024
+# Smaller bodies are segments/keys/thumbnails, not files worth a sparse cache.
+MIN_FILE_BYTES = 8 * 1024 * 1024
+READ_CHUNK = 256 * 1024
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """Parse a single ``bytes=`` range against a known size into an inclusive
+    (start, end). Multi-range and unsatisfiable requests return None."""
+    if not header:
+        return (0, size - 1) if size > 0 else None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            n = int(last)
+            if n <= 0:
+                return None
+            return max(0, size - n), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _pwrite_all(fd: int, data: bytes, pos: int) -> None:
+    view = memoryview(data)
+    while view:
+        n = os.pwrite(fd, view, pos)
+        view, pos = view[n:], pos + n
+
+
+def response_span(resp: httpx.Response) -> Optional[tuple[int, int]]:
+    """(offset of the body, full object size) from a 206 Content-Range or a
+    200 Content-Length; None when upstream doesn't say."""
+    if resp.status_code == 206:
+        cr = resp.headers.get("content-range", "")
+        try:
+            span, total = cr.split(" ", 1)[1].split("/")
+            return int(span.split("-")[0]), int(total)
+        except (IndexError, ValueError):
+            return None
+    if resp.status_code == 200:
+        cl = resp.headers.get("content-length", "")
+        return (0, int(cl)) if cl.isdigit() else None
+    return None
+
+
+class _Entry:
+    __slots__ = ("key", "file", "url", "size", "content_type", "starts", "ends", "readers")
+
+    def __init__(self, key: str, url: str, size: int, content_type: str, file: Optional[str] = None):
+        self.key = key
+        self.file = file or f"{key}.{secrets.token_hex(4)}.bin"
+        self.url = url
+        self.size = size
+        self.content_type = content_type
+        # Disjoint, sorted half-open extents [starts[i], ends[i]).
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        self.readers = 0
+
+    @property
+    def held(self) -> int:
+        return sum(e - s for s, e in zip(self.starts, self.ends))
+
+    def add(self, start: int, end: int) -> None:
+        """Mark [start, end) as held, merging with touching extents."""
+        if end <= start:
+            return
+        i = bisect.bisect_left(self.ends, start)
+        j = bisect.bisect_right(self.starts, end)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+    def held_until(self, pos: int) -> int:
+        """End (exclusive) of the extent covering ``pos``, or ``pos`` if none."""
+        i = bisect.bisect_right(self.starts, pos) - 1
+        if i >= 0 and self.ends[i] > pos:
+            return self.ends[i]
+        return pos
+
+    def next_start(self, pos: int) -> int:
+        """Start of the first extent after ``pos`` (or the file size)."""
+        i = bisect.bisect_right(self.starts, pos)
+        return self.starts[i] if i < len(self.starts) else self.size
+
+
+class RangeCache:
+    def __init__(self, root: Path = RANGE_CACHE_DIR, budget: int = RANGE_CACHE_BYTES):
+        self.root = Path(root)
+        self.budget = budget
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Replaced entries whose file still has readers; deleted by evict().
+        self._retired: list[_Entry] = []
+        self._loaded = False
+        self._load_lock = anyio.Lock()
+
+    # ── bookkeeping ──────────────────
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+    def path(self, entry: _Entry) -> Path:
+        return self._bin(entry)
+
+    def _bin(self, entry: _Entry) -> Path:
+        return self.root / entry.file
+
+    def _meta(self, entry: _Entry) -> Path:
+        return self.root / f"{entry.key}.json"
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                for entry in await anyio.to_thread.run_sync(self._scan):
+                    self._entries[entry.key] = entry
+                self._loaded = True
+
+    def _scan(self) -> list[_Entry]:
+        """Sidecars from a previous run, oldest first (LRU order). Data files no
+        sidecar points at (replaced before a restart) are removed. Blocking."""
+        try:
+            metas = sorted(self.root.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        except OSError:
+            return []
+        entries = []
+        for meta in metas:
+            try:
+                d = json.loads(meta.read_text())
+                entry = _Entry(meta.stem, d["url"], int(d["size"]), d.get("content_type", ""),
+                               file=d.get("file", f"{meta.stem}.bin"))
+                for s, e in d.get("extents", []):
+                    entry.add(int(s), int(e))
+                if self._bin(entry).exists():
+                    entries.append(entry)
+                else:
+                    self._unlink(meta)      # saved just as its file was evicted
+            except Exception:
+                continue
+        live = {e.file for e in entries}
+        for p in [*self.root.glob("*.bin"), *self.root.glob("*.tmp")]:
+            if p.name not in live:
+                self._unlink(p)
+        return entries
+
+    @staticmethod
+    def _unlink(*paths: Path) -> None:
+        for p in paths:
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _write_meta(meta: Path, text: str) -> None:
+        # Saves of one entry can overlap on the thread pool: each writes its
+        # own temp file and renames it over the sidecar.
+        tmp = meta.with_name(f"{meta.name}.{secrets.token_hex(4)}.tmp")
+        try:
+            tmp.write_text(text)
+            tmp.replace(meta)
+        except OSError as e:
+            RangeCache._unlink(tmp)
+            log.warning(f"[range-cache] save failed: {e}")
+
+    async def save(self, entry: _Entry) -> None:
+        if self._entries.get(entry.key) is not entry:
+            return      # replaced or evicted; the sidecar belongs to its successor
+        text = json.dumps({
+            "url": entry.url, "file": entry.file, "size": entry.size, "content_type": entry.content_type,
+            "extents": list(zip(entry.starts, entry.ends)),
+        })
+        await anyio.to_thread.run_sync(self._write_meta, self._meta(entry), text)
+
+    def usage(self) -> int:
+        return sum(e.held for e in self._entries.values())
+
+    async def evict(self) -> None:
+        """Drop whole files, least recently used first, until under budget.
+        Files with an open reader are skipped."""
+        doomed = [self._bin(e) for e in self._retired if not e.readers]
+        self._retired = [e for e in self._retired if e.readers]
+        total = self.usage()
+        for key in list(self._entries):
+            if total <= self.budget:
+                break
+            entry = self._entries[key]
+            if entry.readers:
+                continue
+            total -= entry.held
+            del self._entries[key]
+            doomed += [self._bin(entry), self._meta(entry)]
+        if doomed:
+            await anyio.to_thread.run_sync(self._unlink, *doomed)
+
+    # ── lookup ──────────────────
+
+    async def get(self, url: str) -> Optional[_Entry]:
+        await self._ensure_loaded()
+        entry = self._entries.get(self.key_for(url))
+        if entry is not None:
+            self._entries.move_to_end(entry.key)
+        return entry
+
+    @staticmethod
+    def _touch(path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        open(path, "xb").close()
+
+    async def create(self, url: str, size: int, content_type: str) -> _Entry:
+        """The entry for ``url``; a new, empty one if the size changed. The old
+        file is never truncated under a reader: the new one gets its own path."""
+        existing = await self.get(url)
+        if existing is not None and existing.size == size:
+            return existing
+        entry = _Entry(self.key_for(url), url, size, content_type)
+        await anyio.to_thread.run_sync(self._touch, self._bin(entry))
+        # Another request may have swapped in an entry while the file was made.
+        existing = self._entries.get(entry.key)
+        if existing is not None and existing.size == size:
+            await anyio.to_thread.run_sync(self._unlink, self._bin(entry))
+            return existing
+        self._entries[entry.key] = entry
+        if existing is not None:
+            self._retired.append(existing)
+        await self.save(entry)
+        await self.evict()      # deletes the replaced file now if nobody is reading it
+        return entry
+
+    # ── data path ──────────────────
+
+    def serve_held(self, entry: _Entry, start: int, end: int, *, status_code: int = 206,
+                   headers: Optional[dict[str, str]] = None) -> Optional["FileRangeResponse"]:
+        """Zero-copy response for [start, end] if every byte of it is on disk,
+        else None (the caller falls back to ``stream()`` to fill the gaps)."""
+        if entry.held_until(start) <= end:
+            return None
+        entry.readers += 1
+
+        def _release() -> None:
+            entry.readers -= 1
+
+        return FileRangeResponse(self._bin(entry), start, end, status_code=status_code,
+                                 media_type=entry.content_type or None, headers=headers,
+                                 on_close=_release)
+
+    async def tee(self, entry: _Entry, start: int, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Pass an upstream body through while writing it into the sparse file
+        at ``start``. Whatever arrives is kept, even if the client hangs up."""
+        entry.readers += 1
+        pos = start
+        fd = None
+        try:
+            fd = await anyio.to_thread.run_sync(os.open, self._bin(entry), os.O_RDWR)
+            async for chunk in chunks:
+                await anyio.to_thread.run_sync(_pwrite_all, fd, chunk, pos)
+                entry.add(pos, pos + len(chunk))
+                pos += len(chunk)
+                yield chunk
+        finally:
+            if fd is not None:
+                os.close(fd)
+            entry.readers -= 1
+            with anyio.CancelScope(shield=True):    # the client may have gone away
+                await self.save(entry)
+                await self.evict()
+
+    async def stream(self, entry: _Entry, start: int, end: int,
+                     client: httpx.AsyncClient, headers: dict[str, str]) -> AsyncIterator[bytes]:
+        """Yield bytes [start, end] (inclusive): held extents straight from disk,
+        gaps fetched upstream with a narrowed Range and written back."""
+        entry.readers += 1
+        pos = start
+        fd = None
+        try:
+            fd = await anyio.to_thread.run_sync(os.open, self._bin(entry), os.O_RDWR)
+            while pos <= end:
+                held_end = entry.held_until(pos)
+                if held_end > pos:
+                    stop = min(held_end, end + 1)
+                    while pos < stop:
+                        data = await anyio.to_thread.run_sync(os.pread, fd, min(READ_CHUNK, stop - pos), pos)
+                        if not data:
+                            return
+                        pos += len(data)
+                        yield data
+                    continue
+
+                gap_end = min(entry.next_start(pos), end + 1) - 1
+                req = client.build_request("GET", entry.url, headers={
+                    **headers, "Range": f"bytes={pos}-{gap_end}"})
+                resp = await client.send(req, stream=True)
+                try:
+                    if resp.status_code != 206 and not (resp.status_code == 200 and pos == 0):
+                        log.warning(f"[range-cache] gap fetch got {resp.status_code} for {entry.url}")
+                        return
+                    async for chunk in resp.aiter_raw():
+                        chunk = chunk[:gap_end + 1 - pos]
+                        if not chunk:
+                            break
+                        await anyio.to_thread.run_sync(_pwrite_all, fd, chunk, pos)
+                        entry.add(pos, pos + len(chunk))
+                        pos += len(chunk)
+                        yield chunk
+                        if pos > gap_end:
+                            break
+                finally:
+                    await resp.aclose()
+                if pos <= gap_end:
+                    return          # upstream ended early
+        finally:
+            if fd is not None:
+                os.close(fd)
+            entry.readers -= 1
+            with anyio.CancelScope(shield=True):
+                await self.save(entry)   # also bumps the sidecar mtime used for LRU order on reload
+                await self.evict()
+
+
+class FileRangeResponse(Response):
+    """Send bytes [start, end] (inclusive) of a local file.
+
+    Headers (Content-Length, Content-Range, ...) are the caller's business, as
+    with any Response. ``on_close`` runs once the body is sent or the client
+    has gone away.
+    """
+
+    def __init__(self, path: Path, start: int, end: int, *, status_code: int = 206,
+                 media_type: Optional[str] = None, headers: Optional[dict[str, str]] = None,
+                 on_close: Optional[Callable[[], None]] = None):
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.on_close = on_close
+        super().__init__(content=b"", status_code=status_code, media_type=media_type,
+                         headers=headers)
+        # Response() computed the length of the empty placeholder body.
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await send({"type": "http.response.start", "status": self.status_code,
+                        "headers": self.raw_headers})
+            if scope.get("method") == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+            f = await anyio.to_thread.run_sync(open, self.path, "rb")
+            with f:
+                if "http.response.zerocopy" in scope.get("extensions", {}):
+                    await send({"type": "http.response.zerocopy", "file": f,
+                                "offset": self.start, "count": self.count, "more_body": False})
+                    return
+                fd = f.fileno()
+                pos, stop = self.start, self.start + self.count
+                while pos < stop:
+                    data = await anyio.to_thread.run_sync(os.pread, fd, min(READ_CHUNK, stop - pos), pos)
+                    if not data:
+                        raise OSError(f"{self.path} is shorter than its recorded extents")
+                    pos += len(data)
+                    await send({"type": "http.response.body", "body": data,
+                                "more_body": pos < stop})
+        finally:
+            if self.on_close is not None:
+                self.on_close()
@@ -0,0 +1,237 @@
+"""Segment read-ahead for the HLS proxy.
+
+When /proxy_stream rewrites a media playlist it already knows the ordered
+segment list, so we remember it. A request for segment N then warms
+N+1..N+k into a small in-memory cache in the background, where k follows the
+measured upstream throughput: a slow CDN gets a deeper read-ahead so its
+latency hides behind playback time instead of stalling the player.
+
+NOTE: like the watch-party rooms, all state is process-local — the app runs
+single-worker, so there's no shared cache to keep coherent.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+log = logging.getLogger("nautilus.proxy")
+
+SEGMENT_CACHE_BYTES = int(os.getenv("PROXY_SEGMENT_CACHE_MB", "256")) * 1024 * 1024
+PREFETCH_CONCURRENCY = int(os.getenv("PROXY_PREFETCH_CONCURRENCY", "16"))
+PREFETCH_MIN_DEPTH = int(os.getenv("PROXY_PREFETCH_MIN_DEPTH", "2"))
+PREFETCH_MAX_DEPTH = int(os.getenv("PROXY_PREFETCH_MAX_DEPTH", "8"))
+# Anything bigger than this isn't an HLS segment worth holding in RAM.
+MAX_SEGMENT_BYTES = 16 * 1024 * 1024
+
+
+# ──────────────────────────────
+#  Segment bytes
+# ──────────────────────────────
+class SegmentCache:
+    """Byte-bounded LRU of fully downloaded segments, keyed by upstream URL."""
+
+    def __init__(self, max_bytes: int = SEGMENT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, tuple[bytes, str]]" = OrderedDict()
+        self._bytes = 0
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    def get(self, url: str) -> Optional[tuple[bytes, str]]:
+        hit = self._items.get(url)
+        if hit is not None:
+            self._items.move_to_end(url)
+        return hit
+
+    def put(self, url: str, body: bytes, content_type: str = "") -> None:
+        if len(body) > min(self.max_bytes, MAX_SEGMENT_BYTES):
+            return
+        old = self._items.pop(url, None)
+        if old is not None:
+            self._bytes -= len(old[0])
+        self._items[url] = (body, content_type)
+        self._bytes += len(body)
+        while self._bytes > self.max_bytes and self._items:
+            _, (evicted, _) = self._items.popitem(last=False)
+            self._bytes -= len(evicted)
+
+
+# ──────────────────────────────
+#  Playlist order
+# ──────────────────────────────
+@dataclass
+class MediaPlaylist:
+    url: str
+    segments: list[str]
+    durations: list[float]
+    headers: dict[str, str] = field(default_factory=dict)
+    # Keys / init segment / media sequence (see RewrittenPlaylist.decode).
+    decode: tuple = ()
+
+
+class PlaylistIndex:
+    """Remembers the segment order of recently rewritten media playlists, so a
+    segment URL can be mapped back to (playlist, position)."""
+
+    def __init__(self, max_playlists: int = 64):
+        self.max_playlists = max_playlists
+        self._playlists: "OrderedDict[str, MediaPlaylist]" = OrderedDict()
+        self._segments: dict[str, tuple[str, int]] = {}
+
+    def register(self, url: str, segments: list[str], durations: list[float],
+                 headers: dict[str, str] | None = None, decode: tuple = ()) -> MediaPlaylist:
+        self._drop(url)
+        pl = MediaPlaylist(url=url, segments=list(segments), durations=list(durations),
+                           headers=dict(headers or {}), decode=tuple(decode))
+        self._playlists[url] = pl
+        for i, seg in enumerate(pl.segments):
+            self._segments[seg] = (url, i)
+        while len(self._playlists) > self.max_playlists:
+            self._drop(next(iter(self._playlists)))
+        return pl
+
+    def get(self, url: str) -> Optional[MediaPlaylist]:
+        return self._playlists.get(url)
+
+    def locate(self, segment_url: str) -> Optional[tuple[MediaPlaylist, int]]:
+        ref = self._segments.get(segment_url)
+        if ref is None:
+            return None
+        pl = self._playlists.get(ref[0])
+        if pl is None:
+            return None
+        self._playlists.move_to_end(pl.url)
+        return pl, ref[1]
+
+    def _drop(self, url: str) -> None:
+        pl = self._playlists.pop(url, None)
+        if pl is None:
+            return
+        for seg in pl.segments:
+            if self._segments.get(seg, (None,))[0] == url:
+                del self._segments[seg]
+
+
+# ──────────────────────────────
+#  Read-ahead scheduler
+# ──────────────────────────────
+class ReadAhead:
+    """Background prefetcher. One global semaphore caps concurrent upstream
+    prefetches; in-flight fetches are shared so a client asking for a segment
+    that's already being prefetched just waits for it instead of refetching."""
+
+    def __init__(self, cache: SegmentCache, index: PlaylistIndex, *,
+                 max_concurrency: int = PREFETCH_CONCURRENCY,
+                 min_depth: int = PREFETCH_MIN_DEPTH,
+                 max_depth: int = PREFETCH_MAX_DEPTH):
+        self.cache = cache
+        self.index = index
+        self.max_concurrency = max_concurrency
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._inflight: dict[str, asyncio.Task] = {}
+        # host -> (EWMA bytes/sec, EWMA segment bytes)
+        self._throughput: dict[str, tuple[float, float]] = {}
+
+    # ── throughput ──────────────────
+
+    def record(self, url: str, nbytes: int, seconds: float) -> None:
+        if nbytes <= 0:
+            return
+        host = urlsplit(url).netloc
+        bps = nbytes / max(seconds, 1e-3)
+        prev = self._throughput.get(host)
+        if prev is None:
+            self._throughput[host] = (bps, float(nbytes))
+        else:
+            a = 0.3
+            self._throughput[host] = (a * bps + (1 - a) * prev[0],
+                                      a * nbytes + (1 - a) * prev[1])
+
+    def depth_for(self, pl: MediaPlaylist, idx: int) -> int:
+        """How many segments to read ahead: enough to cover ~2x the expected
+        upstream fetch time of one segment, measured in playback seconds."""
+        stats = self._throughput.get(urlsplit(pl.segments[idx]).netloc)
+        if stats is None:
+            return self.min_depth
+        bps, seg_bytes = stats
+        seg_dur = pl.durations[idx] if idx < len(pl.durations) and pl.durations[idx] > 0 else 4.0
+        fetch_s = seg_bytes / max(bps, 1.0)
+        depth = math.ceil(2 * fetch_s / seg_dur) + 1
+        return max(self.min_depth, min(self.max_depth, depth))
+
+    # ── cache access ──────────────────
+
+    def store(self, url: str, body: bytes, content_type: str, seconds: float) -> None:
+        self.record(url, len(body), seconds)
+        self.cache.put(url, body, content_type)
+
+    async def lookup(self, url: str) -> Optional[tuple[bytes, str]]:
+        """Cached segment, waiting on an in-flight prefetch if there is one."""
+        hit = self.cache.get(url)
+        if hit is not None:
+            return hit
+        task = self._inflight.get(url)
+        if task is not None:
+            try:
+                await asyncio.shield(task)
+            except Exception:
+                return None
+            return self.cache.get(url)
+        return None
+
+    def on_request(self, client: httpx.AsyncClient, url: str) -> Optional[MediaPlaylist]:
+        """Called for every proxied segment request; schedules read-ahead of the
+        segments that follow it. Returns the playlist it belongs to, if known."""
+        loc = self.index.locate(url)
+        if loc is None:
+            return None
+        pl, idx = loc
+        depth = self.depth_for(pl, idx)
+        for nxt in pl.segments[idx + 1: idx + 1 + depth]:
+            self._schedule(client, nxt, pl.headers)
+        return pl
+
+    def _schedule(self, client: httpx.AsyncClient, url: str, headers: dict[str, str]) -> None:
+        if url in self.cache or url in self._inflight:
+            return
+        # Don't let a backlog of queued prefetches build up behind the cap.
+        if len(self._inflight) >= self.max_concurrency * 4:
+            return
+        task = asyncio.ensure_future(self._prefetch(client, url, headers))
+        self._inflight[url] = task
+        task.add_done_callback(lambda _t, u=url: self._inflight.pop(u, None))
+
+    async def _prefetch(self, client: httpx.AsyncClient, url: str, headers: dict[str, str]) -> None:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        async with self._sem:
+            if url in self.cache:
+                return
+            start = time.monotonic()
+            try:
+                r = await client.get(url, headers=headers)
+            except Exception as e:
+                log.debug(f"[read-ahead] {url}: {e}")
+                return
+            if r.status_code != 200 or r.headers.get("content-encoding"):
+                return
+            self.store(url, r.content, r.headers.get("content-type", ""), time.monotonic() - start)
@@ -0,0 +1,195 @@
+"""Decoded-subtitle cache for /proxy_subtitle.
+
+Subtitle files are fetched once, gunzipped, charset-detected, converted from
+SRT to WebVTT, and stored content-addressed (``<sha256>.vtt``) on disk. A small
+url -> digest map, also on disk, means later requests for the same URL need no
+upstream I/O. The digest doubles as a strong ETag, so a player flipping back to
+a track it already loaded gets a 304.
+
+ASS / MicroDVD files are stored decoded but otherwise untouched — the player
+parses those itself.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+try:
+    from charset_normalizer import from_bytes as _detect_charset
+except ImportError:  # pulled in by requests, but don't insist on it
+    _detect_charset = None
+
+log = logging.getLogger("nautilus.subtitles")
+
+SUBTITLE_CACHE_DIR = Path(os.getenv("SUBTITLE_CACHE_DIR", "data/cache/subtitles"))
+SUBTITLE_CACHE_BYTES = int(os.getenv("SUBTITLE_CACHE_MB", "256")) * 1024 * 1024
+
+_SRT_TIMING = re.compile(r"^(\d+:\d{2}:\d{2})[,.](\d{3})\s*-->\s*(\d+:\d{2}:\d{2})[,.](\d{3})(.*)$")
+
+
+def decode_subtitle(raw: bytes) -> str:
+    """Gunzip if needed and decode to text: UTF-8 (with or without BOM) first,
+    then a detected charset, then latin-1 as the never-fails fallback."""
+    if raw[:2] == b"\x1f\x8b":
+        try:
+            raw = gzip.decompress(raw)
+        except Exception:
+            pass
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        pass
+    if _detect_charset is not None:
+        best = _detect_charset(raw).best()
+        if best is not None:
+            return str(best)
+    return raw.decode("latin-1")
+
+
+def srt_to_vtt(text: str) -> Optional[str]:
+    """WebVTT for an SRT (or already-VTT) file; None for other formats."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n").lstrip("\ufeff")
+    if text.lstrip().startswith("WEBVTT"):
+        return text
+    out = ["WEBVTT", ""]
+    saw_cue = False
+    for line in text.split("\n"):
+        m = _SRT_TIMING.match(line.strip())
+        if m:
+            saw_cue = True
+            out.append(f"{m.group(1)}.{m.group(2)} --> {m.group(3)}.{m.group(4)}{m.group(5)}")
+        else:
+            out.append(line)
+    return "\n".join(out) if saw_cue else None
+
+
+class SubtitleCache:
+    """Blocking file I/O throughout: async callers run these methods on a
+    worker thread (main.py uses ``anyio.to_thread``), hence the lock.
+
+    Sizes of the stored files are tracked in memory, oldest first, so eviction
+    only unlinks what it must instead of walking the directory. The url ->
+    file map is an append-only log (``index.log``), rewritten once it holds
+    more stale lines than live ones."""
+
+    def __init__(self, root: Path = SUBTITLE_CACHE_DIR, budget: int = SUBTITLE_CACHE_BYTES):
+        self.root = Path(root)
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._index: Optional[dict[str, str]] = None     # url key -> "<digest>.<ext>"
+        self._files: "OrderedDict[str, int]" = OrderedDict()   # file name -> size, LRU first
+        self._bytes = 0
+        self._log_lines = 0
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+    def _log_path(self) -> Path:
+        return self.root / "index.log"
+
+    def _load(self) -> dict[str, str]:
+        """Index and file sizes, read once (caller holds the lock)."""
+        if self._index is not None:
+            return self._index
+        self._index = {}
+        try:
+            files = [(p.stat(), p.name) for p in self.root.iterdir() if p.suffix in (".vtt", ".txt")]
+        except OSError:
+            files = []
+        for st, name in sorted(files, key=lambda f: f[0].st_mtime):
+            self._files[name] = st.st_size
+            self._bytes += st.st_size
+        try:
+            # Written by older versions as one JSON object.
+            self._index.update(json.loads((self.root / "index.json").read_text()))
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(self._log_path(), encoding="utf-8") as f:
+                for line in f:
+                    key, _, ref = line.strip().partition(" ")
+                    if ref:
+                        self._index[key] = ref
+                        self._log_lines += 1
+        except OSError:
+            pass
+        self._index = {k: v for k, v in self._index.items() if v in self._files}
+        if self._log_lines > 2 * len(self._index) or (self.root / "index.json").exists():
+            self._compact()
+        return self._index
+
+    def _compact(self) -> None:
+        self._index = {k: v for k, v in self._index.items() if v in self._files}
+        try:
+            tmp = self._log_path().with_suffix(".tmp")
+            tmp.write_text("".join(f"{k} {v}\n" for k, v in self._index.items()), encoding="utf-8")
+            tmp.replace(self._log_path())
+            self._log_lines = len(self._index)
+            (self.root / "index.json").unlink(missing_ok=True)
+        except OSError as e:
+            log.warning(f"[subtitle-cache] index compaction failed: {e}")
+
+    def path(self, digest: str, ext: str) -> Path:
+        return self.root / f"{digest}.{ext}"
+
+    def lookup(self, url: str) -> Optional[tuple[str, str]]:
+        """(digest, ext) for a URL fetched before, if its file is still there."""
+        with self._lock:
+            ref = self._load().get(self._url_key(url))
+            if ref is None or ref not in self._files:
+                return None
+            self._files.move_to_end(ref)
+        digest, _, ext = ref.partition(".")
+        return digest, ext
+
+    def read(self, url: str) -> Optional[tuple[str, str, bytes]]:
+        """(digest, ext, body) for a URL fetched before, or None."""
+        known = self.lookup(url)
+        if known is None:
+            return None
+        try:
+            return (*known, self.path(*known).read_bytes())
+        except OSError:
+            return None     # evicted between lookup and read
+
+    def store(self, url: str, data: bytes, ext: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{digest}.{ext}"
+        with self._lock:
+            index = self._load()
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                if name not in self._files:
+                    self.path(digest, ext).write_bytes(data)
+                    self._files[name] = len(data)
+                    self._bytes += len(data)
+                    self._evict()
+                key = self._url_key(url)
+                if index.get(key) != name:
+                    index[key] = name
+                    with open(self._log_path(), "a", encoding="utf-8") as f:
+                        f.write(f"{key} {name}\n")
+                    self._log_lines += 1
+                    if self._log_lines > 2 * len(index) + 100:
+                        self._compact()
+            except OSError as e:
+                log.warning(f"[subtitle-cache] store failed: {e}")
+        return digest
+
+    def _evict(self) -> None:
+        """Unlink the least recently used files until under budget (caller
+        holds the lock). Index entries pointing at them are ignored by
+        ``lookup`` and dropped at the next compaction."""
+        while self._bytes > self.budget and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self._bytes -= size
+            (self.root / name).unlink(missing_ok=True)
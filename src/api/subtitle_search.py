@@ -0,0 +1,202 @@
+"""Subtitle search for /subtitles (legacy OpenSubtitles REST API).
+
+The legacy API is IMDb-keyed, so every search starts with a tmdb -> imdb
+lookup. That mapping never changes, so it's memoized on disk (new ids are
+written out in batches, on a worker thread). Search results
+are cached per (imdb, season, episode) with a TTL, and concurrent searches for
+the same key share one upstream call. That last part lets /stream kick a search
+off speculatively while the provider engine is still resolving, so the caption
+list is usually ready before the player asks for it.
+
+NOTE: process-local, single worker — same as the rest of the API's caches.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import quote
+
+import anyio
+import httpx
+
+from src.core.tmdb import TMDBClient
+
+log = logging.getLogger("nautilus.subtitles")
+
+IMDB_MEMO_PATH = Path(os.getenv("IMDB_MEMO_PATH", "data/cache/imdb_ids.json"))
+SEARCH_TTL = int(os.getenv("SUBTITLE_SEARCH_TTL", str(6 * 3600)))
+# An empty result may just be OpenSubtitles having a bad minute.
+EMPTY_TTL = 300
+MAX_RESULTS = 60
+# New imdb ids are written out at most this often.
+MEMO_FLUSH_DELAY = 10.0
+
+
+class ImdbMemo:
+    """Persistent ``"<movie|tv>:<tmdb_id>" -> "tt..."`` map.
+
+    Reads and writes of the file run on a worker thread. ``put`` only updates
+    memory and schedules one ``flush`` ``MEMO_FLUSH_DELAY`` seconds out, so a
+    burst of new ids costs a single write; call ``flush`` on shutdown."""
+
+    def __init__(self, path: Path = IMDB_MEMO_PATH, flush_delay: float = MEMO_FLUSH_DELAY):
+        self.path = Path(path)
+        self.flush_delay = flush_delay
+        self._ids: Optional[dict[str, str]] = None
+        self._lock = anyio.Lock()
+        self._dirty = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def _read(self) -> dict[str, str]:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, text: str) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(text)
+            tmp.replace(self.path)
+        except OSError as e:
+            log.warning(f"[subtitles] imdb memo save failed: {e}")
+
+    async def _load(self) -> dict[str, str]:
+        if self._ids is None:
+            async with self._lock:
+                if self._ids is None:
+                    self._ids = await anyio.to_thread.run_sync(self._read)
+        return self._ids
+
+    async def get(self, media_type: str, tmdb_id: int) -> Optional[str]:
+        return (await self._load()).get(f"{media_type}:{tmdb_id}")
+
+    async def put(self, media_type: str, tmdb_id: int, imdb_id: str) -> None:
+        ids = await self._load()
+        key = f"{media_type}:{tmdb_id}"
+        if not imdb_id or ids.get(key) == imdb_id:
+            return
+        ids[key] = imdb_id
+        self._dirty = True
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.flush_delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self) -> None:
+        """Write the map out if anything was added since the last write."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            await anyio.to_thread.run_sync(self._write, json.dumps(self._ids))
+
+
+def _normalize(data) -> list[dict]:
+    out = []
+    for s in (data if isinstance(data, list) else []):
+        dl = s.get("SubDownloadLink")
+        if not dl:
+            continue
+        # /proxy_subtitle serves SRT converted to WebVTT; other formats as is.
+        fmt = (s.get("SubFormat") or "srt").lower()
+        out.append({
+            "url": f"/proxy_subtitle?url={quote(dl, safe='')}",
+            "lang": (s.get("ISO639") or (s.get("SubLanguageID") or "")[:2] or "en"),
+            "format": "vtt" if fmt in ("srt", "vtt") else fmt,
+            "display": s.get("LanguageName") or s.get("SubLanguageID") or "Unknown",
+            "hearing_impaired": s.get("SubHearingImpaired") == "1",
+            "downloads": int(s.get("SubDownloadsCnt") or 0),
+            "source": "opensubtitles",
+        })
+    # Most-downloaded first (best quality/sync), cap the payload.
+    out.sort(key=lambda x: -x["downloads"])
+    return out[:MAX_RESULTS]
+
+
+class SubtitleSearch:
+    def __init__(self, client: Callable[[], httpx.AsyncClient], tmdb: TMDBClient,
+                 memo: Optional[ImdbMemo] = None, ttl: int = SEARCH_TTL):
+        # A getter, so the pooled client can be recreated under us.
+        self._client = client
+        self.tmdb = tmdb
+        self.memo = memo or ImdbMemo()
+        self.ttl = ttl
+        self._results: dict[tuple, tuple[float, list[dict]]] = {}
+        self._inflight: dict[tuple, asyncio.Task] = {}
+
+    async def imdb_id(self, media_type: str, tmdb_id: int) -> Optional[str]:
+        known = await self.memo.get(media_type, tmdb_id)
+        if known or not self.tmdb:
+            return known
+        key = ("imdb", media_type, tmdb_id)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup_imdb(media_type, tmdb_id))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        return await asyncio.shield(task)
+
+    async def _lookup_imdb(self, media_type: str, tmdb_id: int) -> Optional[str]:
+        ep = "movie" if media_type == "movie" else "tv"
+        d = await self.tmdb.get(f"/{ep}/{tmdb_id}", {"append_to_response": "external_ids"})
+        if d is None:
+            return None
+        imdb_id = d.get("imdb_id") or (d.get("external_ids") or {}).get("imdb_id")
+        if imdb_id:
+            await self.memo.put(media_type, tmdb_id, imdb_id)
+        return imdb_id
+
+    async def search(self, media_type: str, tmdb_id: int, season: int = 1, episode: int = 1,
+                     imdb_id: Optional[str] = None) -> list[dict]:
+        if imdb_id:
+            await self.memo.put(media_type, tmdb_id, imdb_id)
+        else:
+            imdb_id = await self.imdb_id(media_type, tmdb_id)
+        if not imdb_id:
+            return []
+        key = (imdb_id, None, None) if media_type == "movie" else (imdb_id, season, episode)
+        hit = self._results.get(key)
+        if hit is not None and time.monotonic() < hit[0]:
+            return hit[1]
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        return await asyncio.shield(task)
+
+    def prefetch(self, media_type: str, tmdb_id: int, season: int = 1, episode: int = 1,
+                 imdb_id: Optional[str] = None) -> None:
+        """Start a search in the background; a later search() joins or reuses it."""
+        task = asyncio.ensure_future(self.search(media_type, tmdb_id, season, episode, imdb_id))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _fetch(self, key: tuple) -> list[dict]:
+        imdb_id, season, episode = key
+        num = imdb_id[2:] if imdb_id.startswith("tt") else imdb_id
+        if season is not None:
+            path = f"/search/episode-{episode}/imdbid-{num}/season-{season}"
+        else:
+            path = f"/search/imdbid-{num}"
+        try:
+            resp = await self._client().get(f"https://rest.opensubtitles.org{path}",
+                                            headers={"User-Agent": "Nautilus v1"}, timeout=15.0)
+            data = resp.json() if resp.status_code == 200 else []
+        except Exception as e:
+            log.error(f"[subtitles] {e}")
+            return []
+        out = _normalize(data)
+        self._results[key] = (time.monotonic() + (self.ttl if out else EMPTY_TTL), out)
+        if len(self._results) > 2048:
+            now = time.monotonic()
+            self._results = {k: v for k, v in self._results.items() if v[0] > now}
+        return out
@@ -0,0 +1,226 @@
+"""In-process autocomplete for /search/suggest.
+
+Type-ahead can't afford a database round-trip per keystroke, so the catalog's
+titles live in a compact in-memory index:
+
+* Titles are numbered by popularity (0 = most popular) and stored in flat
+  arrays: title strings, tmdb ids, media type bytes, popularity floats.
+* The vocabulary of normalized title words is one sorted list. Each word's
+  postings are ascending title numbers, which makes them popularity order, in
+  one shared ``array('i')`` with CSR offsets. A prefix is a bisect range of
+  words; top-k is a k-way merge of their postings that stops after k hits.
+* One- and two-character prefixes cover too many words to merge per request,
+  so their top results are precomputed.
+* A query token with no prefix match is retried with its edit-distance-1
+  variants (transpositions and deletions, then substitutions, then
+  insertions). Each variant is one bisect, so "matirx" still finds "The
+  Matrix".
+
+New catalog rows are pulled incrementally (``refresh``: rows above each
+table's id high-water mark) into a small delta. Once the delta passes
+``DELTA_LIMIT`` the arrays are rebuilt off-thread and swapped in.
+
+NOTE: process-local, single worker — same as the rest of the API's caches.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from src.core import models
+
+TABLES = (("movie", models.Movie), ("tv", models.TVShow))
+KINDS = ("movie", "tv")
+SHORT_PREFIX = 2            # prefixes up to this length are precomputed
+SHORT_TOP = 50
+MAX_SCAN = 5000             # candidates examined per query, worst case
+DELTA_LIMIT = 500
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+_PUNCT = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(title: str) -> str:
+    """Lowercase, accents stripped, punctuation collapsed to single spaces."""
+    text = (title or "").lower()
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return _PUNCT.sub(" ", text).strip()
+
+
+def _edits(token: str) -> Iterator[set[str]]:
+    """Edit-distance-1 variants of ``token``, cheapest tiers first:
+    transpositions and deletions, then substitutions, then insertions."""
+    splits = [(token[:i], token[i:]) for i in range(len(token) + 1)]
+    yield ({a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1}
+           | {a + b[1:] for a, b in splits if b}) - {token, ""}
+    yield {a + c + b[1:] for a, b in splits if b for c in _ALPHABET} - {token}
+    yield {a + c + b for a, b in splits for c in _ALPHABET}
+
+
+class _Index:
+    """Immutable snapshot; queries never lock."""
+
+    def __init__(self, entries: list[tuple[float, int, int, str]]):
+        # entries: (popularity, kind, tmdb_id, title)
+        entries.sort(key=lambda e: -e[0])
+        self.titles = [e[3] for e in entries]
+        self.tmdb_ids = array("i", (e[2] for e in entries))
+        self.kinds = bytes(e[1] for e in entries)
+        self.pops = array("f", (e[0] for e in entries))
+        words: dict[str, list[int]] = {}
+        for n, title in enumerate(self.titles):
+            for w in set(normalize(title).split()):
+                words.setdefault(w, []).append(n)
+        self.vocab = sorted(words)
+        self.offsets = array("i", [0])
+        self.postings = array("i")
+        for w in self.vocab:
+            self.postings.extend(words[w])
+            self.offsets.append(len(self.postings))
+        self.short: dict[str, array] = {}
+        for w in self.vocab:
+            for i in range(1, min(SHORT_PREFIX, len(w)) + 1):
+                self.short.setdefault(w[:i], None)
+        for p in self.short:
+            self.short[p] = array("i", itertools.islice(self._merge(self._range(p)), SHORT_TOP))
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def _range(self, prefix: str) -> range:
+        lo = bisect_left(self.vocab, prefix)
+        hi = bisect_left(self.vocab, prefix + "￿", lo)
+        return range(lo, hi)
+
+    def _merge(self, words: Iterable[int]):
+        """Title numbers posted under ``words``, most popular first, deduplicated."""
+        view = memoryview(self.postings)
+        last = -1
+        for n in heapq.merge(*(view[self.offsets[w]:self.offsets[w + 1]] for w in words)):
+            if n != last:
+                yield n
+                last = n
+
+    def _known(self, prefix: str) -> bool:
+        i = bisect_left(self.vocab, prefix)
+        return i < len(self.vocab) and self.vocab[i].startswith(prefix)
+
+    def prefixes(self, token: str, fuzzy: bool) -> list[str]:
+        """Vocabulary prefixes standing for ``token``: itself, or its typo fixes."""
+        if self._known(token):
+            return [token]
+        if not fuzzy or len(token) < 3:
+            return []
+        for tier in _edits(token):
+            hits = [v for v in tier if self._known(v)]
+            if hits:
+                return hits
+        return []
+
+    def candidates(self, prefixes: list[str], alone: bool):
+        if alone and len(prefixes) == 1 and prefixes[0] in self.short:
+            return iter(self.short[prefixes[0]])
+        words = sorted({w for p in prefixes for w in self._range(p)})
+        return self._merge(words)
+
+    def cost(self, prefixes: list[str]) -> int:
+        return sum(self.offsets[r.stop] - self.offsets[r.start] for r in map(self._range, prefixes))
+
+
+def _matches(words: list[str], required: list[tuple[str, ...]]) -> bool:
+    return all(any(w.startswith(req) for w in words) for req in required)
+
+
+class Suggest:
+    def __init__(self):
+        self._index: Optional[_Index] = None
+        self._delta: list[tuple[tuple[float, int, int, str], list[str]]] = []
+        self._high_water = {kind: 0 for kind in KINDS}
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    def _rows(self, db: Session, model, after: int = 0):
+        return (db.query(model.id, model.tmdb_id, model.title, model.popularity_score)
+                .filter(model.id > after, model.tmdb_id.isnot(None), model.title.isnot(None))
+                .order_by(model.id).yield_per(5000))
+
+    def build(self, db: Session) -> int:
+        """(Re)build from the whole catalog; returns the number of titles."""
+        entries, high_water = [], {}
+        for kind, model in TABLES:
+            high_water[kind] = 0
+            for row_id, tmdb_id, title, pop in self._rows(db, model):
+                entries.append((pop or 0.0, KINDS.index(kind), tmdb_id, title))
+                high_water[kind] = row_id
+        index = _Index(entries)
+        with self._lock:
+            self._index, self._delta, self._high_water = index, [], high_water
+        return len(index)
+
+    def refresh(self, db: Session) -> int:
+        """Pull catalog rows added since the last build/refresh; returns how many."""
+        fresh = []
+        for kind, model in TABLES:
+            for row_id, tmdb_id, title, pop in self._rows(db, model, self._high_water[kind]):
+                fresh.append(((pop or 0.0, KINDS.index(kind), tmdb_id, title), normalize(title).split()))
+                self._high_water[kind] = row_id
+        if fresh:
+            with self._lock:
+                self._delta = self._delta + fresh
+                rebuild = len(self._delta) >= DELTA_LIMIT and not self._rebuilding
+                self._rebuilding = self._rebuilding or rebuild
+            if rebuild:
+                threading.Thread(target=self._compact, daemon=True).start()
+        return len(fresh)
+
+    def _compact(self) -> None:
+        try:
+            index, delta = self._index, self._delta
+            entries = [(index.pops[n], index.kinds[n], index.tmdb_ids[n], index.titles[n])
+                       for n in range(len(index))] if index else []
+            merged = _Index(entries + [entry for entry, _ in delta])
+            with self._lock:
+                self._index, self._delta = merged, self._delta[len(delta):]
+        finally:
+            self._rebuilding = False
+
+    @staticmethod
+    def _unindexed(token: str, fuzzy: bool) -> tuple[str, ...]:
+        """Prefixes for a token the snapshot doesn't know (it may be in the delta)."""
+        if not fuzzy or len(token) < 3:
+            return (token,)
+        return (token, *set().union(*_edits(token)))
+
+    def suggest(self, q: str, limit: int = 10, fuzzy: bool = True) -> list[dict]:
+        index, delta = self._index, self._delta
+        tokens = normalize(q).split()
+        if index is None or not tokens:
+            return []
+        resolved = [index.prefixes(t, fuzzy) for t in tokens]
+        required = [tuple(p) or self._unindexed(t, fuzzy and bool(delta)) for p, t in zip(resolved, tokens)]
+        out: list[tuple[float, int, int, str]] = []
+        if all(resolved):
+            # Drive from the rarest token; check the others against the title.
+            driver = min(range(len(tokens)), key=lambda i: index.cost(resolved[i]))
+            others = required[:driver] + required[driver + 1:]
+            for scanned, n in enumerate(index.candidates(resolved[driver], alone=not others)):
+                if scanned >= MAX_SCAN or len(out) >= limit:
+                    break
+                if not others or _matches(normalize(index.titles[n]).split(), others):
+                    out.append((index.pops[n], index.kinds[n], index.tmdb_ids[n], index.titles[n]))
+        out.extend(entry for entry, words in delta if _matches(words, required))
+        out.sort(key=lambda e: -e[0])
+        return [{"title": title, "tmdb_id": tmdb_id, "media_type": KINDS[kind], "popularity_score": pop}
+                for pop, kind, tmdb_id, title in out[:limit]]
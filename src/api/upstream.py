@@ -0,0 +1,201 @@
+"""Upstream transport for the stream proxy: HTTP/2 where the CDN offers it,
+plus per-host connection stats.
+
+An HLS session pulls hundreds of small segments from one CDN host. Over
+HTTP/1.1 every concurrent fetch needs its own TCP+TLS connection. Over HTTP/2
+they become streams on one or two connections. ``UpstreamTransport`` keeps an
+HTTP/2-capable pool (ALPN picks h2 or http/1.1 per connection) next to a plain
+HTTP/1.1 pool. A host whose h2 connections fail at the protocol level is pinned
+to HTTP/1.1 for a while and the request is retried there once. The two pools
+split one connection budget; the plain pool only carries those pinned hosts,
+so it gets the smaller share.
+
+HTTP/2 needs the ``h2`` package (``httpx[http2]``); without it everything runs
+over HTTP/1.1 as before.
+
+NOTE: process-local, single worker — same as the rest of the proxy state.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (pulled in by httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+log = logging.getLogger("nautilus.proxy")
+
+PROXY_HTTP2 = os.getenv("PROXY_HTTP2", "1").lower() not in ("0", "false", "no")
+# How long a host stays on HTTP/1.1 after an h2 protocol failure.
+H1_FALLBACK_SECONDS = int(os.getenv("PROXY_H1_FALLBACK_SECONDS", "600"))
+# Fraction of the connection budget kept for the HTTP/1.1 fallback pool.
+H1_SHARE = 0.25
+_RATE_WINDOW = 5.0
+
+
+def split_limits(limits: httpx.Limits, share: float) -> tuple[httpx.Limits, httpx.Limits]:
+    """Divide ``limits`` into (``share`` of it, the rest); unlimited stays unlimited."""
+    def cut(n: Optional[int]) -> tuple[Optional[int], Optional[int]]:
+        if n is None:
+            return None, None
+        part = min(n - 1, max(1, round(n * share))) if n > 1 else n
+        return part, max(n - part, 1)
+
+    conns, keepalive = cut(limits.max_connections), cut(limits.max_keepalive_connections)
+    return tuple(httpx.Limits(max_connections=conns[i], max_keepalive_connections=keepalive[i],
+                              keepalive_expiry=limits.keepalive_expiry) for i in (0, 1))
+
+
+class HostStats:
+    __slots__ = ("requests", "errors", "error_rate", "active", "bytes", "h2_requests",
+                 "bytes_per_sec", "connections", "_window_start", "_window_bytes")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.error_rate = 0.0       # EWMA over recent requests
+        self.active = 0             # requests whose body is still open
+        self.bytes = 0
+        self.h2_requests = 0
+        self.bytes_per_sec = 0.0
+        # Connections with a body still open on them -> [open bodies, is h2],
+        # keyed by the response's network stream (one per connection).
+        self.connections: dict[object, list] = {}
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+
+    def finish(self, failed: bool) -> None:
+        self.requests += 1
+        self.errors += failed
+        self.error_rate = 0.05 * failed + 0.95 * self.error_rate
+
+    def add_bytes(self, n: int) -> None:
+        self.bytes += n
+        self._window_bytes += n
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= _RATE_WINDOW:
+            self.bytes_per_sec = self._window_bytes / elapsed
+            self._window_start, self._window_bytes = now, 0
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    """Counts body bytes for the host and marks the request done on close."""
+
+    def __init__(self, inner, stats: HostStats, failed: bool = False, conn: object = None):
+        self._inner = inner
+        self._stats = stats
+        self._failed = failed
+        self._conn = conn
+        self._closed = False
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._inner:
+                self._stats.add_bytes(len(chunk))
+                yield chunk
+        except Exception:
+            self._done(True)
+            raise
+
+    def _done(self, failed: bool) -> None:
+        if not self._closed:
+            self._closed = True
+            self._stats.active -= 1
+            self._stats.finish(failed)
+            use = self._stats.connections.get(self._conn)
+            if use is not None:
+                use[0] -= 1
+                if not use[0]:
+                    del self._stats.connections[self._conn]
+
+    async def aclose(self) -> None:
+        self._done(self._failed)
+        await self._inner.aclose()
+
+
+class UpstreamTransport(httpx.AsyncBaseTransport):
+    def __init__(self, limits: httpx.Limits, *, http2: bool = PROXY_HTTP2):
+        self.http2 = http2 and HTTP2_AVAILABLE
+        if self.http2:
+            h1_limits, h2_limits = split_limits(limits, H1_SHARE)
+            self._h1 = httpx.AsyncHTTPTransport(limits=h1_limits)
+            self._h2 = httpx.AsyncHTTPTransport(limits=h2_limits, http2=True)
+        else:
+            self._h1 = httpx.AsyncHTTPTransport(limits=limits)
+            self._h2 = None
+        self._h1_until: dict[str, float] = {}
+        self._stats: dict[str, HostStats] = {}
+
+    def _pick(self, host: str) -> httpx.AsyncHTTPTransport:
+        if self._h2 is None:
+            return self._h1
+        until = self._h1_until.get(host)
+        if until is not None:
+            if time.monotonic() < until:
+                return self._h1
+            del self._h1_until[host]
+        return self._h2
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        stats = self._stats.get(host)
+        if stats is None:
+            stats = self._stats[host] = HostStats()
+        transport = self._pick(host)
+        stats.active += 1
+        try:
+            try:
+                resp = await transport.handle_async_request(request)
+            except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as e:
+                if transport is self._h1:
+                    raise
+                log.info(f"[upstream] {host}: HTTP/2 failed ({e}), falling back to HTTP/1.1")
+                self._h1_until[host] = time.monotonic() + H1_FALLBACK_SECONDS
+                resp = await self._h1.handle_async_request(request)
+        except Exception:
+            stats.active -= 1
+            stats.finish(True)
+            raise
+        h2 = resp.extensions.get("http_version") == b"HTTP/2"
+        stats.h2_requests += h2
+        conn = resp.extensions.get("network_stream")
+        if conn is not None:
+            stats.connections.setdefault(conn, [0, h2])[0] += 1
+        resp.stream = _MeteredStream(resp.stream, stats, failed=resp.status_code >= 500, conn=conn)
+        return resp
+
+    async def aclose(self) -> None:
+        await self._h1.aclose()
+        if self._h2 is not None:
+            await self._h2.aclose()
+
+    # ── stats ──────────────────
+
+    def stats(self) -> dict:
+        """Per-host counters. Connections are counted while a response body is
+        open on them; idle keep-alive connections aren't included."""
+        hosts = {}
+        for host, st in self._stats.items():
+            busy = len(st.connections)
+            hosts[host] = {
+                "busy_connections": busy,
+                "busy_http2_connections": sum(h2 for _, h2 in st.connections.values()),
+                "active_requests": st.active,
+                "streams_per_connection": round(st.active / busy, 2) if busy else 0.0,
+                "requests": st.requests,
+                "http2_requests": st.h2_requests,
+                "bytes": st.bytes,
+                "bytes_per_sec": round(st.bytes_per_sec),
+                "errors": st.errors,
+                "error_rate": round(st.error_rate, 4),
+                "http1_fallback": host in self._h1_until,
+            }
+        return {"http2": self.http2, "hosts": hosts}
@@ -1,15 +1,30 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
+
+
+def _pool_args(url, prefix: str, size: int, overflow: int) -> dict:
+    """Pool sizing from {prefix}POOL_SIZE / MAX_OVERFLOW / POOL_TIMEOUT. SQLite
+    gets SQLAlchemy's default pool (nothing to size)."""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {"pool_size": int(os.getenv(f"{prefix}POOL_SIZE", size)),
+            "max_overflow": int(os.getenv(f"{prefix}MAX_OVERFLOW", overflow)),
+            "pool_timeout": float(os.getenv(f"{prefix}POOL_TIMEOUT", 30))}
+
+
 # pool_pre_ping validates a pooled connection before use — Neon/serverless
 # Postgres silently drops idle connections ("SSL connection has been closed
 # unexpectedly"), and without this the next query 500s. pool_recycle proactively
 # retires connections older than 5 min so we never hand out a dead one.
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=300)
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=300,
+                       **_pool_args(DATABASE_URL, "DB_", 5, 10))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -17,4 +32,53 @@ def get_db():
     try: 
         yield db
     finally: 
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def async_url(url):
+    """The async-driver form of a sync DATABASE_URL: asyncpg for Postgres
+    (libpq's sslmode becomes asyncpg's ssl; channel_binding is dropped),
+    aiosqlite for SQLite."""
+    u = make_url(url)
+    if u.get_backend_name() == "postgresql":
+        query = dict(u.query)
+        sslmode = query.pop("sslmode", None)
+        query.pop("channel_binding", None)
+        if sslmode and sslmode != "disable":
+            query["ssl"] = sslmode
+        return u.set(drivername="postgresql+asyncpg", query=query)
+    if u.get_backend_name() == "sqlite":
+        return u.set(drivername="sqlite+aiosqlite")
+    return u
+
+
+# Async path for the hot I/O endpoints: they await Postgres on the event loop
+# instead of holding one of the threadpool's threads for the whole round trip.
+# Same pre-ping/recycle as above. SQLite connections are per-event-loop, so
+# they aren't pooled.
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    _async_sqlite = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+    async_engine = create_async_engine(
+        async_url(DATABASE_URL), pool_pre_ping=True, pool_recycle=300,
+        **({"poolclass": NullPool} if _async_sqlite else _pool_args(DATABASE_URL, "ASYNC_DB_", 20, 30)))
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False,
+                                           expire_on_commit=False)
+except ImportError:   # asyncpg / aiosqlite not installed
+    async_engine = AsyncSessionLocal = None
+
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database path unavailable: install asyncpg (Postgres) or aiosqlite (SQLite)")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def dialect_insert(bind, table):
+    """INSERT for ``bind``'s dialect, so upserts can use on_conflict_* (Postgres or SQLite)."""
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
@@ -0,0 +1,149 @@
+"""Genre maps, normalization and the ``title_genres`` index.
+
+``Movie.genres`` / ``TVShow.genres`` are JSON in mixed shapes (TMDB dicts, bare
+ids, bare names), which used to force every genre filter to load thousands of
+rows and decode them in Python. The same data is kept normalized in
+``genres`` (id, name) and ``title_genres`` (media_type, genre_id, title_id),
+indexed both ways, so filters, counts and joins run in SQL.
+
+The JSON column stays the source of truth. An ``after_flush`` hook rewrites a
+title's ``title_genres`` rows whenever its ``genres`` value is inserted,
+reassigned or deleted, so ingestion, the search fallback and repair scripts
+keep the index current without knowing about it. ``rebuild_title_genres``
+normalizes existing rows (run by migrate_db.py).
+"""
+from __future__ import annotations
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from src.core import models
+from src.core.database import dialect_insert
+
+TMDB_GENRE_MAP = {
+    28: "Action", 12: "Adventure", 16: "Animation", 35: "Comedy",
+    80: "Crime", 99: "Documentary", 18: "Drama", 10751: "Family",
+    14: "Fantasy", 36: "History", 27: "Horror", 10402: "Music",
+    9648: "Mystery", 10749: "Romance", 878: "Sci-Fi", 10770: "TV Movie",
+    53: "Thriller", 10752: "War", 37: "Western"
+}
+
+# TV genre map (TMDB TV genres that differ from movie genres)
+TMDB_TV_GENRE_MAP = {
+    10759: "Action & Adventure", 16: "Animation", 35: "Comedy", 80: "Crime",
+    99: "Documentary", 18: "Drama", 10751: "Family", 10762: "Kids",
+    9648: "Mystery", 10763: "News", 10764: "Reality", 878: "Sci-Fi & Fantasy",
+    10765: "Sci-Fi & Fantasy", 10766: "Soap", 10767: "Talk", 10768: "War & Politics",
+    37: "Western"
+}
+
+# Name-only genres ("Drama") still land in the index.
+_NAME_TO_ID = {name.lower(): gid for gid, name in {**TMDB_TV_GENRE_MAP, **TMDB_GENRE_MAP}.items()}
+_NAME_TO_ID.update({"science fiction": 878, "sci-fi & fantasy": 10765})
+
+MEDIA_TYPES = {models.Movie: "movie", models.TVShow: "tv"}
+
+
+def normalize_genres(genres):
+    """Return list of {id,name} dicts from stored genres (list of dicts, ids, or names)."""
+    out = []
+    if not genres:
+        return out
+    if isinstance(genres, dict):
+        genres = [{"id": k, "name": v} for k, v in genres.items()]
+    for g in genres:
+        if isinstance(g, dict):
+            gid = g.get("id")
+            name = g.get("name") or TMDB_GENRE_MAP.get(gid)
+            if gid is not None and name:
+                out.append({"id": int(gid), "name": name})
+            elif name:
+                out.append({"id": None, "name": name})
+        elif isinstance(g, int):
+            out.append({"id": g, "name": TMDB_GENRE_MAP.get(g, str(g))})
+        elif isinstance(g, str):
+            out.append({"id": None, "name": g})
+    return out
+
+
+def genre_id_set(genres):
+    norm = normalize_genres(genres)
+    return {g["id"] for g in norm if g.get("id") is not None}
+
+
+def genre_rows(genres) -> dict[int, str]:
+    """genre id -> name for a stored genres value, resolving name-only entries."""
+    out = {}
+    for g in normalize_genres(genres):
+        gid = g["id"] if g["id"] is not None else _NAME_TO_ID.get(g["name"].lower())
+        if gid is not None:
+            out.setdefault(gid, g["name"])
+    return out
+
+
+def genre_ids_for(keys) -> set[int]:
+    """Genre ids for a mix of ids and names (e.g. a recommender's taste profile)."""
+    out = set()
+    for k in keys:
+        if isinstance(k, int):
+            out.add(k)
+        elif isinstance(k, str) and k.lower() in _NAME_TO_ID:
+            out.add(_NAME_TO_ID[k.lower()])
+    return out
+
+
+def _write(conn, media_type: str, titles: dict[int, object]) -> int:
+    """Replace the title_genres rows of ``titles`` (title id -> genres value)."""
+    TG, G = models.TitleGenre.__table__, models.Genre.__table__
+    ids = list(titles)
+    links, names = [], {}
+    for title_id, genres in titles.items():
+        for gid, name in genre_rows(genres).items():
+            links.append({"media_type": media_type, "genre_id": gid, "title_id": title_id})
+            names.setdefault(gid, name)
+    for i in range(0, len(ids), 500):
+        conn.execute(TG.delete().where(TG.c.media_type == media_type, TG.c.title_id.in_(ids[i:i + 500])))
+    if names:
+        known = {r[0] for r in conn.execute(G.select().with_only_columns(G.c.id).where(G.c.id.in_(list(names))))}
+        missing = [{"id": gid, "name": name} for gid, name in names.items() if gid not in known]
+        if missing:
+            # A concurrent flush may add the same genre between the SELECT and
+            # here; a PK violation would abort the caller's whole transaction.
+            conn.execute(dialect_insert(conn, G).values(missing).on_conflict_do_nothing())
+    if links:
+        conn.execute(TG.insert(), links)
+    return len(links)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_title_genres(session, flush_context):
+    changed: dict[str, dict[int, object]] = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        media_type = MEDIA_TYPES.get(type(obj))
+        if media_type is None:
+            continue
+        if obj in session.deleted:
+            genres = None
+        elif obj in session.new or sa_inspect(obj).attrs.genres.history.has_changes():
+            genres = obj.genres
+        else:
+            continue
+        changed.setdefault(media_type, {})[obj.id] = genres
+    for media_type, titles in changed.items():
+        _write(session.connection(), media_type, titles)
+
+
+def rebuild_title_genres(db: Session, batch_size: int = 1000) -> int:
+    """Re-derive title_genres for every movie and show. Returns rows written."""
+    written = 0
+    for model, media_type in MEDIA_TYPES.items():
+        last = 0
+        while True:
+            rows = (db.query(model.id, model.genres).filter(model.id > last)
+                    .order_by(model.id).limit(batch_size).all())
+            if not rows:
+                break
+            written += _write(db.connection(), media_type, dict(rows))
+            db.commit()
+            last = rows[-1][0]
+    return written
@@ -1,7 +1,9 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Text, JSON, DateTime, Boolean, UniqueConstraint
+from datetime import date, datetime
+from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Text, JSON, Date, DateTime, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.sql import func, text
 from src.core.database import DATABASE_URL
 
 # DATABASE CONNECTION
@@ -9,15 +11,44 @@ from src.core.database import DATABASE_URL
 
 Base = declarative_base()
 
+
+class ISODate(TypeDecorator):
+    """A real DATE column that reads and writes TMDB-style 'YYYY-MM-DD'
+    strings, so ingestion and API payloads are unchanged. '' and malformed
+    values are stored as NULL."""
+    impl = Date
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, date):
+            return value.date() if isinstance(value, datetime) else value
+        try:
+            return date.fromisoformat(str(value)[:10])
+        except ValueError:
+            return None
+
+    def process_result_value(self, value, dialect):
+        return value.isoformat() if value is not None else None
+
+
 # --- CONTENT TABLES ---
 class Movie(Base):
     __tablename__ = 'movies'
+    __table_args__ = (
+        # Keyset pagination: one (sort column, id) index per /movies sort
+        Index('ix_movies_popularity_id', 'popularity_score', 'id'),
+        Index('ix_movies_title_id', 'title', 'id'),
+        Index('ix_movies_release_date_id', 'release_date', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
     tmdb_id = Column(Integer, unique=True, index=True)
+    imdb_id = Column(String, index=True)
     overview = Column(Text)
-    release_date = Column(String)
+    release_date = Column(ISODate, index=True)
+    year = Column(Integer, index=True)
+    original_language = Column(String)
     genres = Column(JSON)           # Feature: Classification
     poster_path = Column(String)
     popularity_score = Column(Float) # Feature: Regression
@@ -32,11 +63,21 @@ class Movie(Base):
 
 class TVShow(Base):
     __tablename__ = 'tv_shows'
+    __table_args__ = (
+        Index('ix_tv_shows_popularity_id', 'popularity_score', 'id'),
+        Index('ix_tv_shows_title_id', 'title', 'id'),
+        Index('ix_tv_shows_first_air_date_id', 'first_air_date', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
     tmdb_id = Column(Integer, unique=True, index=True)
+    imdb_id = Column(String, index=True)
     overview = Column(Text)
+    year = Column(Integer, index=True)     # first_air_date year
+    first_air_date = Column(ISODate, index=True)
+    last_air_date = Column(ISODate, index=True)
+    original_language = Column(String)
     genres = Column(JSON)
     poster_path = Column(String)
     popularity_score = Column(Float)
@@ -53,7 +94,7 @@ class Season(Base):
     show_id = Column(Integer, ForeignKey('tv_shows.id'))
     season_number = Column(Integer)
     name = Column(String)
-    air_date = Column(String)
+    air_date = Column(ISODate, index=True)
 
     show = relationship("TVShow", back_populates="seasons")
     episodes = relationship(
@@ -74,7 +115,7 @@ class Episode(Base):
     title = Column(String)
     overview = Column(Text)
     runtime_minutes = Column(Integer)
-    air_date = Column(String)
+    air_date = Column(ISODate, index=True)
     still_path = Column(String)
     
     stream_url = Column(String)
@@ -83,6 +124,42 @@ class Episode(Base):
     
     season = relationship("Season", back_populates="episodes")
 
+class Genre(Base):
+    __tablename__ = 'genres'
+    id = Column(Integer, primary_key=True)  # TMDB genre id
+    name = Column(String, nullable=False)
+
+class TitleGenre(Base):
+    """Normalized Movie.genres / TVShow.genres, kept in sync by src.core.genres."""
+    __tablename__ = 'title_genres'
+    __table_args__ = (
+        Index('ix_title_genres_title', 'media_type', 'title_id'),
+    )
+    media_type = Column(String, primary_key=True)   # 'movie' | 'tv'
+    genre_id = Column(Integer, ForeignKey('genres.id'), primary_key=True)
+    title_id = Column(Integer, primary_key=True)    # movies.id / tv_shows.id
+
+class TitleRatingStats(Base):
+    """Running rating aggregates per title, maintained by src.core.rating_stats."""
+    __tablename__ = 'title_rating_stats'
+    __table_args__ = (
+        Index('ix_title_rating_stats_rank', 'media_type', 'weighted_score'),
+    )
+    media_type = Column(String, primary_key=True)   # 'movie' | 'tv' | '*' (all titles)
+    title_id = Column(Integer, primary_key=True)    # movies.id / tv_shows.id, 0 for '*'
+    rating_sum = Column(Float, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    avg_rating = Column(Float)
+    weighted_score = Column(Float)                  # Bayesian average
+
+class MovieAvailability(Base):
+    """Digital/physical release status per movie, for the CAM/TS badge."""
+    __tablename__ = 'movie_availability'
+    tmdb_id = Column(Integer, primary_key=True)
+    has_digital = Column(Boolean, default=False)
+    digital_date = Column(DateTime)         # earliest digital/physical release, UTC
+    checked_at = Column(DateTime, index=True)
+
 # --- USER & ANALYTICS ---
 class User(Base):
     __tablename__ = 'users'
@@ -95,8 +172,22 @@ class User(Base):
     
     interactions = relationship("Interaction", back_populates="user")
 
+def _partial(name, *cols, where):
+    return Index(name, *cols, postgresql_where=text(where), sqlite_where=text(where))
+
 class Interaction(Base):
     __tablename__ = 'interactions'
+    __table_args__ = (
+        # /interact, /interactions/status, /collections/watchlist, guest recs
+        _partial('ix_interactions_user_movie', 'user_id', 'interaction_type', 'movie_id', where='movie_id IS NOT NULL'),
+        _partial('ix_interactions_user_show', 'user_id', 'interaction_type', 'tv_show_id', where='tv_show_id IS NOT NULL'),
+        # Title -> interactions joins, co-watchers
+        _partial('ix_interactions_movie', 'movie_id', 'interaction_type', 'user_id', where='movie_id IS NOT NULL'),
+        _partial('ix_interactions_show', 'tv_show_id', 'interaction_type', 'user_id', where='tv_show_id IS NOT NULL'),
+        # /trending: per-title counts in a time window, answered from the index alone
+        _partial('ix_interactions_recent_movie', 'movie_id', 'timestamp', where='movie_id IS NOT NULL'),
+        _partial('ix_interactions_recent_show', 'tv_show_id', 'timestamp', where='tv_show_id IS NOT NULL'),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=True) # Allow null for guest users
     
@@ -148,6 +239,11 @@ class WatchProgress(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
+# Registers the title_genres / title_rating_stats hooks wherever the models are used.
+from src.core import genres as _genres  # noqa: E402,F401
+from src.core import rating_stats as _rating_stats  # noqa: E402,F401
+
+
 def init_db():
     engine = create_engine(DATABASE_URL)
     Base.metadata.create_all(engine)
@@ -0,0 +1,95 @@
+"""Keyset pagination for the /movies and /shows catalog listings.
+
+``OFFSET n`` makes the database walk and discard n rows, so page 500 of a
+listing costs 500 times page 1. Listings are now ordered by (sort column, id)
+and a page continues from the last row it returned:
+
+    WHERE (popularity_score, id) < (:last_value, :last_id)
+    ORDER BY popularity_score DESC, id DESC
+
+A (sort column, id) index serves that as one range scan, whatever the depth.
+Titles with no sort value (NULL popularity or date) come last, ordered by id.
+They form a second segment, which is the same range scan with
+``sort column IS NULL``. The position travels as an opaque cursor: url-safe
+base64 of ``[sort, last value, last id]``.
+
+``skip`` still works for offset clients. It pages through the same total
+order, so a client can switch to the cursor from any page.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from typing import Optional
+
+from sqlalchemy import literal, tuple_
+
+from src.core import models
+
+# sort -> (column name, descending). "rating" ranks by popularity as before;
+# "year" uses each table's own date column.
+SORTS = {
+    "popularity": ("popularity_score", True),
+    "rating": ("popularity_score", True),
+    "title": ("title", False),
+    "year": (None, True),
+}
+DATE_COLUMNS = {models.Movie: "release_date", models.TVShow: "first_air_date"}
+
+
+def sort_key(model, sort: str) -> tuple[object, bool]:
+    name, desc = SORTS.get(sort, SORTS["popularity"])
+    return getattr(model, name or DATE_COLUMNS[model]), desc
+
+
+def encode(sort: str, value, row_id: int) -> str:
+    raw = json.dumps([sort, value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode(cursor: str, sort: str) -> tuple[object, int]:
+    """(last value, last id) from a cursor; ValueError if it isn't one of ours
+    or was issued for another sort order."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, row_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("malformed cursor")
+    if cursor_sort != sort or not isinstance(row_id, int):
+        raise ValueError("cursor belongs to a different sort order")
+    return value, row_id
+
+
+def next_cursor(model, sort: str, rows: list, limit: int) -> Optional[str]:
+    """Cursor for the page after ``rows``; None once a page comes back short."""
+    if not rows or len(rows) < limit:
+        return None
+    col, _ = sort_key(model, sort)
+    return encode(sort, getattr(rows[-1], col.key), rows[-1].id)
+
+
+def page(query, model, sort: str = "popularity", limit: int = 50, skip: int = 0,
+         cursor: Optional[str] = None) -> list:
+    """One page of ``query`` (already filtered) in (sort column, id) order."""
+    col, desc = sort_key(model, sort)
+    if cursor is None and skip:
+        order = (col.desc().nulls_last(), model.id.desc()) if desc else (col.asc().nulls_last(), model.id.asc())
+        return query.order_by(*order).offset(skip).limit(limit).all()
+
+    ids = model.id.desc() if desc else model.id.asc()
+    after = (lambda a, b: a < b) if desc else (lambda a, b: a > b)
+    value, last_id = decode(cursor, sort) if cursor else (None, None)
+
+    rows = []
+    if cursor is None or value is not None:
+        q = query.filter(col.isnot(None))
+        if cursor:
+            q = q.filter(after(tuple_(col, model.id), tuple_(literal(value, col.type), literal(last_id))))
+        rows = q.order_by(col.desc() if desc else col.asc(), ids).limit(limit).all()
+    if len(rows) < limit:
+        q = query.filter(col.is_(None))
+        if cursor and value is None:
+            q = q.filter(after(model.id, last_id))
+        rows += q.order_by(ids).limit(limit - len(rows)).all()
+    return rows
@@ -0,0 +1,133 @@
+"""Running rating aggregates per title (``title_rating_stats``).
+
+Top-rated rows, critics' picks and the admin leaderboard used to run
+AVG/COUNT GROUP BY over the whole interactions table on every cache miss. Each
+title now has a row with rating_sum, rating_count, avg_rating and a Bayesian
+weighted score
+
+    weighted = (rating_sum + m * C) / (rating_count + m)
+
+where C is the mean over all ratings and m is RATING_PRIOR_VOTES. With this, three
+5-star votes don't outrank three hundred 4.8s. Rankings walk the
+(media_type, weighted_score) index and touch only the rows they return.
+
+An ``after_flush`` hook applies every Interaction insert/delete inside the same
+transaction, so /interact and the seeder keep the table current. A ``'*'`` row
+holds the global sum/count, which gives C in O(1). Scores of untouched titles
+drift slightly as C moves, and bulk deletes bypass the hook. ``reconcile``
+recomputes everything from interactions: daily from main.py, on demand via
+reconcile_ratings.py.
+"""
+from __future__ import annotations
+
+import math
+import os
+from typing import Optional
+
+from sqlalchemy import and_, case, event, func, select, true
+from sqlalchemy.orm import Session
+
+from src.core import models
+from src.core.database import dialect_insert
+
+PRIOR_VOTES = int(os.getenv("RATING_PRIOR_VOTES", "5"))
+ALL = "*"                   # media_type of the global row (title_id 0)
+
+
+def weighted(rating_sum: float, rating_count: int, mean: float) -> Optional[float]:
+    if rating_count + PRIOR_VOTES <= 0:
+        return None
+    return (rating_sum + PRIOR_VOTES * mean) / (rating_count + PRIOR_VOTES)
+
+
+def _title_key(i: models.Interaction) -> Optional[tuple[str, int]]:
+    if i.movie_id is not None:
+        return "movie", i.movie_id
+    if i.tv_show_id is not None:
+        return "tv", i.tv_show_id
+    return None
+
+
+def apply(conn, deltas: dict[tuple[str, int], tuple[float, int]]) -> None:
+    """Add (sum, count) deltas to the title rows and the global row."""
+    if not deltas:
+        return
+    T = models.TitleRatingStats.__table__
+    total = (sum(d[0] for d in deltas.values()), sum(d[1] for d in deltas.values()))
+    deltas = {**deltas, (ALL, 0): total}
+    g = conn.execute(select(T.c.rating_sum, T.c.rating_count)
+                     .where(T.c.media_type == ALL, T.c.title_id == 0)).first()
+    g_sum, g_count = (g[0] + total[0], g[1] + total[1]) if g else total
+    mean = g_sum / g_count if g_count > 0 else 0.0
+    for (media_type, title_id), (d_sum, d_count) in deltas.items():
+        new_sum, new_count = T.c.rating_sum + d_sum, T.c.rating_count + d_count
+        stmt = dialect_insert(conn, T).values(
+            media_type=media_type, title_id=title_id, rating_sum=d_sum, rating_count=d_count,
+            avg_rating=d_sum / d_count if d_count > 0 else None,
+            weighted_score=weighted(d_sum, d_count, mean))
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[T.c.media_type, T.c.title_id],
+            set_={"rating_sum": new_sum, "rating_count": new_count,
+                  "avg_rating": case((new_count > 0, new_sum / new_count), else_=None),
+                  "weighted_score": (new_sum + PRIOR_VOTES * mean) / (new_count + PRIOR_VOTES)}))
+
+
+@event.listens_for(Session, "after_flush")
+def _track_interactions(session, flush_context):
+    deltas: dict[tuple[str, int], tuple[float, int]] = {}
+    for objs, sign in ((session.new, 1), (session.deleted, -1)):
+        for obj in objs:
+            if not isinstance(obj, models.Interaction) or obj.rating_value is None:
+                continue
+            key = _title_key(obj)
+            if key is not None:
+                s, c = deltas.get(key, (0.0, 0))
+                deltas[key] = (s + sign * obj.rating_value, c + sign)
+    apply(session.connection(), deltas)
+
+
+def top(db: Session, model, media_type: str, min_votes: int = 1, skip: int = 0, limit: int = 50) -> list:
+    """(title, stats) pairs with at least ``min_votes`` ratings, best weighted score first."""
+    T = models.TitleRatingStats
+    return (db.query(model, T)
+            .join(T, and_(T.media_type == media_type, T.title_id == model.id))
+            .filter(T.rating_count >= min_votes)
+            .order_by(T.weighted_score.desc())
+            .offset(skip).limit(limit).all())
+
+
+def reconcile(db: Session) -> int:
+    """Recompute every row from interactions and refresh all weighted scores
+    against the current global mean. Returns the number of rows whose sum or
+    count had drifted (including missing and orphaned rows)."""
+    Ix, T = models.Interaction, models.TitleRatingStats
+    fresh: dict[tuple[str, int], tuple[float, int]] = {}
+    for col, media_type, extra in ((Ix.movie_id, "movie", true()),
+                                   (Ix.tv_show_id, "tv", Ix.movie_id.is_(None))):
+        rows = (db.query(col, func.sum(Ix.rating_value), func.count(Ix.rating_value))
+                .filter(col.isnot(None), Ix.rating_value.isnot(None), extra).group_by(col))
+        for title_id, s, c in rows:
+            fresh[(media_type, title_id)] = (float(s or 0), int(c))
+    g_sum, g_count = sum(v[0] for v in fresh.values()), sum(v[1] for v in fresh.values())
+    fresh[(ALL, 0)] = (g_sum, g_count)
+    mean = g_sum / g_count if g_count else 0.0
+
+    drifted = 0
+    existing = {(r.media_type, r.title_id): r for r in db.query(T)}
+    for key, row in existing.items():
+        if key not in fresh:
+            db.delete(row)
+            drifted += 1
+    for (media_type, title_id), (s, c) in fresh.items():
+        row = existing.get((media_type, title_id))
+        if row is None:
+            row = T(media_type=media_type, title_id=title_id)
+            db.add(row)
+            drifted += 1
+        elif row.rating_count != c or not math.isclose(row.rating_sum or 0, s, abs_tol=1e-6):
+            drifted += 1
+        row.rating_sum, row.rating_count = s, c
+        row.avg_rating = s / c if c else None
+        row.weighted_score = weighted(s, c, mean)
+    db.commit()
+    return drifted
@@ -0,0 +1,143 @@
+"""Indexed title search for /search.
+
+``/search`` used to run ``title ILIKE '%q%'``, a sequential scan on every
+keystroke. Matching now goes through an index on each backend:
+
+* Postgres: a pg_trgm GIN index on title (substring and typo-tolerant
+  matches) and a GIN index on the English tsvector of title + overview.
+* SQLite (local dev): FTS5 tables over title + overview, kept in sync with
+  movies / tv_shows by triggers, queried as token-prefix matches.
+
+Each backend returns its best ``CANDIDATES`` by text relevance. ``search``
+then blends that relevance with popularity, so a well-known match outranks
+an obscure one with a marginally better text score. ``ensure_indexes`` is
+idempotent; migrate_db.py runs it, and ``search`` runs it once per engine.
+If the indexes can't be created (no pg_trgm privileges, unknown dialect),
+search falls back to ILIKE.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+import threading
+
+from sqlalchemy import func, literal_column, or_, text
+from sqlalchemy.orm import Session
+
+from src.core import models
+
+log = logging.getLogger("nautilus.search")
+
+TABLES = {"movie": models.Movie, "tv": models.TVShow}
+CANDIDATES = 50
+POPULARITY_WEIGHT = float(os.getenv("SEARCH_POPULARITY_WEIGHT", "0.3"))
+
+_TSV = "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(overview, ''))"
+_ready: dict[str, bool] = {}        # engine url -> indexes usable
+_lock = threading.Lock()
+
+
+def ensure_indexes(engine) -> bool:
+    """Create the search indexes for ``engine``; True if indexed search is available."""
+    try:
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                for table in ("movies", "tv_shows"):
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_title_trgm "
+                                      f"ON {table} USING gin (title gin_trgm_ops)"))
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_search_tsv "
+                                      f"ON {table} USING gin ({_TSV})"))
+                return True
+            if conn.dialect.name == "sqlite":
+                for table in ("movies", "tv_shows"):
+                    _ensure_fts(conn, table)
+                return True
+    except Exception as e:
+        log.warning(f"[search] indexed search unavailable, using ILIKE: {e}")
+    return False
+
+
+def _ensure_fts(conn, table: str) -> None:
+    fts = f"{table}_fts"
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :n"), {"n": fts}).first():
+        return
+    conn.execute(text(f"CREATE VIRTUAL TABLE {fts} USING fts5(title, overview, content='{table}', "
+                      f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"))
+    conn.execute(text(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                      f"INSERT INTO {fts}(rowid, title, overview) VALUES (new.id, new.title, new.overview); END"))
+    conn.execute(text(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                      f"INSERT INTO {fts}({fts}, rowid, title, overview) "
+                      f"VALUES ('delete', old.id, old.title, old.overview); END"))
+    conn.execute(text(f"CREATE TRIGGER {fts}_au AFTER UPDATE OF title, overview ON {table} BEGIN "
+                      f"INSERT INTO {fts}({fts}, rowid, title, overview) "
+                      f"VALUES ('delete', old.id, old.title, old.overview); "
+                      f"INSERT INTO {fts}(rowid, title, overview) VALUES (new.id, new.title, new.overview); END"))
+    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def _indexed(engine) -> bool:
+    key = str(engine.url)
+    if key not in _ready:
+        with _lock:
+            if key not in _ready:
+                _ready[key] = ensure_indexes(engine)
+    return _ready[key]
+
+
+def _like(query: str) -> str:
+    return "%" + re.sub(r"([\\%_])", r"\\\1", query) + "%"
+
+
+def _pg_candidates(db: Session, model, query: str) -> list[tuple[object, float]]:
+    tsv, tsq = literal_column(_TSV), func.plainto_tsquery("english", query)
+    rel = func.similarity(model.title, query) + func.ts_rank_cd(tsv, tsq)
+    return (db.query(model, rel)
+            .filter(or_(model.title.ilike(_like(query), escape="\\"),
+                        model.title.op("%")(query), tsv.op("@@")(tsq)))
+            .order_by(rel.desc()).limit(CANDIDATES).all())
+
+
+def _fts_candidates(db: Session, model, query: str) -> list[tuple[object, float]]:
+    tokens = re.findall(r"\w+", query.lower())
+    if not tokens:
+        return []
+    fts = f"{model.__tablename__}_fts"
+    # Every token as a prefix ("matr" finds "The Matrix"); title hits weigh 10x.
+    hits = db.execute(text(f"SELECT rowid, -bm25({fts}, 10.0, 1.0) AS rel FROM {fts} "
+                           f"WHERE {fts} MATCH :m ORDER BY rel DESC LIMIT :n"),
+                      {"m": " ".join(f'"{t}"*' for t in tokens), "n": CANDIDATES}).all()
+    rows = {r.id: r for r in db.query(model).filter(model.id.in_([h[0] for h in hits]))} if hits else {}
+    return [(rows[rid], rel) for rid, rel in hits if rid in rows]
+
+
+def _like_candidates(db: Session, model, query: str) -> list[tuple[object, float]]:
+    rows = (db.query(model).filter(model.title.ilike(_like(query), escape="\\"))
+            .order_by(model.popularity_score.desc()).limit(CANDIDATES).all())
+    return [(r, 1.0) for r in rows]
+
+
+def search(db: Session, query: str, limit: int = 5) -> dict[str, list]:
+    """Best ``limit`` movies and shows for ``query``, keyed by media type."""
+    engine = db.get_bind()
+    if not _indexed(engine):
+        find = _like_candidates
+    elif engine.dialect.name == "postgresql":
+        find = _pg_candidates
+    else:
+        find = _fts_candidates
+    out = {}
+    for media_type, model in TABLES.items():
+        candidates = find(db, model, query)
+        top_rel = max((rel for _, rel in candidates), default=0) or 1
+        top_pop = math.log1p(max((r.popularity_score or 0 for r, _ in candidates), default=0)) or 1
+
+        def score(pair):
+            row, rel = pair
+            pop = math.log1p(max(row.popularity_score or 0, 0)) / top_pop
+            return (1 - POPULARITY_WEIGHT) * rel / top_rel + POPULARITY_WEIGHT * pop
+
+        out[media_type] = [row for row, _ in sorted(candidates, key=score, reverse=True)[:limit]]
+    return out
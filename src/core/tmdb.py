@@ -0,0 +1,401 @@
+"""One TMDB client for the whole app.
+
+Every TMDB call goes through ``TMDBClient``:
+
+* one pooled ``httpx.AsyncClient`` (keepalive to api.themoviedb.org instead of
+  a fresh connection per ``requests.get``);
+* a token bucket kept under TMDB's per-IP rate limit (``TMDB_RATE_PER_SEC``);
+* single-flight: concurrent requests for the same URL share one upstream call;
+* a persistent SQLite response cache with per-endpoint TTLs. Expired entries
+  are revalidated with ``If-None-Match`` and served stale if TMDB is down.
+  Entries expired for longer than ``TMDB_CACHE_STALE_DAYS`` are purged, and the
+  file is capped at ``TMDB_CACHE_MAX_ROWS`` (oldest writes evicted first).
+
+The HTTP pool lives on a private event-loop thread, so async handlers
+(``await tmdb.get(...)``) and threadpool handlers (``tmdb.get_sync(...)``) share
+the same pool, limiter and in-flight table. Hits in the in-memory front are
+answered on the caller's thread without touching that loop. Sync callers read
+the SQLite file on their own (threadpool) thread; async callers never do, their
+disk lookups run on the client's loop thread.
+
+Responses are the decoded JSON (a new object per call, so callers may mutate
+it) or None on errors / non-200s.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Iterable, Optional
+from urllib.parse import urlencode
+
+import httpx
+
+log = logging.getLogger("nautilus.tmdb")
+
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+TMDB_CACHE_PATH = Path(os.getenv("TMDB_CACHE_PATH", "data/cache/tmdb.sqlite3"))
+# TMDB allows roughly 50 req/s per IP; stay a little under it.
+TMDB_RATE_PER_SEC = float(os.getenv("TMDB_RATE_PER_SEC", "40"))
+TMDB_TIMEOUT = float(os.getenv("TMDB_TIMEOUT", "8"))
+
+# First match wins; anything else gets DEFAULT_TTL.
+TTLS: list[tuple[re.Pattern, int]] = [
+    (re.compile(r"^/search/"), 600),
+    (re.compile(r"^/(discover|trending)/"), 3600),
+    (re.compile(r"^/movie/\d+/release_dates$"), 86400),
+    (re.compile(r"^/(movie|tv)/\d+/(recommendations|similar|videos)$"), 43200),
+    (re.compile(r"^/tv/\d+/season/\d+$"), 86400),
+    (re.compile(r"^/(movie|tv|collection)/\d+$"), 86400),
+]
+DEFAULT_TTL = 3600
+TMDB_CACHE_MAX_ROWS = int(os.getenv("TMDB_CACHE_MAX_ROWS", "200000"))
+# Expired entries are kept this long for revalidation and stale-on-error.
+TMDB_CACHE_STALE_DAYS = float(os.getenv("TMDB_CACHE_STALE_DAYS", "7"))
+_PURGE_EVERY = 1000     # writes between purges
+# TMDB caps append_to_response at 20 sub-requests per call.
+APPEND_LIMIT = 20
+_MEMORY_ENTRIES = 2048
+
+
+def ttl_for(path: str) -> int:
+    for pattern, ttl in TTLS:
+        if pattern.search(path):
+            return ttl
+    return DEFAULT_TTL
+
+
+# Detail params used wherever catalog fields are needed, so ingestion, the
+# backfill and /stream share cache entries.
+CATALOG_PARAMS = {"language": "en-US", "append_to_response": "external_ids"}
+
+
+def catalog_fields(details: dict) -> dict:
+    """``imdb_id`` / ``original_language`` / ``year`` catalog columns from a
+    movie or TV detail payload fetched with ``CATALOG_PARAMS``."""
+    date = details.get("release_date") or details.get("first_air_date") or ""
+    return {
+        "imdb_id": details.get("imdb_id") or (details.get("external_ids") or {}).get("imdb_id") or None,
+        "original_language": details.get("original_language") or None,
+        "year": int(date[:4]) if date[:4].isdigit() else None,
+    }
+
+
+def show_dates(details: dict) -> dict:
+    """``first_air_date`` / ``last_air_date`` columns from a TV payload."""
+    return {"first_air_date": details.get("first_air_date") or None,
+            "last_air_date": details.get("last_air_date") or None}
+
+
+class TokenBucket:
+    """Async token bucket; only ever used from the client's loop thread."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ResponseCache:
+    """SQLite-backed (url key -> body, etag, expiry) store with a small
+    in-memory front. Thread-safe: callers hit it from the threadpool. The front
+    and the file have separate locks, so a memory lookup never waits on disk."""
+
+    def __init__(self, path: Optional[Path], *, max_rows: int = TMDB_CACHE_MAX_ROWS,
+                 keep_stale: float = TMDB_CACHE_STALE_DAYS * 86400):
+        self.path = path
+        self.max_rows = max_rows
+        self.keep_stale = keep_stale
+        self._lock = threading.Lock()            # the in-memory front
+        self._disk_lock = threading.Lock()       # the SQLite connection
+        self._memory: "OrderedDict[str, tuple[bytes, Optional[str], float]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._opened = path is None
+        self._writes = 0
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        """Open the database on first use (caller holds the disk lock)."""
+        if not self._opened:
+            self._opened = True
+            try:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT,"
+                    " expires REAL NOT NULL)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+            except (OSError, sqlite3.Error) as e:
+                log.warning(f"[tmdb] response cache disabled: {e}")
+                self._db = None
+            else:
+                self._purge()
+        return self._db
+
+    def _purge(self) -> None:
+        """Drop long-expired entries, then the oldest writes beyond ``max_rows``
+        (caller holds the disk lock). INSERT OR REPLACE gives a rewritten key a new
+        rowid, so rowid order is write order."""
+        try:
+            self._db.execute("DELETE FROM responses WHERE expires < ?", (time.time() - self.keep_stale,))
+            (rows,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if rows > self.max_rows:
+                self._db.execute(
+                    "DELETE FROM responses WHERE rowid IN"
+                    " (SELECT rowid FROM responses ORDER BY rowid LIMIT ?)", (rows - self.max_rows,))
+        except sqlite3.Error as e:
+            log.warning(f"[tmdb] cache purge failed: {e}")
+
+    def recall(self, key: str) -> Optional[tuple[bytes, Optional[str], float]]:
+        """In-memory front only; never touches the disk."""
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                self._memory.move_to_end(key)
+            return hit
+
+    def get(self, key: str) -> Optional[tuple[bytes, Optional[str], float]]:
+        hit = self.recall(key)
+        if hit is not None:
+            return hit
+        with self._disk_lock:
+            db = self._conn()
+            if db is None:
+                return None
+            try:
+                row = db.execute(
+                    "SELECT body, etag, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None:
+            return None
+        hit = (bytes(row[0]), row[1], row[2])
+        with self._lock:
+            # A put() may have landed while the file was being read.
+            newer = self._memory.get(key)
+            if newer is not None:
+                return newer
+            self._remember(key, hit)
+        return hit
+
+    def put(self, key: str, body: bytes, etag: Optional[str], expires: float) -> None:
+        with self._lock:
+            self._remember(key, (body, etag, expires))
+        with self._disk_lock:
+            db = self._conn()
+            if db is not None:
+                try:
+                    db.execute(
+                        "INSERT OR REPLACE INTO responses (key, body, etag, expires) VALUES (?, ?, ?, ?)",
+                        (key, body, etag, expires))
+                except sqlite3.Error as e:
+                    log.debug(f"[tmdb] cache write failed: {e}")
+                self._writes += 1
+                if self._writes % _PURGE_EVERY == 0:
+                    self._purge()
+
+    def _remember(self, key: str, entry: tuple[bytes, Optional[str], float]) -> None:
+        """Caller holds the lock."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > _MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+
+class TMDBClient:
+    def __init__(self, api_key: Optional[str] = None, *, cache_path: Optional[Path] = TMDB_CACHE_PATH,
+                 rate: float = TMDB_RATE_PER_SEC, base_url: str = TMDB_BASE_URL,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._api_key = api_key
+        self.base_url = base_url
+        self.cache = ResponseCache(cache_path)
+        self._rate = rate
+        self._transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._start_lock = threading.Lock()
+
+    @property
+    def api_key(self) -> Optional[str]:
+        return self._api_key if self._api_key is not None else os.getenv("TMDB_API_KEY")
+
+    def __bool__(self) -> bool:
+        """True when an API key is configured."""
+        return bool(self.api_key)
+
+    # ── public API ──────────────────
+
+    async def get(self, path: str, params: Optional[dict] = None, *, ttl: Optional[int] = None) -> Any:
+        key = self._key(path, params)
+        hit = self.cache.recall(key)
+        if hit is not None and time.time() < hit[2]:
+            return json.loads(hit[0])
+        # The disk lookup (if any) happens on the client's loop thread.
+        return await asyncio.wrap_future(self._submit(key, path, params, ttl, cached=True))
+
+    def get_sync(self, path: str, params: Optional[dict] = None, *, ttl: Optional[int] = None) -> Any:
+        """Blocking variant for ``def`` endpoints and scripts."""
+        key = self._key(path, params)
+        fresh = self._fresh(key)
+        if fresh is not None:
+            return fresh
+        return self._submit(key, path, params, ttl).result()
+
+    async def get_many(self, requests: Iterable[tuple[str, Optional[dict]]]) -> list[Any]:
+        """Issue several GETs concurrently; results in order."""
+        return list(await asyncio.gather(*(self.get(path, params) for path, params in requests)))
+
+    def get_many_sync(self, requests: Iterable[tuple[str, Optional[dict]]]) -> list[Any]:
+        """Issue several GETs concurrently from sync code; results in order."""
+        futures = []
+        for path, params in requests:
+            key = self._key(path, params)
+            fresh = self._fresh(key)
+            if fresh is not None:
+                done: Future = Future()
+                done.set_result(fresh)
+                futures.append(done)
+            else:
+                futures.append(self._submit(key, path, params, None))
+        return [f.result() for f in futures]
+
+    def prefetch(self, requests: Iterable[tuple[str, Optional[dict]]]) -> None:
+        """Warm the cache for these GETs in the background; never blocks."""
+        for path, params in requests:
+            key = self._key(path, params)
+            hit = self.cache.get(key)
+            if hit is None or time.time() >= hit[2]:
+                self._submit(key, path, params, None)
+
+    def tv_seasons_sync(self, tv_id: int, language: str = "en-US") -> Optional[tuple[dict, dict[int, dict]]]:
+        """Show details plus every season's payload, keyed by season number.
+
+        Seasons ride along on the detail call via ``append_to_response`` (20
+        per call). The first call guesses seasons 0-19, which covers almost
+        every show in one round-trip; any seasons past that are fetched in
+        concurrent batches.
+        """
+        first = self.get_sync(f"/tv/{tv_id}", {
+            "language": language,
+            "append_to_response": ",".join(f"season/{n}" for n in range(APPEND_LIMIT))})
+        if first is None:
+            return None
+        wanted = [m["season_number"] for m in first.get("seasons", []) if m.get("season_number") is not None]
+        seasons = {n: first[f"season/{n}"] for n in wanted if isinstance(first.get(f"season/{n}"), dict)}
+        missing = [n for n in wanted if n not in seasons]
+        batches = [missing[i:i + APPEND_LIMIT] for i in range(0, len(missing), APPEND_LIMIT)]
+        pages = self.get_many_sync(
+            (f"/tv/{tv_id}", {"language": language,
+                              "append_to_response": ",".join(f"season/{n}" for n in batch)})
+            for batch in batches)
+        for batch, page in zip(batches, pages):
+            for n in batch:
+                season = (page or {}).get(f"season/{n}")
+                if isinstance(season, dict):
+                    seasons[n] = season
+        return first, seasons
+
+    # ── internals ──────────────────
+
+    @staticmethod
+    def _key(path: str, params: Optional[dict]) -> str:
+        items = sorted((k, str(v)) for k, v in (params or {}).items() if v is not None)
+        return f"{path}?{urlencode(items)}" if items else path
+
+    def _fresh(self, key: str) -> Any:
+        hit = self.cache.get(key)
+        if hit is not None and time.time() < hit[2]:
+            return json.loads(hit[0])
+        return None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="tmdb-client", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _submit(self, key: str, path: str, params: Optional[dict], ttl: Optional[int],
+                cached: bool = False) -> Future:
+        """Run the request on the client's loop; ``cached`` checks the response
+        cache there first."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._coalesced(key, path, params, ttl, cached), loop)
+
+    async def _coalesced(self, key: str, path: str, params: Optional[dict], ttl: Optional[int],
+                         cached: bool = False) -> Any:
+        if cached:
+            fresh = self._fresh(key)
+            if fresh is not None:
+                return fresh
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(key, path, params, ttl))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        body = await asyncio.shield(fut)
+        return json.loads(body) if body is not None else None
+
+    async def _fetch(self, key: str, path: str, params: Optional[dict], ttl: Optional[int]) -> Optional[bytes]:
+        if not self.api_key:
+            return None
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=TMDB_TIMEOUT, transport=self._transport,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16))
+            self._bucket = TokenBucket(self._rate)
+        stale = self.cache.get(key)
+        headers = {"If-None-Match": stale[1]} if stale is not None and stale[1] else {}
+        query = {k: v for k, v in (params or {}).items() if v is not None}
+        query["api_key"] = self.api_key
+        ttl = ttl if ttl is not None else ttl_for(path)
+
+        for attempt in range(2):
+            await self._bucket.acquire()
+            try:
+                r = await self._client.get(f"{self.base_url}{path}", params=query, headers=headers)
+            except Exception as e:
+                log.warning(f"[tmdb] {path}: {e}")
+                return stale[0] if stale is not None else None
+            if r.status_code == 429 and attempt == 0:
+                await asyncio.sleep(min(float(r.headers.get("retry-after", "1") or 1), 10.0))
+                continue
+            break
+
+        if r.status_code == 304 and stale is not None:
+            self.cache.put(key, stale[0], stale[1], time.time() + ttl)
+            return stale[0]
+        if r.status_code == 200:
+            body = r.content
+            self.cache.put(key, body, r.headers.get("etag"), time.time() + ttl)
+            return body
+        if r.status_code >= 500 and stale is not None:
+            return stale[0]
+        return None
+
+
+# App-wide instance; the key is read from the environment at call time.
+tmdb = TMDBClient()
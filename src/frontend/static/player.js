@@ -617,10 +617,8 @@ class NautilusPlayer {
                 },
                 // Proxy all sub-requests (segments, variant playlists, keys)
                 xhrSetup(xhr, url) {
-                    if (!url.startsWith('/proxy_stream')) {
-                        const proxied = self._proxyUrl(url, hdrs);
-                        xhr.open('GET', proxied, true);
-                    }
+                    const path = new URL(url, window.location.href).pathname;
+                    xhr.open('GET', path === '/proxy_stream' ? url : self._proxyUrl(url, hdrs), true);
                 }
             };
 
@@ -150,7 +150,7 @@ async function spinHelm() {
     let pick = null;
     try {
         let url;
-        if (type === 'movie') url = genre ? `/movies/genre/${genre}?limit=40` : `/movies/random?limit=40`;
+        if (type === 'movie') url = genre ? `/movies/genre/${genre}?limit=40` : `/movies/random?limit=40&has_poster=true`;
         else url = genre ? `/shows/genre/${genre}?limit=40` : `/shows?limit=120`;
         const list = await fetch(url).then(r => r.json());
         if (Array.isArray(list) && list.length) pick = list[Math.floor(Math.random() * list.length)];
@@ -550,6 +550,9 @@ async function loadCollection(type, page=1, filters={}) {
     const genre = filters.genre || 0;
     const sort = filters.sort || 'popularity';
     const year = filters.year || 0;
+    // "Next" continues from the previous page's cursor (constant cost at any
+    // depth); jumping to a numbered page falls back to skip.
+    const pageParam = filters.cursor ? `cursor=${encodeURIComponent(filters.cursor)}` : `skip=${(page-1)*PAGE_SIZE}`;
     
     if (type === 'watchlist') {
          title = 'Watchlist';
@@ -557,14 +560,14 @@ async function loadCollection(type, page=1, filters={}) {
          setActiveNav('Watchlist');
     } else if (type === 'movies') {
         title = 'All Movies';
-        let qs = `limit=${PAGE_SIZE}&skip=${(page-1)*PAGE_SIZE}&sort=${sort}`;
+        let qs = `limit=${PAGE_SIZE}&${pageParam}&sort=${sort}`;
         if (genre) qs += `&genre=${genre}`;
         if (year) qs += `&year=${year}`;
         endpoint = `/movies?${qs}`;
         setActiveNav('Movies');
     } else if (type === 'tv') {
         title = 'All TV Shows';
-        let qs = `limit=${PAGE_SIZE}&skip=${(page-1)*PAGE_SIZE}&sort=${sort}`;
+        let qs = `limit=${PAGE_SIZE}&${pageParam}&sort=${sort}`;
         if (genre) qs += `&genre=${genre}`;
         if (year) qs += `&year=${year}`;
         endpoint = `/shows?${qs}`;
@@ -574,6 +577,7 @@ async function loadCollection(type, page=1, filters={}) {
     try {
         const res = await fetch(endpoint);
         let items = await res.json();
+        const nextCursor = res.headers.get('X-Next-Cursor');
         
         if (type === 'watchlist' && Array.isArray(items)) items = items.reverse();
 
@@ -596,7 +600,8 @@ async function loadCollection(type, page=1, filters={}) {
             function makePaginationBar() {
                 const bar = document.createElement('div');
                 bar.className = 'filter-pagination';
-                const go = (p) => loadCollection(type, p, { genre, sort, year });
+                const go = (p) => loadCollection(type, p, { genre, sort, year,
+                    cursor: p === page + 1 ? nextCursor : null });
 
                 function addBtn(label, targetPage, disabled, active) {
                     const btn = document.createElement('button');
@@ -905,7 +910,7 @@ async function loadHomeData() {
             })(),
             fetch(`/collections/ai`),
             fetch(`/movies/genre/16?limit=20`), // animated spotlight
-            fetch(`/movies/random?limit=18`),
+            fetch(`/movies/random?limit=18&has_poster=true`),
             fetch(`/trending?days=30&limit=40`)
         ]);
 
@@ -1710,7 +1715,7 @@ async function refreshRandom(btn) {
     btn.disabled = true;
     btn.innerText = "Loading...";
     try {
-        const res = await fetch(`/movies/random?limit=15`);
+        const res = await fetch(`/movies/random?limit=15&has_poster=true`);
         const items = await res.json();
         const scroller = document.getElementById('random-scroller');
         scroller.innerHTML = '';
@@ -1825,13 +1830,13 @@ async function sendInteraction(action, tmdbId, type) {
 // --- RANDOM MOVIE (Header Button) ---
 async function playRandomMovie() {
     try {
-        const res = await fetch('/movies/random?limit=1');
+        const res = await fetch('/movies/random?limit=1&has_poster=true');
         const items = await res.json();
         if (items.length > 0 && items[0].poster_path) {
             openModal(items[0], 'movie');
         } else {
             // Try again
-            const res2 = await fetch('/movies/random?limit=5');
+            const res2 = await fetch('/movies/random?limit=5&has_poster=true');
             const items2 = await res2.json();
             const valid = items2.find(i => i.poster_path);
             if (valid) openModal(valid, 'movie');
@@ -0,0 +1,74 @@
+"""One-off backfill of imdb_id / original_language / year (and a show's
+first/last air dates) for catalog rows ingested before those columns existed
+(run migrate_db.py first).
+
+Detail calls for a batch go out concurrently through the shared TMDB client,
+whose token bucket keeps the job under TMDB's rate limit. Rows are walked by
+primary key, so a title TMDB no longer knows is skipped rather than retried.
+
+    python -m src.services.ingestion.backfill_catalog [--batch 200] [--limit N]
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import or_
+
+sys.path.append(os.getcwd())
+from src.core.database import SessionLocal
+from src.core.models import Movie, TVShow
+from src.core.tmdb import tmdb, catalog_fields, show_dates, CATALOG_PARAMS
+
+
+def backfill(model, media_type: str, batch_size: int = 200, limit: int | None = None,
+             client=tmdb, session_factory=SessionLocal) -> int:
+    """Fill missing catalog fields for ``model`` rows; returns rows updated."""
+    db = session_factory()
+    updated = seen = last_id = 0
+    missing = [model.imdb_id.is_(None), model.original_language.is_(None)]
+    if model is TVShow:
+        missing.append(model.first_air_date.is_(None))
+    try:
+        while limit is None or seen < limit:
+            size = batch_size if limit is None else min(batch_size, limit - seen)
+            rows = (db.query(model)
+                    .filter(model.id > last_id, or_(*missing))
+                    .order_by(model.id).limit(size).all())
+            if not rows:
+                break
+            seen += len(rows)
+            last_id = rows[-1].id
+            details = client.get_many_sync((f"/{media_type}/{row.tmdb_id}", CATALOG_PARAMS) for row in rows)
+            for row, detail in zip(rows, details):
+                if not detail:
+                    continue
+                fields = catalog_fields(detail)
+                if model is TVShow:
+                    fields.update(show_dates(detail))
+                for col, value in fields.items():
+                    if value is not None and getattr(row, col) is None:
+                        setattr(row, col, value)
+                updated += 1
+            db.commit()
+            print(f"  {media_type}: {updated}/{seen} rows filled")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill imdb_id / original_language / year")
+    parser.add_argument("--batch", type=int, default=200, help="Rows per concurrent batch")
+    parser.add_argument("--limit", type=int, default=None, help="Max rows per table")
+    parser.add_argument("--kind", choices=("movies", "shows", "all"), default="all")
+    args = parser.parse_args()
+
+    if not tmdb:
+        sys.exit("TMDB_API_KEY is not set")
+    if args.kind in ("movies", "all"):
+        print(f"Movies: {backfill(Movie, 'movie', args.batch, args.limit)} updated")
+    if args.kind in ("shows", "all"):
+        print(f"Shows: {backfill(TVShow, 'tv', args.batch, args.limit)} updated")
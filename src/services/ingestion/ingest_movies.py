@@ -1,24 +1,21 @@
 import os
 import time
-import requests
 import argparse
 from tqdm import tqdm
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 from src.core.models import Movie 
+from src.core.tmdb import tmdb, catalog_fields, CATALOG_PARAMS
 from typing import Dict, List
 
 load_dotenv()
-API_KEY = os.getenv("TMDB_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 engine = create_engine(DATABASE_URL)
 Session = sessionmaker(bind=engine)
 session = Session()
 
-BASE_URL = "https://api.themoviedb.org/3"
-
 # --- GENRE HELPERS ---
 _MOVIE_GENRE_MAP: Dict[int, str] | None = None
 
@@ -28,10 +25,7 @@ def load_genre_map() -> Dict[int, str]:
     if _MOVIE_GENRE_MAP is not None:
         return _MOVIE_GENRE_MAP
     try:
-        url = f"{BASE_URL}/genre/movie/list?api_key={API_KEY}&language=en-US"
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
+        data = tmdb.get_sync("/genre/movie/list", {"language": "en-US"}) or {}
         _MOVIE_GENRE_MAP = {g["id"]: g["name"] for g in data.get("genres", [])}
     except Exception:
         _MOVIE_GENRE_MAP = {}
@@ -50,8 +44,7 @@ def format_genres(genre_ids: List[int]) -> List[dict]:
 def fetch_movies(pages=None, fetch_all=False, start_page=1):
     # 1. Get Total Pages
     try:
-        init_url = f"{BASE_URL}/movie/popular?api_key={API_KEY}&language=en-US&page=1"
-        init_data = requests.get(init_url, timeout=10).json()
+        init_data = tmdb.get_sync("/movie/popular", {"language": "en-US", "page": 1})
         total_available = init_data['total_pages']
     except Exception as e:
         print(f"❌ Connection failed init: {e}")
@@ -65,30 +58,32 @@ def fetch_movies(pages=None, fetch_all=False, start_page=1):
     
     for page in tqdm(range(start_page, limit + 1), desc="Fetching Movies", initial=start_page, total=limit):
         try:
-            url = f"{BASE_URL}/movie/popular?api_key={API_KEY}&language=en-US&page={page}"
-            # ADDED TIMEOUT
-            response = requests.get(url, timeout=10)
+            data = tmdb.get_sync("/movie/popular", {"language": "en-US", "page": page})
             
-            if response.status_code != 200:
-                print(f"⚠️ Error on page {page}: {response.status_code}")
+            if data is None:
+                print(f"⚠️ Error on page {page}")
                 time.sleep(1)
                 continue
                 
-            genre_map = load_genre_map()
-            for item in response.json().get('results', []):
-                if not session.query(Movie).filter_by(tmdb_id=item['id']).first():
-                    genres = format_genres(item.get('genre_ids', []))
-                    movie = Movie(
-                        title=item['title'],
-                        tmdb_id=item['id'],
-                        overview=item['overview'],
-                        release_date=item.get('release_date'),
-                        poster_path=item['poster_path'],
-                        popularity_score=item['popularity'],
-                        genres=genres,
-                        is_downloaded=False
-                    )
-                    session.add(movie)
+            new_items = [item for item in data.get('results', [])
+                         if not session.query(Movie).filter_by(tmdb_id=item['id']).first()]
+            # imdb_id isn't in list results; fetch the page's details concurrently.
+            details = tmdb.get_many_sync((f"/movie/{item['id']}", CATALOG_PARAMS)
+                                         for item in new_items)
+            for item, detail in zip(new_items, details):
+                genres = format_genres(item.get('genre_ids', []))
+                movie = Movie(
+                    title=item['title'],
+                    tmdb_id=item['id'],
+                    overview=item['overview'],
+                    release_date=item.get('release_date'),
+                    poster_path=item['poster_path'],
+                    popularity_score=item['popularity'],
+                    genres=genres,
+                    is_downloaded=False,
+                    **catalog_fields(detail or item)
+                )
+                session.add(movie)
             
             session.commit()
             time.sleep(0.1) 
@@ -108,11 +103,9 @@ def backfill_missing_genres(batch_size: int = 200):
     updated = 0
     for movie in qs:
         try:
-            url = f"{BASE_URL}/movie/{movie.tmdb_id}?api_key={API_KEY}&language=en-US"
-            resp = requests.get(url, timeout=10)
-            if resp.status_code != 200:
+            data = tmdb.get_sync(f"/movie/{movie.tmdb_id}", {"language": "en-US"})
+            if data is None:
                 continue
-            data = resp.json()
             g_ids = [g.get('id') for g in data.get('genres', []) if g.get('id') is not None]
             formatted = format_genres(g_ids)
             if formatted:
@@ -1,26 +1,21 @@
 import os
 import time
-import requests
 import argparse
 from tqdm import tqdm
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from src.core.models import TVShow, Season, Episode
+from src.core.tmdb import tmdb, catalog_fields, show_dates, CATALOG_PARAMS
 from typing import Dict, List
 
 load_dotenv()
-API_KEY = os.getenv("TMDB_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 engine = create_engine(DATABASE_URL)
 Session = sessionmaker(bind=engine)
 session = Session()
 
-BASE_URL = "https://api.themoviedb.org/3"
-
 # --- GENRE HELPERS ---
 _TV_GENRE_MAP: Dict[int, str] | None = None
 
@@ -30,10 +25,7 @@ def load_tv_genre_map() -> Dict[int, str]:
     if _TV_GENRE_MAP is not None:
         return _TV_GENRE_MAP
     try:
-        url = f"{BASE_URL}/genre/tv/list?api_key={API_KEY}&language=en-US"
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
+        data = tmdb.get_sync("/genre/tv/list", {"language": "en-US"}) or {}
         _TV_GENRE_MAP = {g["id"]: g["name"] for g in data.get("genres", [])}
     except Exception:
         _TV_GENRE_MAP = {}
@@ -49,31 +41,17 @@ def format_genres(genre_ids: List[int]) -> List[dict]:
     return out
 
 # --- NETWORK CONFIG ---
-# Setup robust session with retries
-def get_session():
-    session = requests.Session()
-    retries = Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-    adapter = HTTPAdapter(max_retries=retries)
-    session.mount('https://', adapter)
-    session.mount('http://', adapter)
-    return session
-
-http = get_session()
-
-def safe_request(url, params=None):
-    """Robust request wrapper with error handling"""
-    try:
-        response = http.get(url, params=params, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        # print(f"Request failed: {url} | Error: {e}") # Reduce noise
-        raise e
+# Rate limiting, retries and caching live in the shared TMDB client.
+def safe_request(path, params=None):
+    """TMDB GET that raises instead of returning None."""
+    data = tmdb.get_sync(path, {"language": "en-US", **(params or {})})
+    if data is None:
+        raise RuntimeError(f"TMDB request failed: {path}")
+    return data
 
 def fetch_shows(pages=None, fetch_all=False, start_page=1, deep=True):
     try:
-        init_url = f"{BASE_URL}/tv/popular?api_key={API_KEY}&language=en-US&page=1"
-        init_data = safe_request(init_url)
+        init_data = safe_request("/tv/popular", {"page": 1})
         total_available = init_data['total_pages']
     except Exception as e:
         print(f"Connection failed init: {e}")
@@ -87,10 +65,8 @@ def fetch_shows(pages=None, fetch_all=False, start_page=1, deep=True):
     print(f"Starting TV Show Ingestion: Page {start_page} to {limit}...")
     
     for page in tqdm(range(start_page, limit + 1), desc="Fetching Pages", initial=start_page, total=limit):
-        url = f"{BASE_URL}/tv/popular?api_key={API_KEY}&language=en-US&page={page}"
-        
         try:
-            data = safe_request(url)
+            data = safe_request("/tv/popular", {"page": page})
             
             for item in data.get('results', []):
                 try:
@@ -104,7 +80,8 @@ def fetch_shows(pages=None, fetch_all=False, start_page=1, deep=True):
                             overview=item['overview'],
                             genres=genres,
                             poster_path=item['poster_path'],
-                            popularity_score=item['popularity']
+                            popularity_score=item['popularity'],
+                            **catalog_fields(item), **show_dates(item)
                         )
                         session.add(show)
                         session.commit()
@@ -116,6 +93,8 @@ def fetch_shows(pages=None, fetch_all=False, start_page=1, deep=True):
                                 _fetch_details(show)
                             except Exception as deep_err:
                                 print(f"Partial failure for {show.title}: {deep_err}")
+                        else:
+                            _fill_catalog_fields(show)
                 except Exception as e:
                     print(f"Skipping show {item.get('name')}: {e}")
                     session.rollback()
@@ -126,14 +105,26 @@ def fetch_shows(pages=None, fetch_all=False, start_page=1, deep=True):
             print(f"Critical Error on page {page}: {e}")
             time.sleep(2)
 
+def _fill_catalog_fields(show, details=None):
+    """imdb_id / original_language / year / air dates from the detail payload."""
+    try:
+        details = details or safe_request(f"/tv/{show.tmdb_id}", CATALOG_PARAMS)
+        for col, value in {**catalog_fields(details), **show_dates(details)}.items():
+            if value is not None:
+                setattr(show, col, value)
+        session.commit()
+    except Exception:
+        session.rollback()
+
 def _fetch_details(show):
     # Fetch Show Details
-    url = f"{BASE_URL}/tv/{show.tmdb_id}?api_key={API_KEY}&language=en-US"
-    details = safe_request(url)
+    details = safe_request(f"/tv/{show.tmdb_id}", CATALOG_PARAMS)
     
     if not details:
         return
 
+    _fill_catalog_fields(show, details)
+
     # Update genres if missing
     try:
         if not show.genres:
@@ -165,9 +156,8 @@ def _fetch_details(show):
         session.flush()
         
         # Fetch Episodes
-        ep_url = f"{BASE_URL}/tv/{show.tmdb_id}/season/{s_num}?api_key={API_KEY}&language=en-US"
         try:
-            ep_data = safe_request(ep_url)
+            ep_data = safe_request(f"/tv/{show.tmdb_id}/season/{s_num}")
             
             episode_objects = []
             for ep in ep_data.get('episodes', []):
@@ -197,11 +187,9 @@ def _fetch_details(show):
         updated = 0
         for show in qs:
             try:
-                url = f"{BASE_URL}/tv/{show.tmdb_id}?api_key={API_KEY}&language=en-US"
-                resp = requests.get(url, timeout=10)
-                if resp.status_code != 200:
+                data = tmdb.get_sync(f"/tv/{show.tmdb_id}", {"language": "en-US"})
+                if data is None:
                     continue
-                data = resp.json()
                 g_ids = [g.get('id') for g in data.get('genres', []) if g.get('id') is not None]
                 formatted = format_genres(g_ids)
                 if formatted:
@@ -1,10 +1,14 @@
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import create_engine, text, inspect, Date
+from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
 import sys
 
 sys.path.append(os.getcwd())
-from src.core.models import Base 
+from src.core.models import Base, Interaction, Movie, TVShow, TitleGenre, TitleRatingStats
+from src.core.genres import rebuild_title_genres
+from src.core.rating_stats import reconcile
+from src.core.search import ensure_indexes as ensure_search_indexes
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -29,9 +33,72 @@ def run_migration():
         if 'tv_show_id' not in cols:
             print("Injecting 'tv_show_id' column...")
             conn.execute(text("ALTER TABLE interactions ADD COLUMN tv_show_id INTEGER REFERENCES tv_shows(id);"))
-            
+
+        # 4. Catalog ids for /stream (fill with backfill_catalog.py)
+        for table in ('movies', 'tv_shows'):
+            cols = [c['name'] for c in inspector.get_columns(table)]
+            for col, ddl in (('imdb_id', 'VARCHAR'), ('year', 'INTEGER'), ('original_language', 'VARCHAR')):
+                if col not in cols:
+                    print(f"Injecting '{col}' column into {table}...")
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col} {ddl};"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_imdb_id ON {table} (imdb_id);"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_year ON {table} (year);"))
+
+        # 5. Typed dates: the TMDB date strings become DATE columns
+        for table, col in (('movies', 'release_date'), ('seasons', 'air_date'), ('episodes', 'air_date')):
+            ctype = next(c['type'] for c in inspector.get_columns(table) if c['name'] == col)
+            if engine.dialect.name == 'postgresql':
+                if not isinstance(ctype, Date):
+                    print(f"Converting {table}.{col} to DATE...")
+                    conn.execute(text(
+                        f"ALTER TABLE {table} ALTER COLUMN {col} TYPE DATE USING "
+                        f"CASE WHEN {col} ~ '^[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}' THEN CAST(substr({col}, 1, 10) AS DATE) END;"))
+            else:
+                # SQLite keeps DATE as 'YYYY-MM-DD' text; just drop what isn't a date.
+                conn.execute(text(f"UPDATE {table} SET {col} = NULL WHERE {col} NOT GLOB "
+                                  f"'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*';"))
+                conn.execute(text(f"UPDATE {table} SET {col} = substr({col}, 1, 10) WHERE length({col}) > 10;"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{col} ON {table} ({col});"))
+
+        cols = [c['name'] for c in inspector.get_columns('tv_shows')]
+        for col in ('first_air_date', 'last_air_date'):
+            if col not in cols:
+                print(f"Injecting '{col}' column into tv_shows...")
+                conn.execute(text(f"ALTER TABLE tv_shows ADD COLUMN {col} DATE;"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_tv_shows_{col} ON tv_shows ({col});"))
+        # Seed from ingested seasons; backfill_catalog.py fills the rest from TMDB.
+        conn.execute(text(
+            "UPDATE tv_shows SET first_air_date = (SELECT MIN(s.air_date) FROM seasons s "
+            "WHERE s.show_id = tv_shows.id AND s.season_number > 0) WHERE first_air_date IS NULL;"))
+        conn.execute(text(
+            "UPDATE tv_shows SET last_air_date = (SELECT MAX(e.air_date) FROM episodes e "
+            "JOIN seasons s ON e.season_id = s.id WHERE s.show_id = tv_shows.id) WHERE last_air_date IS NULL;"))
+
         conn.commit()
-        print("Migration Complete. Cargo is safe.")
+
+    # 6. Normalize JSON genres into title_genres (kept in sync on write after this)
+    with Session(engine) as db:
+        if db.query(TitleGenre).first() is None:
+            print("Normalizing genres into title_genres...")
+            print(f"Indexed {rebuild_title_genres(db)} title genres.")
+
+    # 7. Seed rating aggregates (maintained on write after this)
+    with Session(engine) as db:
+        if db.query(TitleRatingStats).first() is None:
+            print("Building title_rating_stats...")
+            print(f"Wrote {reconcile(db)} rating rows.")
+
+    # 8. Indexes declared on the models: interaction access paths (partial where
+    # supported) and the (sort column, id) keyset-pagination indexes
+    with engine.begin() as conn:
+        for index in (*Interaction.__table__.indexes, *Movie.__table_args__, *TVShow.__table_args__):
+            index.create(conn, checkfirst=True)
+
+    # 9. Search indexes (pg_trgm + tsvector on Postgres, FTS5 on SQLite)
+    if not ensure_search_indexes(engine):
+        print("Search indexes unavailable; /search will use ILIKE.")
+
+    print("Migration Complete. Cargo is safe.")
 
 if __name__ == "__main__":
     run_migration()
\ No newline at end of file
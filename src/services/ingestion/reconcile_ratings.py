@@ -0,0 +1,22 @@
+"""Rebuild title_rating_stats from the interactions table.
+
+The API keeps the aggregates current on every write and reconciles once a day.
+Run this after bulk edits to interactions (raw SQL, Query.delete, restores),
+or to refresh weighted scores right away after changing RATING_PRIOR_VOTES.
+
+    python -m src.services.ingestion.reconcile_ratings
+"""
+import os
+import sys
+
+sys.path.append(os.getcwd())
+from src.core.database import SessionLocal
+from src.core.rating_stats import reconcile
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        print(f"Repaired {reconcile(db)} title_rating_stats rows.")
+    finally:
+        db.close()
@@ -1,4 +1,3 @@
-import requests
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -8,9 +7,9 @@ import sys
 # Add root to path
 sys.path.append(os.getcwd())
 from src.core.models import Movie
+from src.core.tmdb import tmdb
 
 load_dotenv()
-API_KEY = os.getenv("TMDB_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 engine = create_engine(DATABASE_URL)
@@ -31,8 +30,7 @@ def repair():
     count = 0
     for movie in movies:
         try:
-            url = f"https://api.themoviedb.org/3/movie/{movie.tmdb_id}?api_key={API_KEY}"
-            data = requests.get(url, timeout=5).json()
+            data = tmdb.get_sync(f"/movie/{movie.tmdb_id}") or {}
             
             if 'genres' in data:
                 # TMDB details endpoint returns [{'id': 28, 'name': 'Action'}...]
@@ -0,0 +1,746 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.api import main
+from src.core import models
+from src.core.database import SessionLocal
+from src.core.tmdb import TMDBClient, catalog_fields
+
+MOVIE_ID = 9100001
+SHOW_ID = 9100002
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    models.Base.metadata.create_all(bind=session.get_bind())
+
+    def cleanup():
+        session.rollback()
+        for model, tmdb_id in ((models.Movie, MOVIE_ID), (models.TVShow, SHOW_ID)):
+            for row in session.query(model).filter(model.tmdb_id == tmdb_id):
+                session.delete(row)
+        session.commit()
+
+    cleanup()
+    yield session
+    cleanup()
+    session.close()
+
+
+@pytest.fixture
+def tmdb_calls(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path.startswith("/3/tv/"):
+            return httpx.Response(200, json={
+                "id": SHOW_ID, "name": "Frieren", "first_air_date": "2023-09-29",
+                "original_language": "ja", "genres": [{"id": 16, "name": "Animation"}],
+                "external_ids": {"imdb_id": "tt22248376"}})
+        return httpx.Response(200, json={
+            "id": MOVIE_ID, "title": "The Matrix", "release_date": "1999-03-30",
+            "imdb_id": "tt0133093", "original_language": "en",
+            "genres": [{"id": 878, "name": "Science Fiction"}]})
+
+    monkeypatch.setattr(main, "tmdb", TMDBClient("key", cache_path=None, transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "TMDB_API_KEY", "key")
+    return calls
+
+
+def test_catalog_fields():
+    assert catalog_fields({"imdb_id": "tt1", "release_date": "1999-03-30", "original_language": "en"}) == \
+        {"imdb_id": "tt1", "original_language": "en", "year": 1999}
+    assert catalog_fields({"external_ids": {"imdb_id": "tt2"}, "first_air_date": ""}) == \
+        {"imdb_id": "tt2", "original_language": None, "year": None}
+
+
+def test_media_context_from_catalog_row_skips_tmdb(db, async_db, tmdb_calls, monkeypatch):
+    monkeypatch.setattr(main, "AsyncSessionLocal", async_db)
+    db.add(models.Movie(title="The Matrix", tmdb_id=MOVIE_ID, imdb_id="tt0133093", year=1999,
+                        original_language="en", genres=[{"id": 878, "name": "Sci-Fi"}]))
+    db.commit()
+
+    media = asyncio.run(main._media_context("movie", MOVIE_ID, 1, 1))
+    assert (media.imdb_id, media.year, media.title, media.genres) == ("tt0133093", 1999, "The Matrix", ["Sci-Fi"])
+    assert tmdb_calls == []
+
+
+def test_media_context_fills_row_once(db, async_db, tmdb_calls, monkeypatch):
+    from fastapi import BackgroundTasks
+
+    monkeypatch.setattr(main, "AsyncSessionLocal", async_db)
+    db.add(models.TVShow(title="Frieren", tmdb_id=SHOW_ID, genres=[{"id": 16, "name": "Animation"}]))
+    db.commit()
+
+    background = BackgroundTasks()
+    media = asyncio.run(main._media_context("tv", SHOW_ID, 1, 3, background))
+    assert media.imdb_id == "tt22248376" and media.year == 2023 and media.is_anime
+    # The write-back is queued for after the response, not done inline.
+    row = db.query(models.TVShow).filter_by(tmdb_id=SHOW_ID).one()
+    assert row.imdb_id is None and len(background.tasks) == 1
+    asyncio.run(background())
+    db.expire_all()
+    row = db.query(models.TVShow).filter_by(tmdb_id=SHOW_ID).one()
+    assert (row.imdb_id, row.year, row.original_language) == ("tt22248376", 2023, "ja")
+
+    asyncio.run(main._media_context("tv", SHOW_ID, 1, 4, BackgroundTasks()))
+    assert tmdb_calls == [f"/3/tv/{SHOW_ID}"]
+
+
+def test_stream_releases_its_db_session_before_scraping(db, async_db, tmdb_calls, monkeypatch):
+    from fastapi import BackgroundTasks
+
+    open_sessions, seen = [0], []
+
+    def counting():
+        session = async_db()
+        open_sessions[0] += 1
+        real_close = session.close
+
+        async def close():
+            open_sessions[0] -= 1
+            await real_close()
+
+        session.close = close
+        return session
+
+    async def scrape(media):
+        seen.append(open_sessions[0])
+        return None
+
+    monkeypatch.setattr(main, "AsyncSessionLocal", counting)
+    monkeypatch.setattr(main._provider_engine, "run_all", scrape)
+    db.add(models.Movie(title="The Matrix", tmdb_id=MOVIE_ID, imdb_id="tt0133093", year=1999,
+                        original_language="en", genres=[{"id": 878, "name": "Sci-Fi"}]))
+    db.commit()
+
+    out = asyncio.run(main.stream_content("movie", MOVIE_ID, BackgroundTasks()))
+    assert out["stream"] is None and seen == [0]
+
+
+def test_backfill_fills_missing_columns(db, tmdb_calls):
+    from src.services.ingestion.backfill_catalog import backfill
+
+    db.add(models.Movie(title="The Matrix", tmdb_id=MOVIE_ID, release_date="1999-03-30"))
+    db.commit()
+
+    assert backfill(models.Movie, "movie", client=main.tmdb) >= 1
+    db.expire_all()
+    row = db.query(models.Movie).filter_by(tmdb_id=MOVIE_ID).one()
+    assert (row.imdb_id, row.year, row.original_language) == ("tt0133093", 1999, "en")
+
+
+def test_seasons_persisted_in_one_pass(db, monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.params.get("append_to_response"))
+        body = {"id": SHOW_ID, "seasons": [{"season_number": 1, "name": "Season 1"},
+                                          {"season_number": 2, "name": "Season 2"}]}
+        for n in (1, 2):
+            body[f"season/{n}"] = {"episodes": [{"episode_number": e, "name": f"S{n}E{e}"} for e in (2, 1)]}
+        return httpx.Response(200, json=body)
+
+    monkeypatch.setattr(main, "tmdb", TMDBClient("key", cache_path=None, transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "TMDB_API_KEY", "key")
+    db.add(models.TVShow(title="Frieren", tmdb_id=SHOW_ID))
+    db.commit()
+
+    seasons = main.get_seasons(SHOW_ID, db)
+    assert [s.season_number for s in seasons] == [1, 2]
+    assert [e.title for e in seasons[1].episodes] == ["S2E1", "S2E2"]
+    assert len(calls) == 1
+    show = db.query(models.TVShow).filter_by(tmdb_id=SHOW_ID).one()
+    assert sum(len(s.episodes) for s in show.seasons) == 4
+
+
+@pytest.fixture
+def async_db(monkeypatch):
+    """AsyncSession factory on the test database, also wired into the app.
+
+    Unpooled: each asyncio.run / TestClient request is its own event loop, and
+    pooled async connections can't cross loops."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from src.core.database import DATABASE_URL, async_url, get_async_db
+
+    factory = async_sessionmaker(create_async_engine(async_url(DATABASE_URL), poolclass=NullPool),
+                                 expire_on_commit=False, autoflush=False)
+
+    async def override():
+        async with factory() as adb:
+            yield adb
+
+    monkeypatch.setitem(main.app.dependency_overrides, get_async_db, override)
+    return factory
+
+
+def _with_async_db(factory, fn):
+    """Run ``fn(AsyncSession)`` to completion."""
+    async def run():
+        async with factory() as adb:
+            return await fn(adb)
+
+    return asyncio.run(run())
+
+
+def _count_queries(session):
+    from sqlalchemy import event
+
+    statements = []
+
+    def before(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(session.get_bind(), "before_cursor_execute", before)
+    return statements, lambda: event.remove(session.get_bind(), "before_cursor_execute", before)
+
+
+def test_related_resolves_candidates_in_one_query(db, monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/3/collection/2344":
+            return httpx.Response(200, json={"parts": [{"id": MOVIE_ID}, {"id": 604, "title": "Reloaded"}]})
+        return httpx.Response(200, json={
+            "id": MOVIE_ID, "belongs_to_collection": {"id": 2344},
+            "recommendations": {"results": [{"id": n, "title": f"R{n}"} for n in range(700, 710)]},
+            "similar": {"results": [{"id": 604}, {"id": 800, "title": "S"}]}})
+
+    monkeypatch.setattr(main, "tmdb", TMDBClient("key", cache_path=None, transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "TMDB_API_KEY", "key")
+    db.add(models.Movie(title="The Matrix", tmdb_id=MOVIE_ID))
+    db.commit()
+
+    statements, stop = _count_queries(db)
+    try:
+        out = main.get_related_movies.__wrapped__(MOVIE_ID, db)
+    finally:
+        stop()
+    assert [r["tmdb_id"] for r in out] == [604] + list(range(700, 710)) + [800]
+    assert calls == [f"/3/movie/{MOVIE_ID}", "/3/collection/2344"]
+    # Source lookup (movie + show) plus one IN query for every candidate.
+    assert len(statements) == 3
+
+
+def test_related_local_fallback_uses_genre_index(db, monkeypatch):
+    from src.api.genre_index import GenreIndex
+
+    monkeypatch.setattr(main, "TMDB_API_KEY", None)
+    monkeypatch.setattr(main, "_genre_index", GenreIndex(main.genre_id_set))
+    ids = [MOVIE_ID, 9100101, 9100102, 9100103]
+    genres = [[28, 878], [28, 878], [35], [28]]
+    for tid, g in zip(ids, genres):
+        db.add(models.Movie(title=str(tid), tmdb_id=tid, genres=g, popularity_score=1.0))
+    db.commit()
+    try:
+        out = main.get_related_movies.__wrapped__(MOVIE_ID, db)
+        got = [r["tmdb_id"] for r in out]
+        assert got.index(9100101) < got.index(9100103)
+        assert MOVIE_ID not in got
+    finally:
+        for row in db.query(models.Movie).filter(models.Movie.tmdb_id.in_(ids[1:])):
+            db.delete(row)
+        db.commit()
+
+
+def test_availability_is_persisted_and_refreshed(db):
+    from datetime import datetime, timedelta
+    from src.api import availability
+
+    future = (datetime.utcnow() + timedelta(days=20)).strftime("%Y-%m-%dT00:00:00.000Z")
+    calls = []
+
+    def handler(request):
+        mid = int(request.url.path.split("/")[3])
+        calls.append(mid)
+        dates = {MOVIE_ID: [{"type": 3, "release_date": "2024-01-01T00:00:00.000Z"},
+                            {"type": 4, "release_date": future}],
+                 SHOW_ID: [{"type": 4, "release_date": "2024-02-01T00:00:00.000Z"}]}.get(mid, [])
+        return httpx.Response(200, json={"results": [{"iso_3166_1": "US", "release_dates": dates}]})
+
+    client = TMDBClient("key", cache_path=None, transport=httpx.MockTransport(handler))
+    A = models.MovieAvailability
+    db.query(A).filter(A.tmdb_id.in_([MOVIE_ID, SHOW_ID])).delete()
+    db.commit()
+    try:
+        assert availability.cam_ids(db, client, [MOVIE_ID, SHOW_ID]) == [MOVIE_ID]
+        assert availability.cam_ids(db, client, [MOVIE_ID, SHOW_ID]) == [MOVIE_ID]
+        assert sorted(calls) == [MOVIE_ID, SHOW_ID]
+        row = db.get(A, MOVIE_ID)
+        assert row.has_digital is False and row.digital_date > datetime.utcnow()
+
+        # Once the known digital date passes, the badge drops without a TMDB call.
+        row.digital_date = datetime.utcnow() - timedelta(hours=1)
+        db.commit()
+        assert availability.cam_ids(db, client, [MOVIE_ID]) == []
+        assert availability.refresh_recent(db, client) >= 0
+        db.expire_all()
+        assert db.get(A, MOVIE_ID).has_digital is True
+        assert sorted(c for c in calls if c in (MOVIE_ID, SHOW_ID)) == [MOVIE_ID, SHOW_ID]
+    finally:
+        db.query(A).filter(A.tmdb_id.in_([MOVIE_ID, SHOW_ID])).delete()
+        db.commit()
+
+
+def _title_genres(db, media_type, title_id):
+    TG = models.TitleGenre
+    return sorted(r[0] for r in db.query(TG.genre_id).filter_by(media_type=media_type, title_id=title_id))
+
+
+def test_title_genres_follow_the_json_column(db):
+    movie = models.Movie(title="The Matrix", tmdb_id=MOVIE_ID, genres=[{"id": 878, "name": "Sci-Fi"}, 28])
+    show = models.TVShow(title="Frieren", tmdb_id=SHOW_ID, genres=["Animation", "Drama"])
+    db.add_all([movie, show])
+    db.commit()
+    assert _title_genres(db, "movie", movie.id) == [28, 878]
+    assert _title_genres(db, "tv", show.id) == [16, 18]
+
+    movie.genres = [{"id": 53, "name": "Thriller"}]
+    db.commit()
+    assert _title_genres(db, "movie", movie.id) == [53]
+
+    show_id = show.id
+    db.delete(show)
+    db.commit()
+    assert _title_genres(db, "tv", show_id) == []
+
+
+def test_title_genres_tolerate_a_concurrent_genre_insert(db):
+    from src.core import genres
+
+    class Racing:
+        """A connection whose genres lookup misses rows another flush just added."""
+        def __init__(self, conn):
+            self.conn = conn
+
+        def __getattr__(self, name):
+            return getattr(self.conn, name)
+
+        def execute(self, stmt, *args):
+            if getattr(stmt, "is_select", False) and models.Genre.__table__ in stmt.get_final_froms():
+                return []
+            return self.conn.execute(stmt, *args)
+
+    movie = models.Movie(title="The Matrix", tmdb_id=MOVIE_ID, genres=[28])
+    db.add(movie)
+    db.commit()
+    try:
+        assert db.get(models.Genre, 28) is not None
+        genres._write(Racing(db.connection()), "movie", {movie.id: [28, 878]})
+        db.commit()
+        assert _title_genres(db, "movie", movie.id) == [28, 878]
+    finally:
+        db.delete(movie)
+        db.commit()
+
+
+def test_genre_filters_run_in_sql(db, monkeypatch):
+    monkeypatch.setattr(main, "TMDB_API_KEY", None)
+    ids = [MOVIE_ID, 9100201, 9100202, 9100203]
+    genres = [[9999], [9999, 28], [28], [9999]]
+    rows = [models.Movie(title=str(t), tmdb_id=t, genres=g, popularity_score=float(100 - i))
+            for i, (t, g) in enumerate(zip(ids, genres))]
+    db.add_all(rows)
+    db.commit()
+    try:
+        statements, stop = _count_queries(db)
+        try:
+            page = main.get_movies(skip=1, limit=2, genre=9999, db=db)
+        finally:
+            stop()
+        assert [m.tmdb_id for m in page] == [9100201, 9100203]
+        assert len(statements) == 1
+        assert [m.tmdb_id for m in main.get_movies_by_genre.__wrapped__(9999, limit=5, db=db)] == \
+            [MOVIE_ID, 9100201, 9100203]
+
+        overview = {g["id"]: g for g in main.get_genre_overview(db)}
+        assert overview[9999]["movies"] == 3 and overview[9999]["shows"] == 0
+    finally:
+        for row in rows[1:]:
+            db.delete(row)
+        db.commit()
+
+
+def test_rating_stats_track_interactions_and_reconcile(db):
+    from src.core import rating_stats
+
+    T = models.TitleRatingStats
+    users = [models.User(username=f"rating-test-{i}") for i in range(3)]
+    strong = models.Movie(title="The Matrix", tmdb_id=MOVIE_ID)
+    lucky = models.TVShow(title="Frieren", tmdb_id=SHOW_ID)
+    db.add_all(users + [strong, lucky])
+    db.commit()
+    try:
+        db.add_all([models.Interaction(user_id=u.id, movie_id=strong.id, interaction_type="rating",
+                                       rating_value=v) for u, v in zip(users, (5.0, 4.0, 5.0))])
+        db.add(models.Interaction(user_id=users[0].id, tv_show_id=lucky.id, interaction_type="rating",
+                                  rating_value=5.0))
+        db.commit()
+        row = db.get(T, ("movie", strong.id))
+        assert (row.rating_count, row.rating_sum) == (3, 14.0) and abs(row.avg_rating - 14 / 3) < 1e-9
+        g = db.get(T, (rating_stats.ALL, 0))
+        assert abs(row.weighted_score - rating_stats.weighted(14.0, 3, g.rating_sum / g.rating_count)) < 1e-9
+
+        liked = db.query(models.Interaction).filter_by(movie_id=strong.id, user_id=users[1].id).one()
+        db.delete(liked)
+        db.commit()
+        db.refresh(row)
+        assert (row.rating_count, row.avg_rating) == (2, 5.0)
+        assert [m.id for m, _ in rating_stats.top(db, models.Movie, "movie", min_votes=2, limit=100)
+                if m.id == strong.id] == [strong.id]
+
+        # Drift from a write that bypassed the hook is repaired.
+        db.query(T).filter_by(media_type="tv", title_id=lucky.id).update({T.rating_count: 7})
+        db.commit()
+        assert rating_stats.reconcile(db) >= 1
+        db.expire_all()
+        assert db.get(T, ("tv", lucky.id)).rating_count == 1
+        assert rating_stats.reconcile(db) == 0
+    finally:
+        db.rollback()
+        for i in db.query(models.Interaction).filter(models.Interaction.user_id.in_([u.id for u in users])):
+            db.delete(i)
+        for u in users:
+            db.delete(u)
+        db.commit()
+        db.query(T).filter(T.rating_count == 0).delete()
+        db.commit()
+
+
+def test_top_rated_fallbacks_batch_their_lookups(db, tmp_path, monkeypatch):
+    import json
+
+    ids = [9100300 + i for i in range(80)]
+    rows = [models.Movie(title=f"M{t}", tmdb_id=t, poster_path=f"/{t}.jpg") for t in ids]
+    db.add_all(rows)
+    db.commit()
+    monkeypatch.chdir(tmp_path)
+    try:
+        # Precomputed MovieLens cache (tmdb ids may be strings there).
+        cache = tmp_path / "data" / "processed" / "top_rated_movies.json"
+        cache.parent.mkdir(parents=True)
+        cache.write_text(json.dumps({"items": [{"tmdb_id": str(t), "avg_rating": 4.5, "vote_count": 10}
+                                               for t in ids]}))
+        statements, stop = _count_queries(db)
+        try:
+            out = main.api_movies_top_rated.__wrapped__(limit=80, min_votes=10 ** 6, db=db)
+        finally:
+            stop()
+        assert [r["poster_path"] for r in out] == [f"/{t}.jpg" for t in ids]
+        assert len(statements) <= 2
+
+        # Raw MovieLens CSVs.
+        cache.unlink()
+        raw = tmp_path / "data" / "raw" / "ml"
+        raw.mkdir(parents=True)
+        (raw / "links.csv").write_text("movieId,imdbId,tmdbId\n" +
+                                       "".join(f"{i},0,{t}\n" for i, t in enumerate(ids, 1)))
+        (raw / "ratings.csv").write_text("userId,movieId,rating,timestamp\n" +
+                                         "".join(f"1,{i},{5 - i / 100},0\n" for i in range(1, len(ids) + 1)))
+        statements, stop = _count_queries(db)
+        try:
+            out = main.api_movies_top_rated.__wrapped__(limit=80, min_votes=1, db=db)
+        finally:
+            stop()
+        assert [r["tmdb_id"] for r in out][:3] == ids[:3] and len(out) == 80
+        assert len(statements) <= 2
+
+        statements, stop = _count_queries(db)
+        try:
+            main.api_shows_top_rated.__wrapped__(limit=80, min_votes=10 ** 6, db=db)
+        finally:
+            stop()
+        assert len(statements) <= 2
+    finally:
+        for row in rows:
+            db.delete(row)
+        db.commit()
+
+
+def test_typed_dates_and_new_release_ranges(db):
+    from datetime import date, timedelta
+
+    today = date.today()
+    recent, old = (today - timedelta(days=10)).isoformat(), "1999-03-30"
+    movie = models.Movie(title="The Matrix", tmdb_id=MOVIE_ID, release_date=recent)
+    older = models.Movie(title="Old", tmdb_id=9100401, release_date=old)
+    blank = models.Movie(title="Blank", tmdb_id=9100402, release_date="")
+    show = models.TVShow(title="Frieren", tmdb_id=SHOW_ID, first_air_date="2023-09-29", last_air_date=recent)
+    db.add_all([movie, older, blank, show])
+    db.commit()
+    try:
+        db.expire_all()
+        # Strings in, strings out; '' is stored as NULL.
+        assert (movie.release_date, blank.release_date) == (recent, None)
+        assert db.query(models.Movie).filter(models.Movie.release_date < "2000-01-01",
+                                             models.Movie.tmdb_id.in_([MOVIE_ID, 9100401])).one().tmdb_id == 9100401
+
+        got = [m.tmdb_id for m in main.api_movies_new_releases.__wrapped__(days=30, limit=500, db=db)]
+        assert MOVIE_ID in got and 9100401 not in got
+        assert SHOW_ID in [s.tmdb_id for s in main.api_shows_new_releases.__wrapped__(days=30, limit=500, db=db)]
+        shows = main.get_shows(sort="year", limit=500, db=db)
+        dated = [s.first_air_date for s in shows if s.first_air_date]
+        assert dated == sorted(dated, reverse=True) and "2023-09-29" in dated
+    finally:
+        for row in (older, blank):
+            db.delete(row)
+        db.commit()
+
+
+def test_search_is_indexed_and_ranked(db):
+    from src.core import search
+
+    movies = [models.Movie(title="Zyxqor Returns", tmdb_id=MOVIE_ID, popularity_score=90.0),
+              models.Movie(title="Zyxqor", tmdb_id=9100501, popularity_score=1.0,
+                           overview="The original zyxqor story"),
+              models.Movie(title="A Quiet Film", tmdb_id=9100502, popularity_score=50.0,
+                           overview="Nothing about zyxqor here")]
+    db.add_all(movies)
+    db.commit()
+    try:
+        got = [m.tmdb_id for m in search.search(db, "zyxq")["movie"]]   # prefix, as typed
+        assert set(got) == {MOVIE_ID, 9100501, 9100502}
+        assert got[-1] == 9100502                       # overview-only match ranks last
+        assert search.search(db, "100%_")["movie"] == []
+
+        # The index follows updates and deletes.
+        movies[2].title, movies[2].overview = "Loud Film", "Car chases"
+        db.commit()
+        assert 9100502 not in [m.tmdb_id for m in search.search(db, "zyxqor")["movie"]]
+        db.delete(movies[1])
+        db.commit()
+        assert [m.tmdb_id for m in search.search(db, "zyxqor")["movie"]] == [MOVIE_ID]
+    finally:
+        for row in movies[2:]:
+            db.delete(row)
+        db.commit()
+
+
+def test_search_tmdb_fallback_bulk_upserts(db, async_db, monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"results": [
+            {"media_type": "movie", "id": MOVIE_ID, "title": "Qwzzyx One", "release_date": "2001-01-01",
+             "popularity": 3.0, "original_language": "en"},
+            {"media_type": "tv", "id": SHOW_ID, "name": "Qwzzyx Show", "first_air_date": "2010-05-05"},
+            {"media_type": "person", "id": 1, "name": "Someone"}]})
+
+    monkeypatch.setattr(main, "tmdb", TMDBClient("key", cache_path=None, transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "TMDB_API_KEY", "key")
+    db.add(models.Movie(title="Already here", tmdb_id=MOVIE_ID))
+    db.commit()
+
+    main._suggest_dirty.clear()
+    out = _with_async_db(async_db, lambda adb: main.search_content("qwzzyx", adb))
+    assert [(r["media_type"], r["tmdb_id"]) for r in out] == [("movie", MOVIE_ID), ("tv", SHOW_ID)]
+    assert main._suggest_dirty.is_set()     # the refresh loop picks the new titles up
+    db.expire_all()
+    assert db.query(models.Movie).filter_by(tmdb_id=MOVIE_ID).one().title == "Already here"
+    show = db.query(models.TVShow).filter_by(tmdb_id=SHOW_ID).one()
+    assert (show.title, show.first_air_date, show.year) == ("Qwzzyx Show", "2010-05-05", 2010)
+
+    # Now local: served from the index without asking TMDB again.
+    assert [r["tmdb_id"] for r in _with_async_db(async_db, lambda adb: main.search_content("qwzzyx", adb))] == \
+        [SHOW_ID]
+    assert calls == ["/3/search/multi"]
+
+
+def test_suggest_prefix_typo_and_incremental_refresh(db, monkeypatch):
+    from src.api.suggest import Suggest
+
+    suggest = Suggest()
+    suggest.build(db)
+    assert suggest.suggest("vqxlmar") == []
+    db.add_all([models.Movie(title="Vqxlmar: Último Acto", tmdb_id=MOVIE_ID, popularity_score=5.0),
+                models.TVShow(title="The Vqxlmar Chronicles", tmdb_id=SHOW_ID, popularity_score=50.0)])
+    db.commit()
+    assert suggest.refresh(db) == 2 and suggest.refresh(db) == 0
+
+    def hits(q):
+        return [(h["media_type"], h["tmdb_id"]) for h in suggest.suggest(q)]
+
+    # New rows are served from the delta, then from the rebuilt arrays.
+    for rebuilt in (False, True):
+        if rebuilt:
+            suggest.build(db)
+        assert hits("vqxl") == [("tv", SHOW_ID), ("movie", MOVIE_ID)]      # popularity order
+        assert hits("ultimo vqx") == [("movie", MOVIE_ID)]                 # accents, any word order
+        assert hits("chronicles vqxlm") == [("tv", SHOW_ID)]
+        assert hits("vqxlmra") == [("tv", SHOW_ID), ("movie", MOVIE_ID)]   # one typo
+
+    # The endpoint serves from the index, or from indexed DB search while it builds.
+    for index in (suggest, Suggest()):
+        monkeypatch.setattr(main, "_suggest", index)
+        assert [h["title"] for h in main.search_suggest(q="vqxlmar", limit=5, db=db)] == \
+            ["The Vqxlmar Chronicles", "Vqxlmar: Último Acto"]
+
+
+def test_suggest_latency_at_scale():
+    import random
+    import time
+
+    from src.api.suggest import Suggest, _Index
+
+    rng = random.Random(3)
+    vocab = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+             for _ in range(20000)]
+    suggest = Suggest()
+    suggest._index = _Index([(rng.random() * 100, rng.randint(0, 1), i,
+                              " ".join(rng.choice(vocab) for _ in range(rng.randint(1, 4))))
+                             for i in range(100_000)])
+    queries = [rng.choice(vocab)[:rng.randint(1, 6)] for _ in range(1000)]
+    queries += [rng.choice(vocab) + " " + rng.choice(vocab)[:3] for _ in range(300)]
+    queries += [rng.choice(vocab)[:5] + "q" for _ in range(300)]
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        suggest.suggest(q)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    # Sub-millisecond on a dev box; generous for CI.
+    assert timings[int(len(timings) * 0.99)] < 0.01
+
+
+def test_keyset_pages_match_offset_pages(db, monkeypatch):
+    from fastapi import HTTPException
+    from fastapi.responses import Response
+
+    monkeypatch.setattr(main, "TMDB_API_KEY", None)
+    ids = [MOVIE_ID] + list(range(9100601, 9100608))
+    pops = [5.0, 9.0, 5.0, None, 1.0, None, 5.0, 7.0]             # ties and NULLs
+    dates = ["2001-01-01", None, "1999-05-05", "2001-01-01", None, "2010-10-10", "1980-01-01", None]
+    rows = [models.Movie(title=f"K{i % 3}", tmdb_id=t, genres=[9998], popularity_score=p, release_date=d)
+            for i, (t, p, d) in enumerate(zip(ids, pops, dates))]
+    db.add_all(rows)
+    db.commit()
+    try:
+        for sort in ("popularity", "rating", "title", "year"):
+            by_offset = [m.tmdb_id for skip in range(0, 8, 3)
+                         for m in main.get_movies(skip=skip, limit=3, genre=9998, sort=sort, db=db)]
+            by_cursor, cursor = [], None
+            while True:
+                response = Response()
+                page = main.get_movies(limit=3, genre=9998, sort=sort, cursor=cursor, db=db, response=response)
+                by_cursor += [m.tmdb_id for m in page]
+                cursor = response.headers.get("X-Next-Cursor")
+                if cursor is None:
+                    break
+            assert by_cursor == by_offset and sorted(by_cursor) == sorted(ids), sort
+
+        assert [m.tmdb_id for m in main.get_movies(limit=8, genre=9998, db=db)][:2] == [9100601, 9100607]
+        with pytest.raises(HTTPException):
+            main.get_movies(genre=9998, sort="popularity", cursor="not-a-cursor", db=db)
+        response = Response()
+        main.get_movies(limit=2, genre=9998, sort="title", db=db, response=response)
+        with pytest.raises(HTTPException):                              # cursor from another sort
+            main.get_movies(genre=9998, sort="year", cursor=response.headers["X-Next-Cursor"], db=db)
+    finally:
+        for row in rows[1:]:
+            db.delete(row)
+        db.commit()
+
+
+def test_year_filtered_shows_keep_the_year_across_pages(db, monkeypatch):
+    from fastapi.responses import Response
+
+    monkeypatch.setattr(main, "TMDB_API_KEY", None)
+    dates = ["2010-03-01", "2011-01-01", "2010-07-07", None, "2009-12-31", "2010-12-31", "2012-05-05"]
+    rows = [models.TVShow(title=f"Y{i}", tmdb_id=9100701 + i, genres=[9998], popularity_score=float(10 - i),
+                          first_air_date=d) for i, d in enumerate(dates)]
+    db.add_all(rows)
+    db.commit()
+    try:
+        seen, cursor = [], None
+        while True:
+            response = Response()
+            page = main.get_shows(limit=2, genre=9998, year=2010, cursor=cursor, db=db, response=response)
+            seen += [s.tmdb_id for s in page]
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+        # 2010 premieres plus the undated show, as for /movies.
+        assert seen == [9100701, 9100703, 9100704, 9100706]
+    finally:
+        for row in rows:
+            db.delete(row)
+        db.commit()
+
+
+def test_random_movies_sample_from_the_id_pool(db, monkeypatch):
+    import random
+
+    from src.api.random_pool import RandomPool
+
+    rows = [models.Movie(title="Top", tmdb_id=MOVIE_ID, popularity_score=1e9, poster_path="/top.jpg"),
+            models.Movie(title="No poster", tmdb_id=9100701, popularity_score=2e9),
+            models.Movie(title="Also top", tmdb_id=9100702, popularity_score=1e9, poster_path="/also.jpg")]
+    db.add_all(rows)
+    db.commit()
+    try:
+        pool = RandomPool(rng=random.Random(0))
+        monkeypatch.setattr(main, "_random_pool", pool)
+        pool.snapshot(db, models.Movie)
+
+        statements, stop = _count_queries(db)
+        try:
+            picked = main.get_random_movies(limit=5, has_poster=True, min_popularity=1e9, db=db)
+        finally:
+            stop()
+        assert sorted(m.tmdb_id for m in picked) == [MOVIE_ID, 9100702]
+        assert len(statements) == 1 and "random" not in statements[0].lower()
+
+        assert [m.tmdb_id for m in main.get_random_movies(limit=5, min_popularity=1.5e9, db=db)] == [9100701]
+        everything = main.get_random_movies(limit=100, db=db)
+        assert len({m.id for m in everything}) == len(everything) == min(100, db.query(models.Movie).count())
+    finally:
+        for row in rows[1:]:
+            db.delete(row)
+        db.commit()
+
+
+def test_async_endpoints_round_trip(db, async_db, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(main, "TMDB_API_KEY", None)
+    guest = "guest-async-roundtrip"
+    movie = models.Movie(title="Async Voyage", tmdb_id=MOVIE_ID, popularity_score=1.0, release_date="2020-02-02")
+    db.add(movie)
+    db.commit()
+    client = TestClient(main.app)
+    try:
+        body = {"guest_id": guest, "item_id": MOVIE_ID, "media_type": "movie", "action": "watchlist"}
+        assert client.post("/interact", json=body).json()["status"] == "recorded"
+        assert client.post("/interact", json=body).json()["status"] == "exists"
+        assert [(r["tmdb_id"], r["media_type"]) for r in client.get(f"/collections/watchlist/{guest}").json()] == \
+            [(MOVIE_ID, "movie")]
+        # The after_flush hooks run under AsyncSession too.
+        db.expire_all()
+        stats = db.get(models.TitleRatingStats, ("movie", movie.id))
+        assert stats is not None and stats.rating_count == 1
+
+        progress = {"guest_id": guest, "media_type": "movie", "tmdb_id": MOVIE_ID,
+                    "position_seconds": 30, "duration_seconds": 120}
+        assert client.post("/progress", json=progress).json() == {"ok": True, "percentage": 25.0}
+        assert client.post("/progress", json=progress | {"position_seconds": 60}).json()["percentage"] == 50.0
+        assert [r["position_seconds"] for r in client.get(f"/progress/{guest}/{MOVIE_ID}").json()] == [60.0]
+        assert client.get(f"/media/{MOVIE_ID}").json()["release_date"] == "2020-02-02"
+
+        body["action"] = "remove_watchlist"
+        assert client.post("/interact", json=body).json()["status"] == "removed"
+        assert client.get(f"/collections/watchlist/{guest}").json() == []
+    finally:
+        db.rollback()
+        for model, column in ((models.WatchProgress, models.WatchProgress.guest_id),
+                              (models.User, models.User.username)):
+            for row in db.query(model).filter(column == guest):
+                db.delete(row)
+        db.commit()
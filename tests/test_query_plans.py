@@ -0,0 +1,161 @@
+"""Query-plan and latency regression checks for the interactions hot paths
+and deep catalog pages.
+
+Seeds a throwaway SQLite database with a large synthetic interactions table,
+runs the real endpoint functions against it and EXPLAINs every statement they
+issue: none may full-scan ``interactions``. Budgets are generous wall-clock
+ceilings; they catch an index going missing, not a slow CI box.
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from src.api import main
+from src.core import models
+
+USERS, MOVIES, SHOWS, INTERACTIONS = 2000, 3000, 1000, 200_000
+BUDGET_SECONDS = 0.25
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    models.Base.metadata.create_all(engine)
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(),
+                     [{"id": i, "username": f"guest-{i}"} for i in range(1, USERS + 1)])
+        conn.execute(models.Movie.__table__.insert(),
+                     [{"id": i, "title": f"M{i}", "tmdb_id": 500_000 + i, "popularity_score": rng.random(),
+                       "release_date": None if i % 5 == 0 else now.date() - timedelta(days=rng.randint(0, 20000))}
+                      for i in range(1, MOVIES + 1)])
+        conn.execute(models.TVShow.__table__.insert(),
+                     [{"id": i, "title": f"S{i}", "tmdb_id": 800_000 + i, "popularity_score": rng.random()}
+                      for i in range(1, SHOWS + 1)])
+        rows = []
+        for _ in range(INTERACTIONS):
+            movie = rng.random() < 0.7
+            rows.append({
+                "user_id": rng.randint(1, USERS),
+                "movie_id": rng.randint(1, MOVIES) if movie else None,
+                "tv_show_id": None if movie else rng.randint(1, SHOWS),
+                "interaction_type": rng.choice(("like", "watch", "watchlist", "rating")),
+                "rating_value": 1.0,
+                "timestamp": now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+            })
+        conn.execute(models.Interaction.__table__.insert(), rows)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def async_engine(db):
+    """The same database through the async driver, for the async endpoints."""
+    return create_async_engine(db.get_bind().url.set(drivername="sqlite+aiosqlite"), poolclass=NullPool)
+
+
+def _run(db, fn, async_engine=None):
+    """(result, seconds, [(statement, plan rows)]) for statements touching interactions.
+    With ``async_engine``, ``fn`` is ``async (AsyncSession) -> result``."""
+    bind = db.get_bind()
+    target = async_engine.sync_engine if async_engine is not None else bind
+    seen = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if "interactions" in statement and statement.lstrip().upper().startswith("SELECT"):
+            seen.append((statement, parameters))
+
+    async def in_session():
+        async with AsyncSession(async_engine, expire_on_commit=False) as adb:
+            return await fn(adb)
+
+    event.listen(target, "before_cursor_execute", before)
+    try:
+        start = time.perf_counter()
+        result = asyncio.run(in_session()) if async_engine is not None else fn()
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(target, "before_cursor_execute", before)
+    with bind.connect() as conn:
+        plans = [(stmt, [r[-1] for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + stmt, params)])
+                 for stmt, params in seen]
+    return result, elapsed, plans
+
+
+def _assert_indexed(plans, covering=False):
+    assert plans, "no interactions query was issued"
+    for stmt, plan in plans:
+        assert not any(step.startswith("SCAN interactions") for step in plan), (stmt, plan)
+        wanted = "COVERING INDEX ix_interactions_" if covering else "ix_interactions_"
+        assert any(wanted in step for step in plan), (stmt, plan)
+
+
+def test_interact_existence_check(db, async_engine):
+    body = main.InteractionInput(guest_id="guest-42", item_id=500_010, media_type="movie", action="like")
+    result, elapsed, plans = _run(db, lambda adb: main.record_interaction(body, adb), async_engine)
+    assert result["status"] in ("recorded", "exists")
+    _assert_indexed(plans)
+    assert elapsed < BUDGET_SECONDS
+
+
+@pytest.mark.parametrize("media_type,tmdb_id", [("movie", 500_020), ("tv", 800_020)])
+def test_interaction_status(db, media_type, tmdb_id):
+    result, elapsed, plans = _run(db, lambda: main.get_interaction_status("guest-7", tmdb_id, media_type,
+                                                                          "watchlist", db))
+    assert "active" in result
+    _assert_indexed(plans)
+    assert elapsed < BUDGET_SECONDS
+
+
+def test_watchlist(db, async_engine):
+    result, elapsed, plans = _run(db, lambda adb: main.get_watchlist("guest-99", adb), async_engine)
+    assert result and {r["media_type"] for r in result} <= {"movie", "tv"}
+    _assert_indexed(plans)
+    assert elapsed < BUDGET_SECONDS
+
+
+def test_trending_window(db, async_engine):
+    result, elapsed, plans = _run(db, lambda adb: main.api_trending.__wrapped__(days=7, limit=20, db=adb),
+                                  async_engine)
+    assert len(result["movies"]) == 20
+    # Counted straight off the index, never touching table rows.
+    _assert_indexed(plans, covering=True)
+    assert elapsed < BUDGET_SECONDS
+
+
+@pytest.mark.parametrize("sort", ["popularity", "title", "year"])
+def test_deep_catalog_pages_are_range_scans(db, sort):
+    from src.core import pagination
+
+    q, cursor = db.query(models.Movie), None
+    for _ in range(26):                           # deep enough to cross into the NULL segment
+        rows = pagination.page(q, models.Movie, sort, limit=100, cursor=cursor)
+        cursor = pagination.next_cursor(models.Movie, sort, rows, 100)
+    bind, seen = db.get_bind(), []
+
+    def before(conn, cursor_, statement, parameters, context, executemany):
+        seen.append((statement, parameters))
+
+    event.listen(bind, "before_cursor_execute", before)
+    try:
+        start = time.perf_counter()
+        assert len(pagination.page(q, models.Movie, sort, limit=100, cursor=cursor)) == 100
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(bind, "before_cursor_execute", before)
+    with bind.connect() as conn:
+        for stmt, params in seen:
+            plan = [r[-1] for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + stmt, params)]
+            assert any(step.startswith("SEARCH movies USING INDEX ix_movies_") for step in plan), (stmt, plan)
+            assert not any("TEMP B-TREE" in step for step in plan), (stmt, plan)
+    assert elapsed < BUDGET_SECONDS
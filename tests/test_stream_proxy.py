@@ -0,0 +1,609 @@
+import asyncio
+
+import httpx
+
+from src.api.manifest import ProxyTokens, ManifestCache, rewrite_playlist
+from src.api.segment_cache import SegmentCache, PlaylistIndex, ReadAhead
+
+MEDIA_PLAYLIST = """#EXTM3U
+#EXT-X-TARGETDURATION:4
+#EXTINF:4.0,
+seg0.ts
+#EXTINF:4.0,
+seg1.ts
+#EXTINF:4.0,
+seg2.ts
+#EXTINF:2.5,
+https://cdn2.example.com/seg3.ts
+#EXT-X-ENDLIST
+"""
+
+
+def parse_media_playlist(text, base_url):
+    pl = rewrite_playlist(text, base_url, lambda u: u)
+    return pl.segments, pl.durations
+
+
+def test_rewrite_playlist_collects_segments():
+    segs, durs = parse_media_playlist(MEDIA_PLAYLIST, "https://cdn.example.com/v/index.m3u8")
+    assert segs[0] == "https://cdn.example.com/v/seg0.ts"
+    assert segs[3] == "https://cdn2.example.com/seg3.ts"
+    assert durs == [4.0, 4.0, 4.0, 2.5]
+
+
+def test_rewrite_playlist_skips_master_and_byterange_segments():
+    master = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000\nlow.m3u8\n"
+    assert parse_media_playlist(master, "https://a/b.m3u8") == ([], [])
+    assert rewrite_playlist(master, "https://a/b.m3u8", lambda u: u).cacheable
+    byterange = "#EXTM3U\n#EXTINF:4,\n#EXT-X-BYTERANGE:1000@0\nmain.mp4\n"
+    assert parse_media_playlist(byterange, "https://a/b.m3u8") == ([], [])
+
+
+def test_rewrite_playlist_replaces_uris_with_tokens():
+    tokens = ProxyTokens(secret=b"k")
+    text = ('#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x1\n'
+            '#EXTINF:4.0,\nseg0.ts\n#EXT-X-ENDLIST\n')
+    pl = rewrite_playlist(text, "https://cdn.example.com/v/index.m3u8",
+                          lambda u: f"/proxy_stream?t={tokens.issue(u, 'https://ref/')}")
+    lines = pl.body.splitlines()
+    assert lines[1].startswith('#EXT-X-KEY:METHOD=AES-128,URI="/proxy_stream?t=')
+    assert lines[1].endswith('",IV=0x1')
+    token = lines[3].split("t=", 1)[1]
+    assert len(token) == 16
+    assert tokens.resolve(token) == ("https://cdn.example.com/v/seg0.ts", "https://ref/", None)
+    assert pl.cacheable and pl.body.endswith("\n")
+
+
+def test_proxy_tokens_reject_unknown_and_tampered():
+    tokens = ProxyTokens(secret=b"k", max_entries=2)
+    a = tokens.issue("https://a/1.ts")
+    assert tokens.issue("https://a/1.ts") == a           # stable
+    assert tokens.resolve("A" * 16) is None
+    assert tokens.resolve(a[:-1]) is None
+    tokens.issue("https://a/2.ts")
+    tokens.issue("https://a/3.ts")                       # evicts a
+    assert tokens.resolve(a) is None
+    tokens.retain([(a, ("https://a/1.ts", None, None))])
+    assert tokens.resolve(a) == ("https://a/1.ts", None, None)
+
+
+def test_manifest_cache_expires():
+    cache = ManifestCache(ttl=0)
+    cache.put(("u", None, None), rewrite_playlist("#EXTM3U\n", "u", lambda u: u))
+    assert cache.get(("u", None, None)) is None
+
+
+def test_segment_cache_is_byte_bounded_lru():
+    cache = SegmentCache(max_bytes=10)
+    cache.put("a", b"1234", "video/mp2t")
+    cache.put("b", b"1234", "video/mp2t")
+    cache.get("a")                      # touch: b is now least recent
+    cache.put("c", b"1234", "video/mp2t")
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.size == 8
+
+
+def test_read_ahead_prefetches_following_segments():
+    segs, durs = parse_media_playlist(MEDIA_PLAYLIST, "https://cdn.example.com/v/index.m3u8")
+    index = PlaylistIndex()
+    index.register("https://cdn.example.com/v/index.m3u8", segs, durs, {"Referer": "https://x/"})
+    ra = ReadAhead(SegmentCache(), index, max_concurrency=2, min_depth=2, max_depth=4)
+    seen = []
+
+    def handler(request):
+        seen.append(str(request.url))
+        assert request.headers["referer"] == "https://x/"
+        return httpx.Response(200, content=b"x" * 100, headers={"content-type": "video/mp2t"})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            assert ra.on_request(client, segs[0]) is not None
+            assert await ra.lookup(segs[1]) == (b"x" * 100, "video/mp2t")
+            await asyncio.gather(*list(ra._inflight.values()))
+
+    asyncio.run(run())
+    assert sorted(seen) == sorted(segs[1:3])
+
+
+def test_read_ahead_depth_grows_on_slow_upstream():
+    segs, durs = parse_media_playlist(MEDIA_PLAYLIST, "https://cdn.example.com/v/index.m3u8")
+    index = PlaylistIndex()
+    pl = index.register("https://cdn.example.com/v/index.m3u8", segs, durs)
+    ra = ReadAhead(SegmentCache(), index, min_depth=2, max_depth=8)
+    assert ra.depth_for(pl, 0) == 2
+    ra.record(segs[0], 1_000_000, 0.1)      # 10 MB/s — fetch is far shorter than playback
+    assert ra.depth_for(pl, 0) == 2
+    ra = ReadAhead(SegmentCache(), index, min_depth=2, max_depth=8)
+    ra.record(segs[0], 1_000_000, 8.0)      # 8 s per 4 s segment
+    assert ra.depth_for(pl, 0) == 5
+
+
+def test_parse_range_forms():
+    from src.api.range_cache import parse_range
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=0-5000", 1000) == (0, 999)
+    assert parse_range(None, 1000) == (0, 999)
+    assert parse_range("bytes=1000-", 1000) is None
+    assert parse_range("bytes=0-1,5-9", 1000) is None
+
+
+def test_range_cache_fetches_only_gaps(tmp_path):
+    from src.api.range_cache import RangeCache
+    blob = bytes(range(256)) * 40          # 10240 bytes
+    asked = []
+
+    class _Body(httpx.AsyncByteStream):
+        def __init__(self, data):
+            self.data = data
+
+        async def __aiter__(self):
+            yield self.data
+
+    def handler(request):
+        rng = request.headers["range"]
+        asked.append(rng)
+        a, b = (int(x) for x in rng.split("=")[1].split("-"))
+        return httpx.Response(206, stream=_Body(blob[a:b + 1]),
+                              headers={"content-range": f"bytes {a}-{b}/{len(blob)}"})
+
+    cache = RangeCache(root=tmp_path, budget=1 << 20)
+    entry = asyncio.run(cache.create("https://cdn/v.mp4", len(blob), "video/mp4"))
+
+    async def read(start, end):
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return b"".join([c async for c in cache.stream(entry, start, end, client, {})])
+
+    assert asyncio.run(read(1000, 1999)) == blob[1000:2000]
+    assert asyncio.run(read(0, 2999)) == blob[0:3000]
+    assert asked == ["bytes=1000-1999", "bytes=0-999", "bytes=2000-2999"]
+    assert (entry.starts, entry.ends) == ([0], [3000])
+
+    # Sidecar survives a restart.
+    again = asyncio.run(RangeCache(root=tmp_path).get("https://cdn/v.mp4"))
+    assert again is not None and again.held == 3000
+
+
+def test_range_cache_evicts_lru_files(tmp_path):
+    from src.api.range_cache import RangeCache
+    cache = RangeCache(root=tmp_path, budget=150)
+
+    async def run():
+        a = await cache.create("https://cdn/a.mp4", 1000, "video/mp4")
+        a.add(0, 100)
+        b = await cache.create("https://cdn/b.mp4", 1000, "video/mp4")
+        b.add(0, 100)
+        await cache.evict()
+        assert await cache.get("https://cdn/a.mp4") is None
+        assert await cache.get("https://cdn/b.mp4") is b
+        return a
+
+    assert not cache.path(asyncio.run(run())).exists()
+
+
+def test_range_cache_swaps_in_a_new_file_when_the_size_changes(tmp_path):
+    from src.api.range_cache import RangeCache
+
+    blob = bytes(range(256)) * 40
+
+    def handler(request):
+        return httpx.Response(206, content=blob[:1000], headers={"content-range": f"bytes 0-999/{len(blob)}"})
+
+    cache = RangeCache(root=tmp_path)
+    old = asyncio.run(cache.create("https://cdn/v.mp4", len(blob), "video/mp4"))
+    with open(cache.path(old), "r+b") as f:
+        f.write(blob[:4000])
+    old.add(0, 4000)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            reader = cache.stream(old, 0, 3999, client, {})
+            got = [await reader.__anext__()]
+            # Upstream now reports another size while the old file is being read.
+            new = await cache.create("https://cdn/v.mp4", 5000, "video/mp4")
+            got += [c async for c in reader]
+            return b"".join(got), new
+
+    data, new = asyncio.run(run())
+    assert data == blob[:4000]
+    assert cache.path(new) != cache.path(old) and new.held == 0
+    assert asyncio.run(cache.get("https://cdn/v.mp4")) is new
+    # The old file went once its reader finished; the sidecar is the new entry's.
+    assert not cache.path(old).exists() and cache.path(new).exists()
+    again = asyncio.run(RangeCache(root=tmp_path).get("https://cdn/v.mp4"))
+    assert again.size == 5000 and again.file == new.file
+
+
+def test_range_cache_serves_held_span_from_disk(tmp_path):
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+    from src.api.range_cache import RangeCache
+
+    cache = RangeCache(root=tmp_path)
+    entry = asyncio.run(cache.create("https://cdn/v.mp4", 1000, "video/mp4"))
+    with open(cache.path(entry), "r+b") as f:
+        f.write(bytes(range(200)) * 2)
+    entry.add(0, 400)
+    assert cache.serve_held(entry, 300, 500) is None        # runs past the held extent
+
+    def endpoint(request):
+        return cache.serve_held(entry, 100, 299,
+                                headers={"Content-Range": "bytes 100-299/1000"})
+
+    client = TestClient(Starlette(routes=[Route("/", endpoint)]))
+    r = client.get("/")
+    assert r.status_code == 206
+    assert r.headers["content-length"] == "200"
+    assert r.content == (bytes(range(200)) * 2)[100:300]
+    assert entry.readers == 0
+
+
+def test_proxy_serves_cached_segment_ranges():
+    from fastapi.testclient import TestClient
+    from src.api import main
+
+    url = "https://cdn.example.com/solo/seg0.ts"
+    main._segment_index.register("https://cdn.example.com/solo/index.m3u8", [url], [4.0])
+    main._read_ahead.cache.put(url, b"0123456789", "video/mp2t")
+    client = TestClient(main.app)
+
+    r = client.get("/proxy_stream", params={"url": url}, headers={"Range": "bytes=2-5"})
+    assert r.status_code == 206
+    assert r.content == b"2345"
+    assert r.headers["content-range"] == "bytes 2-5/10"
+    r = client.get("/proxy_stream", params={"url": url})
+    assert r.status_code == 200 and r.content == b"0123456789"
+
+
+def test_fair_share_caps_clients_and_queues_fairly():
+    from src.api.fair_share import FairScheduler, OverLimit
+
+    async def run():
+        sched = FairScheduler(capacity=2, per_client=2, max_queue=1, queue_timeout=1)
+        a1 = await sched.acquire("a")
+        a2 = await sched.acquire("a")
+        sched.account("a", 1000)
+        b = asyncio.ensure_future(sched.acquire("b"))
+        a3 = asyncio.ensure_future(sched.acquire("a"))
+        await asyncio.sleep(0)
+        try:
+            await sched.acquire("a")              # a's queue is full
+            raise AssertionError("expected OverLimit")
+        except OverLimit:
+            pass
+        a1.release()
+        assert (await b).client_id == "b"       # b has pulled fewer bytes
+        assert not a3.done()
+        a2.release()
+        a2.release()                            # idempotent
+        assert (await a3).client_id == "a"
+        assert sched.stats()["active"] == 2
+
+    asyncio.run(run())
+
+
+def test_fair_share_rate_limit_and_timeout():
+    from src.api.fair_share import FairScheduler, OverLimit
+
+    async def run():
+        sched = FairScheduler(capacity=1, per_client=1, queue_timeout=0.01, rate=1000)
+        slot = await sched.acquire("a")
+        assert sched.account("a", 500) == 0.0
+        assert 0.4 < sched.account("a", 1000) <= 0.5
+        try:
+            await sched.acquire("b")
+            raise AssertionError("expected OverLimit")
+        except OverLimit:
+            pass
+        slot.release()
+        assert sched.stats()["active"] == 0
+
+    asyncio.run(run())
+
+
+def test_proxy_client_id_ignores_client_supplied_ids():
+    from starlette.requests import Request
+    from src.api import main
+
+    def request(guest):
+        return Request({"type": "http", "client": ("203.0.113.7", 5000),
+                        "headers": [(b"x-nautilus-guest", guest.encode())]})
+
+    assert main._proxy_client_id(request("a")) == main._proxy_client_id(request("b")) == "ip:203.0.113.7"
+
+
+def test_proxy_stats_needs_the_admin_token_and_hides_client_ids(monkeypatch):
+    from fastapi.testclient import TestClient
+    from src.api import main
+
+    async def hold():
+        return await main._fair_share.acquire("g:secret-guest")
+
+    slot = asyncio.run(hold())
+    try:
+        client = TestClient(main.app)
+        monkeypatch.delenv("ADMIN_TRIGGER_TOKEN", raising=False)
+        assert client.get("/admin/proxy_stats").status_code == 403
+        monkeypatch.setenv("ADMIN_TRIGGER_TOKEN", "t0ken")
+        assert client.get("/admin/proxy_stats", headers={"X-ADMIN-TOKEN": "nope"}).status_code == 403
+        r = client.get("/admin/proxy_stats", headers={"X-ADMIN-TOKEN": "t0ken"})
+        assert r.status_code == 200
+        assert r.json()["clients"]["clients"] >= 1 and "secret-guest" not in r.text
+    finally:
+        slot.release()
+
+
+def test_upstream_transport_counts_per_host():
+    from src.api.upstream import UpstreamTransport
+
+    transport = UpstreamTransport(httpx.Limits(max_connections=10), http2=False)
+
+    class _Inner(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            if request.url.host == "bad.example":
+                return httpx.Response(503, stream=httpx.ByteStream(b"no"))
+            return httpx.Response(200, stream=httpx.ByteStream(b"x" * 50))
+
+    transport._h1 = _Inner()
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            for _ in range(3):
+                assert (await client.get("https://cdn.example/seg.ts")).content == b"x" * 50
+            await client.get("https://bad.example/seg.ts")
+
+    asyncio.run(run())
+    hosts = transport.stats()["hosts"]
+    assert hosts["cdn.example"]["requests"] == 3
+    assert hosts["cdn.example"]["bytes"] == 150
+    assert hosts["cdn.example"]["active_requests"] == 0
+    assert hosts["cdn.example"]["errors"] == 0
+    assert hosts["bad.example"]["errors"] == 1 and hosts["bad.example"]["error_rate"] > 0
+
+
+def test_upstream_transport_splits_its_budget_and_counts_busy_connections():
+    from src.api.upstream import UpstreamTransport, split_limits
+
+    h1, h2 = split_limits(httpx.Limits(max_connections=200, max_keepalive_connections=50), 0.25)
+    assert h1.max_connections + h2.max_connections == 200
+    assert h1.max_keepalive_connections + h2.max_keepalive_connections == 50
+    assert h1.max_connections == 50
+
+    transport = UpstreamTransport(httpx.Limits(max_connections=10), http2=False)
+    shared, other = object(), object()
+
+    class _Inner(httpx.AsyncBaseTransport):
+        def __init__(self):
+            self.conns = iter([shared, shared, other])
+
+        async def handle_async_request(self, request):
+            return httpx.Response(200, stream=httpx.ByteStream(b"x"),
+                                  extensions={"network_stream": next(self.conns),
+                                              "http_version": b"HTTP/2"})
+
+    transport._h1 = _Inner()
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            resps = [await client.send(client.build_request("GET", "https://cdn.example/s.ts"),
+                                       stream=True) for _ in range(3)]
+            busy = transport.stats()["hosts"]["cdn.example"]
+            for r in resps:
+                await r.aclose()
+            return busy, transport.stats()["hosts"]["cdn.example"]
+
+    busy, idle = asyncio.run(run())
+    assert busy["busy_connections"] == 2 and busy["busy_http2_connections"] == 2
+    assert busy["streams_per_connection"] == 1.5
+    assert idle["busy_connections"] == 0 and idle["active_requests"] == 0
+
+
+class _Body(httpx.AsyncByteStream):
+    def __init__(self, data):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data
+
+
+def test_proxy_fails_over_to_sibling_rendition():
+    from fastapi.testclient import TestClient
+    from src.api import main
+
+    media = "#EXTM3U\n#EXTINF:4.0,\nseg0.ts\n#EXTINF:4.0,\nseg1.ts\n#EXT-X-ENDLIST\n"
+    master = ("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000\nlow/index.m3u8\n"
+              "#EXT-X-STREAM-INF:BANDWIDTH=2000000,CODECS=\"avc1,mp4a\"\nhigh/index.m3u8\n")
+    calls = []
+
+    def handler(request):
+        u = str(request.url)
+        calls.append(u)
+        if u.endswith("master.m3u8"):
+            return httpx.Response(200, stream=_Body(master.encode()))
+        if u.endswith(".m3u8"):
+            return httpx.Response(200, stream=_Body(media.encode()))
+        if "/high/" in u:
+            return httpx.Response(503, stream=_Body(b""))
+        return httpx.Response(200, stream=_Body(b"LOW"), headers={"content-type": "video/mp2t"})
+
+    main._PROXY_CLIENT = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        client = TestClient(main.app)
+        base = "https://fo.example/t"
+        assert client.get("/proxy_stream", params={"url": f"{base}/master.m3u8"}).status_code == 200
+        assert client.get("/proxy_stream", params={"url": f"{base}/high/index.m3u8"}).status_code == 200
+
+        r = client.get("/proxy_stream", params={"url": f"{base}/high/seg1.ts"})
+        assert r.status_code == 200 and r.content == b"LOW"
+        assert f"{base}/low/seg1.ts" in calls
+        assert main._host_health.degraded(f"{base}/high/seg1.ts")
+    finally:
+        main._PROXY_CLIENT = None
+
+
+def test_failover_requires_matching_timeline():
+    from src.api.failover import FailoverMap, HostHealth
+
+    index = PlaylistIndex()
+    pl = index.register("https://a.example/v.m3u8", ["https://a.example/0.ts", "https://a.example/1.ts"],
+                        [4.0, 4.0])
+    index.register("https://b.example/v.m3u8", ["https://b.example/0.ts"], [8.0])
+    index.register("https://c.example/v.m3u8", ["https://c.example/0.ts", "https://c.example/1.ts"],
+                   [4.0, 4.0], {"Referer": "https://c/"})
+    fo = FailoverMap(index, HostHealth())
+    fo.add_alternates("movie:1", [("https://a.example/v.m3u8", {}), ("https://b.example/v.m3u8", {}),
+                                  ("https://c.example/v.m3u8", {"Referer": "https://c/"})])
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return [x async for x in fo.equivalents(client, pl, 1)]
+
+    assert asyncio.run(run()) == [("https://c.example/1.ts", {"Referer": "https://c/"})]
+
+
+def test_playlist_attributes_and_decode_signature():
+    from src.api.manifest import attributes, rewrite_playlist
+
+    assert attributes('#EXT-X-STREAM-INF:BANDWIDTH=2000000,CODECS="avc1.64001f,mp4a.40.2",RESOLUTION=1280x720') \
+        == {"BANDWIDTH": "2000000", "CODECS": "avc1.64001f,mp4a.40.2", "RESOLUTION": "1280x720"}
+    master = rewrite_playlist('#EXTM3U\n#EXT-X-STREAM-INF:CODECS="avc1,mp4a",BANDWIDTH=900\nlo.m3u8\n',
+                              "https://a.example/m.m3u8", lambda u: u)
+    assert master.variants == [("https://a.example/lo.m3u8", 900)]
+    assert master.codecs == {"https://a.example/lo.m3u8": "avc1,mp4a"}
+
+    media = ('#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:7\n#EXT-X-MAP:URI="init.mp4"\n'
+             '#EXT-X-KEY:METHOD=AES-128,URI="k.bin",IV=0xAB\n#EXTINF:4,\n0.m4s\n'
+             '#EXT-X-KEY:METHOD=NONE\n#EXTINF:4,\n1.m4s\n')
+    assert rewrite_playlist(media, "https://a.example/v/i.m3u8", lambda u: u).decode == (
+        ("SEQ", 7), ("MAP", "https://a.example/v/init.mp4", ""),
+        ("KEY", ("AES-128", "https://a.example/v/k.bin", "0xab", "identity")), ("KEY", None))
+
+
+def test_failover_requires_matching_keys_init_and_codecs():
+    from src.api.failover import FailoverMap, HostHealth
+
+    key = (("KEY", ("AES-128", "https://a.example/k.bin", "", "identity")),)
+    other_key = (("KEY", ("AES-128", "https://b.example/k.bin", "", "identity")),)
+
+    def segs(host):
+        return [f"https://{host}/0.ts", f"https://{host}/1.ts"]
+
+    index = PlaylistIndex()
+    pl = index.register("https://a.example/v.m3u8", segs("a.example"), [4.0, 4.0], decode=key)
+    index.register("https://b.example/v.m3u8", segs("b.example"), [4.0, 4.0], decode=other_key)
+    index.register("https://c.example/v.m3u8", segs("c.example"), [4.0, 4.0])
+    index.register("https://d.example/v.m3u8", segs("d.example"), [4.0, 4.0], decode=key)
+    index.register("https://e.example/v.m3u8", segs("e.example"), [4.0, 4.0], decode=key)
+    fo = FailoverMap(index, HostHealth())
+    fo.add_master("https://m.example/master.m3u8",
+                  [("https://a.example/v.m3u8", 1000), ("https://d.example/v.m3u8", 900),
+                   ("https://e.example/v.m3u8", 1100)],
+                  {"https://a.example/v.m3u8": "avc1,mp4a", "https://d.example/v.m3u8": "hvc1,mp4a",
+                   "https://e.example/v.m3u8": "mp4a, avc1"})
+    fo.add_alternates("movie:1", [("https://b.example/v.m3u8", {}), ("https://c.example/v.m3u8", {})])
+    fo.add_alternates("movie:1", [("https://m.example/master.m3u8", {})])
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return [x[0] async for x in fo.equivalents(client, pl, 1)]
+
+    # b: another key; c: unencrypted; d: another codec. Only e can stand in.
+    assert asyncio.run(run()) == ["https://e.example/1.ts"]
+
+
+def test_srt_is_decoded_and_converted_to_vtt():
+    import gzip
+    from src.api.subtitle_cache import decode_subtitle, srt_to_vtt
+
+    srt = "1\r\n00:00:01,500 --> 00:00:03,000\r\nCafé crème\r\n\r\n"
+    text = decode_subtitle(gzip.compress(srt.encode("cp1252")))
+    assert "Café" in text
+    vtt = srt_to_vtt(text)
+    assert vtt.startswith("WEBVTT\n\n1\n00:00:01.500 --> 00:00:03.000\n")
+    assert srt_to_vtt("[Script Info]\nDialogue: 0,0:00:01.00,0:00:02.00,,,,,,,hi") is None
+
+
+def test_proxy_subtitle_caches_and_serves_304(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from src.api import main
+    from src.api.subtitle_cache import SubtitleCache
+
+    calls = []
+
+    def handler(request):
+        calls.append(str(request.url))
+        return httpx.Response(200, stream=_Body(b"1\n00:00:01,000 --> 00:00:02,000\nHi\n"))
+
+    monkeypatch.setattr(main, "_subtitle_cache", SubtitleCache(root=tmp_path))
+    main._PROXY_CLIENT = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        client = TestClient(main.app)
+        r = client.get("/proxy_subtitle", params={"url": "https://subs.example/a.srt"})
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("text/vtt")
+        assert r.text.startswith("WEBVTT")
+        etag = r.headers["etag"]
+
+        r = client.get("/proxy_subtitle", params={"url": "https://subs.example/a.srt"},
+                       headers={"If-None-Match": etag})
+        assert r.status_code == 304
+        r = client.get("/proxy_subtitle", params={"url": "https://subs.example/a.srt"})
+        assert r.status_code == 200 and r.headers["etag"] == etag
+        assert len(calls) == 1
+    finally:
+        main._PROXY_CLIENT = None
+
+
+def test_subtitle_cache_evicts_lru_and_keeps_its_index_across_restarts(tmp_path):
+    from src.api.subtitle_cache import SubtitleCache
+
+    cache = SubtitleCache(root=tmp_path, budget=25)
+    cache.store("https://subs.example/a", b"a" * 10, "vtt")
+    cache.store("https://subs.example/b", b"b" * 10, "vtt")
+    assert cache.read("https://subs.example/a")[2] == b"a" * 10    # a is now most recent
+    cache.store("https://subs.example/c", b"c" * 10, "vtt")         # over budget: b goes
+
+    assert cache.read("https://subs.example/b") is None
+    assert len(list(tmp_path.glob("*.vtt"))) == 2
+
+    reopened = SubtitleCache(root=tmp_path, budget=25)
+    assert reopened.read("https://subs.example/a")[2] == b"a" * 10
+    assert reopened.read("https://subs.example/c")[2] == b"c" * 10
+    assert reopened.read("https://subs.example/b") is None
+
+
+def test_subtitle_search_memoizes_and_shares_inflight(tmp_path):
+    from src.api.subtitle_search import ImdbMemo, SubtitleSearch
+    from src.core.tmdb import TMDBClient
+
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.host)
+        if request.url.host == "api.themoviedb.org":
+            return httpx.Response(200, json={"imdb_id": "tt0133093"})
+        assert request.url.path == "/search/episode-2/imdbid-0133093/season-1"
+        return httpx.Response(200, json=[
+            {"SubDownloadLink": "https://dl/a.gz", "ISO639": "en", "SubDownloadsCnt": "5"},
+            {"SubDownloadLink": "https://dl/b.gz", "ISO639": "fr", "SubDownloadsCnt": "50"},
+        ])
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    tmdb = TMDBClient("key", cache_path=None, transport=httpx.MockTransport(handler))
+    search = SubtitleSearch(lambda: client, tmdb, ImdbMemo(tmp_path / "ids.json"))
+
+    async def run():
+        search.prefetch("tv", 603, 1, 2)
+        first = await search.search("tv", 603, 1, 2)
+        again = await search.search("tv", 603, 1, 2)
+        assert not (tmp_path / "ids.json").exists()     # written in batches
+        await search.memo.flush()
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert [s["lang"] for s in first] == ["fr", "en"] and again == first
+    assert {s["format"] for s in first} == {"vtt"}      # served converted by /proxy_subtitle
+    assert calls == ["api.themoviedb.org", "rest.opensubtitles.org"]
+    assert asyncio.run(ImdbMemo(tmp_path / "ids.json").get("tv", 603)) == "tt0133093"
@@ -0,0 +1,199 @@
+import asyncio
+import threading
+import time
+
+import httpx
+
+from src.core.tmdb import TMDBClient, ttl_for
+
+
+def _client(handler, tmp_path, **kw):
+    return TMDBClient("key", cache_path=tmp_path / "tmdb.sqlite3",
+                      transport=httpx.MockTransport(handler), **kw)
+
+
+def test_ttl_table():
+    assert ttl_for("/search/multi") == 600
+    assert ttl_for("/movie/603/release_dates") == 86400
+    assert ttl_for("/tv/1399/recommendations") == 43200
+    assert ttl_for("/discover/movie") == 3600
+
+
+def test_cache_hit_and_persistence(tmp_path):
+    calls = []
+
+    def handler(request):
+        calls.append(dict(request.url.params))
+        return httpx.Response(200, json={"id": 603, "title": "The Matrix"})
+
+    tmdb = _client(handler, tmp_path)
+    assert tmdb.get_sync("/movie/603", {"language": "en-US"})["title"] == "The Matrix"
+    assert tmdb.get_sync("/movie/603", {"language": "en-US"})["id"] == 603
+    assert len(calls) == 1 and calls[0]["api_key"] == "key"
+
+    # A fresh client (new process) reads the same SQLite file.
+    again = _client(handler, tmp_path)
+    assert again.get_sync("/movie/603", {"language": "en-US"})["id"] == 603
+    assert len(calls) == 1
+
+
+def test_concurrent_requests_coalesce(tmp_path):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"results": [1, 2]})
+
+    tmdb = _client(handler, tmp_path)
+
+    async def run():
+        return await asyncio.gather(*(tmdb.get("/discover/movie", {"page": 1}) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert all(r == {"results": [1, 2]} for r in results)
+    assert calls == ["/3/discover/movie"]
+
+
+def test_expired_entry_revalidates_with_etag(tmp_path):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"id": 1}, headers={"ETag": '"v1"'})
+
+    tmdb = _client(handler, tmp_path)
+    assert tmdb.get_sync("/tv/1", ttl=0) == {"id": 1}
+    assert tmdb.get_sync("/tv/1", ttl=0) == {"id": 1}
+    assert seen == [None, '"v1"']
+
+
+def test_stale_served_when_tmdb_errors(tmp_path):
+    status = [200]
+
+    def handler(request):
+        return httpx.Response(status[0], json={"id": 7})
+
+    tmdb = _client(handler, tmp_path)
+    assert tmdb.get_sync("/movie/7", ttl=0) == {"id": 7}
+    status[0] = 503
+    assert tmdb.get_sync("/movie/7") == {"id": 7}
+    status[0] = 404
+    assert tmdb.get_sync("/movie/8") is None
+
+
+def test_no_key_means_no_requests(tmp_path, monkeypatch):
+    monkeypatch.delenv("TMDB_API_KEY", raising=False)
+    tmdb = TMDBClient(cache_path=None, transport=httpx.MockTransport(lambda r: 1 / 0))
+    assert not tmdb
+    assert tmdb.get_sync("/movie/1") is None
+
+
+def test_rate_limit_spaces_requests(tmp_path):
+    tmdb = _client(lambda r: httpx.Response(200, json={}), tmp_path, rate=20)
+    start = time.monotonic()
+    tmdb.get_many_sync((f"/movie/{i}", None) for i in range(30))
+    # 20-token burst, then 10 more at 20/s.
+    assert time.monotonic() - start >= 0.4
+
+
+def test_tv_seasons_batches_append_to_response(tmp_path):
+    calls = []
+
+    def handler(request):
+        appended = request.url.params["append_to_response"].split(",")
+        calls.append(appended)
+        body = {"id": 1, "seasons": [{"season_number": n} for n in range(0, 25)]}
+        for item in appended:
+            n = int(item.split("/")[1])
+            if n < 25:
+                body[item] = {"season_number": n, "episodes": [{"episode_number": 1}]}
+        return httpx.Response(200, json=body)
+
+    tmdb = _client(handler, tmp_path)
+    details, seasons = tmdb.tv_seasons_sync(1)
+    assert sorted(seasons) == list(range(25))
+    assert len(calls) == 2 and len(calls[0]) == 20 and calls[1] == [f"season/{n}" for n in range(20, 25)]
+    # Reopening the show is served from the cache.
+    tmdb.tv_seasons_sync(1)
+    assert len(calls) == 2
+
+
+def test_discover_pages_concurrently_and_prefetches(tmp_path):
+    from src.api.discover import Discover
+
+    pages, active, peak = [], [0], [0]
+
+    async def handler(request):
+        page = int(request.url.params["page"])
+        pages.append(page)
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.02)
+        active[0] -= 1
+        results = [{"id": page * 100 + i, "title": f"{page}-{i}", "poster_path": "/p.jpg" if i % 10 else None}
+                   for i in range(20)]
+        return httpx.Response(200, json={"page": page, "total_pages": 30, "results": results})
+
+    discover = Discover(_client(handler, tmp_path), max_pages=12, concurrency=4)
+    params = discover.params("movie", genre=28, year=1999, sort="rating")
+    assert params["sort_by"] == "vote_average.desc" and params["primary_release_year"] == 1999
+
+    out = discover.items("movie", params, skip=40, limit=20)
+    assert [c["tmdb_id"] for c in out][:2] == [305, 306]   # 18 posters/page
+    assert len(out) == 20 and out[0]["media_type"] == "movie"
+    assert sorted(pages[:4]) == [1, 2, 3, 4] and peak[0] > 1
+
+    # The next block is already on its way.
+    deadline = time.monotonic() + 2
+    while len(pages) < 8 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(pages[4:]) == [5, 6, 7, 8]
+
+
+def test_cache_purges_expired_and_caps_rows(tmp_path, monkeypatch):
+    import src.core.tmdb as tmdb_module
+    from src.core.tmdb import ResponseCache
+
+    monkeypatch.setattr(tmdb_module, "_PURGE_EVERY", 10)
+    cache = ResponseCache(tmp_path / "c.sqlite3", max_rows=25, keep_stale=60)
+    now = time.time()
+    cache.put("gone", b"{}", None, now - 3600)       # expired past the stale window
+    for i in range(38):
+        cache.put(f"k{i}", b"{}", None, now + 600)
+    cache.put("stale", b"{}", None, now - 30)        # expired, still revalidatable
+
+    def keys():
+        return {k for (k,) in cache._db.execute("SELECT key FROM responses")}
+
+    # Purged at the 40th write: the long-expired row, then the oldest writes.
+    assert len(keys()) == 25
+    assert "gone" not in keys() and "k13" not in keys() and {"k14", "stale"} <= keys()
+
+    # Opening the file purges too.
+    before = keys()
+    assert "stale" in before
+    reopened = ResponseCache(tmp_path / "c.sqlite3", max_rows=25, keep_stale=0)
+    reopened.get("k37")
+    assert {k for (k,) in reopened._db.execute("SELECT key FROM responses")} == before - {"stale"}
+
+
+def test_async_get_reads_disk_off_the_callers_loop(tmp_path):
+    tmdb = _client(lambda r: httpx.Response(200, json={"id": 1}), tmp_path)
+    assert tmdb.get_sync("/movie/1") == {"id": 1}
+    cold = _client(lambda r: 1 / 0, tmp_path)        # same file, empty memory front
+    threads = []
+    real_get = cold.cache.get
+
+    def spy(key):
+        threads.append(threading.current_thread().name)
+        return real_get(key)
+
+    cold.cache.get = spy
+    assert asyncio.run(cold.get("/movie/1")) == {"id": 1}
+    assert threads and set(threads) == {"tmdb-client"}
+    # Now in the memory front: answered on the caller's loop, no disk read.
+    assert asyncio.run(cold.get("/movie/1")) == {"id": 1}
+    assert len(threads) == 1